@@ -1,6 +1,32 @@
+from pathlib import Path
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class BlogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'blog'
+
+    def ready(self):
+        from . import metrics, signals
+
+        signals.connect()
+        post_migrate.connect(signals.create_search_index, sender=self)
+        connection_created.connect(metrics.install_execute_wrapper, dispatch_uid='blog_metrics_execute_wrapper')
+
+        if getattr(settings, 'BLOG_WARM_TEMPLATES', True):
+            self.warm_templates()
+
+    def warm_templates(self):
+        """
+        Compile the app's templates into the cached template loader now, rather
+        than on the first request to each view of every worker.
+        """
+        from django.template.loader import get_template
+
+        templates = Path(self.path) / 'templates'
+        for path in sorted(templates.rglob('*.html')):
+            get_template(path.relative_to(templates).as_posix())
@@ -0,0 +1,222 @@
+"""
+Async variants of the blog API and list views for the ASGI entry point.
+
+DRF views are synchronous, so these are plain Django async views that reuse
+the serializers, filters and pagination of ``blog.views`` and reach the
+database through the async ORM (``aget``, ``aiterator``, ``adelete``...).
+"""
+import json
+import math
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.db.models import Sum
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.template.response import TemplateResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+
+from . import cache, metrics, singleflight
+from .models import Blog
+from .pagination import BlogCursorPagination, CountedPaginator, stream_blogs, wants_stream
+from .renderers import dumps
+from .serializers import BlogFilterSerializer, blog_rows, serialize_rows
+from .throttling import TokenBucketThrottle
+from .utils import version_etag
+from .views import EDIT_CONFLICT_MESSAGE, BlogListView, coalesce_key, edit_blog, filter_blog_list, is_stale, month_groups
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def api_view(view):
+    """
+    Apply the ``BLOG_RATE_LIMITS`` of DRF views to ``view`` and turn DRF
+    exceptions it raises into JSON error responses.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            throttle = TokenBucketThrottle()
+            if not await throttle.aallow_request(request, lambda: authenticate(request)):
+                raise Throttled(throttle.wait())
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response = json_response(detail, status=exc.status_code)
+            if getattr(exc, 'wait', None) is not None:
+                response['Retry-After'] = str(math.ceil(exc.wait))
+            return response
+        except Http404:
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    return csrf_exempt(wrapper)
+
+
+def authenticate(request):
+    """The user of the request's JWT, or None."""
+    # Stateless, the user comes from the token claims without a query.
+    result = JWTStatelessUserAuthentication().authenticate(request)
+    return result[0] if result else None
+
+
+async def get_blog_or_404(pk):
+    try:
+        return await Blog.objects.select_related('author').aget(pk=pk)
+    except Blog.DoesNotExist:
+        raise Http404
+
+
+list_calls = singleflight.AsyncGroup()
+
+
+def conditional(request, etag, response=None):
+    """
+    What ``@condition`` does, for ETags that need the async ORM: the 304 or
+    412 for the request's conditional headers, or else ``response``.
+    """
+    response = get_conditional_response(request, etag=etag) or response
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def routed_blog_list(filters):
+    """
+    ``filter_blog_list`` and the database the blogs are read from. Routing
+    may check a replica's health with a query, keep it off the event loop.
+    """
+    blogs, ordering = filter_blog_list(filters)
+    return blogs, ordering, blogs.db
+
+
+@api_view
+@require_http_methods(['GET'])
+async def blog_list_api(request):
+    query = Request(request)
+    filter_serializer = BlogFilterSerializer(data=query.query_params)
+    filter_serializer.is_valid(raise_exception=True)
+    view = filter_serializer.validated_data['view']
+    blogs, ordering, using = await sync_to_async(routed_blog_list)(filter_serializer.validated_data)
+
+    etag = await cache.alist_etag(request, blogs, 'api', 'json')
+    if response := conditional(request, etag):
+        return response
+
+    mode = wants_stream(query)
+    if mode:
+        return conditional(request, etag, stream_blogs(blogs, mode, ordering, asynchronous=True, view=view))
+
+    paginator = BlogCursorPagination(ordering)
+
+    async def load_page():
+        rows = blog_rows(blogs, *(field.lstrip('-') for field in ordering), view=view)
+        page = await paginator.apaginate_queryset(rows, query)
+        with metrics.timer('serializer'):
+            return serialize_rows(page, view), paginator.get_next_cursor()
+
+    key = coalesce_key(query, filter_serializer.validated_data, paginator, using)
+    results, cursor = await load_page() if key is None else await list_calls.do(key, load_page)
+    return conditional(request, etag, json_response({'next': paginator.cursor_link(query, cursor), 'results': results}))
+
+
+@api_view
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+async def blog_detail_api(request, pk):
+    # Conditional requests are handled here rather than with @condition, the
+    # ETag needs the blog's version and the decorator can only call sync code.
+    if request.method == 'GET':
+        async def serialize():
+            queryset = blog_rows(Blog.objects.filter(pk=pk))[:1]
+            rows = [row async for row in queryset]
+            if not rows:
+                raise Http404
+            with metrics.timer('serializer'):
+                return serialize_rows(rows)[0]
+
+        data = await cache.aget_or_set(pk, 'api', serialize)
+        cache_version = await cache.aget_version(pk)
+        etag = version_etag(pk, data['version'], cache_version, 'api', 'json')
+        last_modified = int(cache_version / 1e9)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = json_response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    user = authenticate(request)
+    blog = await get_blog_or_404(pk)
+    if user is None or user.pk != blog.author_id:
+        action = 'edit' if request.method == 'PUT' else 'delete'
+        return json_response(
+            {"message": f"You do not have permission to {action} this blog."}, status=status.HTTP_403_FORBIDDEN,
+        )
+
+    if request.method == 'DELETE':
+        if is_stale(blog, request.headers.get('If-Match')):
+            return json_response({"message": EDIT_CONFLICT_MESSAGE}, status=status.HTTP_412_PRECONDITION_FAILED)
+        await blog.adelete()
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return json_response({"message": "Invalid JSON body."}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(data, dict):
+        return json_response({"message": "Expected a JSON object."}, status=status.HTTP_400_BAD_REQUEST)
+
+    body, response_status = await sync_to_async(edit_blog)(blog, data, request.headers.get('If-Match'))
+    response = json_response(body, status=response_status)
+    if response_status == status.HTTP_200_OK:
+        response['ETag'] = version_etag(pk, blog.version, await cache.aget_version(pk), 'api', 'json')
+    return response
+
+
+@require_http_methods(['GET'])
+async def blog_list(request):
+    """``BlogListView`` with every query made through the async ORM."""
+    # The template shows the user, load it here rather than lazily while rendering.
+    request.user = await request.auser()
+    etag = await cache.alist_etag(request, Blog.objects.all(), 'html', request.user.pk or 0, request.user.get_username())
+    if response := conditional(request, etag):
+        return response
+
+    view = BlogListView()
+    view.setup(request)
+    queryset = view.get_queryset()
+
+    counts = view.get_count_queryset()
+    if counts is None:
+        count = await queryset.acount()
+    else:
+        count = (await counts.aaggregate(total=Sum('count')))['total'] or 0
+
+    paginator = CountedPaginator(queryset, view.get_paginate_by(queryset), count=count)
+    try:
+        page = paginator.page(request.GET.get('page') or 1)
+    except InvalidPage:
+        raise Http404
+    page.object_list = [blog async for blog in page.object_list]
+
+    context = {
+        'blogs': page.object_list,
+        'object_list': page.object_list,
+        'page_obj': page,
+        'paginator': paginator,
+        'is_paginated': page.has_other_pages(),
+    }
+    for name, facets in view.get_facets().items():
+        context[name] = [facet async for facet in facets]
+    versions = await cache.aget_versions([blog.pk for blog in page.object_list])
+    context['blog_groups'] = month_groups(page.object_list, versions)
+    context['fragment_timeout'] = cache.get_timeout()
+
+    return conditional(request, etag, TemplateResponse(request, view.template_name, context))
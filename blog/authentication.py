@@ -0,0 +1,156 @@
+"""
+Stateless JWT authentication for the API.
+
+Access tokens carry the user's id, username and names, and
+``JWTStatelessUserAuthentication`` turns them into a ``BlogTokenUser``
+without loading the ``User`` row. Deactivating a user therefore takes effect
+when their access token expires.
+
+Refresh tokens still go through simplejwt's blacklist, but checking it reads
+an in-process Bloom filter of the blacklisted token ids, rebuilt from the
+database every ``BLOG_JWT_BLACKLIST_SYNC_SECONDS``, and the cache for tokens
+blacklisted since. Only possible hits are confirmed against the database.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+from . import cache
+
+# Claims copied from the user into every token, and from refresh into access tokens.
+USER_CLAIMS = ('username', 'first_name', 'last_name')
+
+
+class BlogTokenUser(TokenUser):
+    """The user of a validated token, built from its claims alone."""
+
+    @cached_property
+    def first_name(self):
+        return self.token.get('first_name', '')
+
+    @cached_property
+    def last_name(self):
+        return self.token.get('last_name', '')
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+    @cached_property
+    def user(self):
+        """The full ``User``, for the rare code that needs more than the claims."""
+        return User.objects.get(pk=self.pk)
+
+    def __eq__(self, other):
+        # Compare equal to the User row too, so `request.user != blog.author` keeps working.
+        if isinstance(other, (TokenUser, User)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1024)
+        # Optimal sizing for `capacity` items at `error_rate` false positives.
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+        # Double hashing: k positions from two independent hashes.
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class Blacklist:
+    """Blacklisted refresh token ids of unexpired tokens, see the module docstring."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.synced_at = None
+
+    def cache_key(self, jti):
+        return f'blog:jwt-blacklist:{jti}'
+
+    def sync(self):
+        tokens = BlacklistedToken.objects.filter(token__expires_at__gt=aware_utcnow())
+        bloom = BloomFilter(tokens.count() * 2)
+        for jti in tokens.values_list('token__jti', flat=True).iterator(chunk_size=10_000):
+            bloom.add(jti)
+        self.filter, self.synced_at = bloom, time.monotonic()
+
+    def is_stale(self):
+        interval = getattr(settings, 'BLOG_JWT_BLACKLIST_SYNC_SECONDS', 60)
+        return self.synced_at is None or time.monotonic() - self.synced_at > interval
+
+    def __contains__(self, jti):
+        if self.is_stale():
+            with self.lock:
+                if self.is_stale():
+                    self.sync()
+        if jti in self.filter:
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+        # Blacklisted by another process since the last sync.
+        return bool(cache.get_cache().get(self.cache_key(jti)))
+
+    def add(self, jti, expires):
+        if self.filter is not None:
+            self.filter.add(jti)
+        timeout = max(1, int(expires - time.time()))
+        cache.get_cache().set(self.cache_key(jti), True, timeout)
+
+    def reset(self):
+        self.filter = self.synced_at = None
+
+
+blacklist = Blacklist()
+
+
+class BlogRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in blacklist:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist.add(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
+
+
+class BlogTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = BlogRefreshToken
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
+
+
+class BlogTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = BlogRefreshToken
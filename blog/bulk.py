@@ -0,0 +1,239 @@
+"""
+Bulk import and export of blogs as NDJSON or CSV.
+
+Records look like the API representation, with tag names and the author's
+username::
+
+    {"title": "...", "context": "...", "tags": ["python"], "author": "alice", "published_date": "2024-01-31T12:00:00Z"}
+
+In CSV the columns have the same names and tags are separated by ``|``.
+Imports read their input lazily and write each batch of blogs and tag links
+with ``bulk_create`` in its own transaction.
+"""
+import csv
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import facets, feeds, tasks
+from .models import Blog, Tag, make_excerpt
+from .utils import write_transaction
+
+FORMATS = ('ndjson', 'csv')
+CSV_COLUMNS = ['id', 'title', 'context', 'tags', 'author', 'published_date']
+TAG_SEPARATOR = '|'
+MAX_ERRORS = 100
+
+TITLE_LENGTH = Blog._meta.get_field('title').max_length
+TAG_LENGTH = Tag._meta.get_field('name').max_length
+
+
+class RecordError(ValueError):
+    pass
+
+
+def format_for(path, default='ndjson'):
+    for name in FORMATS:
+        if str(path).endswith('.' + name):
+            return name
+    if str(path).endswith('.jsonl'):
+        return 'ndjson'
+    return default
+
+
+def read_records(lines, format):
+    """Yield ``(line number, record)`` from an iterable of text lines."""
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), start=2):
+            row['tags'] = [name for name in (row.get('tags') or '').split(TAG_SEPARATOR) if name]
+            yield number, row
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, RecordError(f"Invalid JSON: {exc}")
+
+
+def clean(record):
+    """Validated ``(title, context, tag names, username, published_date)`` of a record."""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise RecordError("Expected an object.")
+
+    title = record.get('title') or ''
+    context = record.get('context') or ''
+    if not isinstance(title, str) or not isinstance(context, str):
+        raise RecordError("title and context must be strings.")
+    if not title or not context:
+        raise RecordError("title and context are required.")
+    if len(title) > TITLE_LENGTH:
+        raise RecordError(f"title is longer than {TITLE_LENGTH} characters.")
+
+    tags = record.get('tags') or []
+    if not isinstance(tags, list) or not all(isinstance(name, str) for name in tags):
+        raise RecordError("tags must be a list of names.")
+    tags = list(dict.fromkeys(name.strip() for name in tags if name.strip()))
+    if any(len(name) > TAG_LENGTH for name in tags):
+        raise RecordError(f"tag names are limited to {TAG_LENGTH} characters.")
+
+    author = record.get('author') or None
+    if author is not None and not isinstance(author, str):
+        raise RecordError("author must be a username.")
+
+    published_date = record.get('published_date') or None
+    if published_date is not None:
+        try:
+            published_date = parse_datetime(published_date) if isinstance(published_date, str) else None
+        except ValueError:
+            # Well formed but out of range, like February 31st
+            published_date = None
+        if published_date is None:
+            raise RecordError("published_date is not an ISO 8601 datetime.")
+        if timezone.is_naive(published_date):
+            published_date = timezone.make_aware(published_date)
+
+    return title, context, tags, author, published_date
+
+
+class Importer:
+    """
+    Imports records in batches, resolving tag names and usernames through
+    in-memory maps so each name is looked up at most once per import.
+    """
+
+    def __init__(self, author=None, batch_size=1000, update_derived=True, using='default'):
+        self.author = author
+        self.batch_size = batch_size
+        self.update_derived = update_derived
+        self.using = using
+        self.tag_ids = {}
+        self.author_ids = {}
+        self.created = 0
+        self.errors = []
+
+    def run(self, records):
+        batch = []
+        for number, record in records:
+            try:
+                batch.append(clean(record) + (number,))
+            except RecordError as exc:
+                self.error(number, str(exc))
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        return self
+
+    def error(self, number, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': number, 'error': message})
+
+    def resolve_tags(self, names):
+        missing = [name for name in names if name not in self.tag_ids]
+        if missing:
+            tags = Tag.objects.using(self.using)
+            tags.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+            self.tag_ids.update(tags.filter(name__in=missing).values_list('name', 'id'))
+
+    def resolve_authors(self, usernames):
+        missing = [name for name in usernames if name not in self.author_ids]
+        if missing:
+            self.author_ids.update(
+                User.objects.using(self.using).filter(username__in=missing).values_list('username', 'id')
+            )
+
+    def write(self, batch):
+        # Reads the tags and authors it is about to create.
+        with write_transaction(self.using):
+            self.resolve_tags({name for _, _, tags, _, _, _ in batch for name in tags})
+            if self.author is None:
+                self.resolve_authors({username for _, _, _, username, _, _ in batch if username})
+
+            blogs, blog_tags, dated = [], [], []
+            for title, context, tags, username, published_date, number in batch:
+                author_id = self.author.pk if self.author is not None else self.author_ids.get(username)
+                if author_id is None:
+                    self.error(number, f"Unknown author {username!r}." if username else "author is required.")
+                    continue
+                # bulk_create sends no m2m_changed, fill in the tag lists here.
+                blog = Blog(
+                    title=title, context=context, excerpt=make_excerpt(context), author_id=author_id,
+                    tag_ids=sorted(self.tag_ids[name] for name in tags), tag_names=sorted(tags),
+                )
+                blogs.append(blog)
+                blog_tags.append(tags)
+                if published_date is not None:
+                    dated.append((blog, published_date))
+
+            Blog.objects.using(self.using).bulk_create(blogs, batch_size=self.batch_size)
+            # auto_now_add overwrote published_date on insert, put the imported dates back.
+            for blog, published_date in dated:
+                blog.published_date = published_date
+            if dated:
+                Blog.objects.using(self.using).bulk_update(
+                    [blog for blog, _ in dated], ['published_date'], batch_size=self.batch_size,
+                )
+
+            Through = Blog.tags.through
+            links = [(blog.pk, self.tag_ids[name]) for blog, tags in zip(blogs, blog_tags) for name in tags]
+            Through.objects.using(self.using).bulk_create(
+                [Through(blog_id=blog_id, tag_id=tag_id) for blog_id, tag_id in links], batch_size=self.batch_size,
+            )
+
+            if self.update_derived:
+                # bulk_create sends no signals, keep the counts and the search index in step here.
+                facets.blogs_added(blogs, self.using)
+                facets.tags_changed(links, 1, self.using, {blog.pk: blog.author_id for blog in blogs})
+                tasks.enqueue_on_commit('search.sync', [blog.pk for blog in blogs], using=self.using)
+                feeds.build_on_commit(
+                    {feeds.SITE_FEED, *(feeds.author_feed(blog.author_id) for blog in blogs),
+                     *(feeds.tag_feed(tag_id) for _, tag_id in links), *feeds.sitemaps_of(blog.pk for blog in blogs)},
+                    using=self.using,
+                )
+
+        self.created += len(blogs)
+
+
+def import_blogs(lines, format='ndjson', **kwargs):
+    return Importer(**kwargs).run(read_records(lines, format))
+
+
+def export_blogs(queryset, format='ndjson', chunk_size=2000):
+    """Yield the blogs of ``queryset`` as lines of NDJSON or CSV."""
+    blogs = queryset.with_related().order_by('id').iterator(chunk_size=chunk_size)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if format == 'csv':
+        writer.writerow(CSV_COLUMNS)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    for blog in blogs:
+        tags = blog.tag_names
+        if format == 'csv':
+            writer.writerow([
+                blog.pk, blog.title, blog.context, TAG_SEPARATOR.join(tags),
+                blog.author.username, blog.published_date.isoformat(),
+            ])
+        else:
+            buffer.write(json.dumps({
+                'id': blog.pk,
+                'title': blog.title,
+                'context': blog.context,
+                'tags': tags,
+                'author': blog.author.username,
+                'published_date': blog.published_date.isoformat(),
+            }, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,148 @@
+"""
+Versioned cache of serialized blogs, rendered blog pages and list fragments.
+
+Every blog has a version number in the cache, the time in nanoseconds it was
+last invalidated. Cached payloads are keyed on that version, so invalidating
+a blog is a single ``set`` of its version key and stale entries simply expire.
+The version doubles as the blog's ``Last-Modified`` date and is part of its ``ETag``.
+
+List ``ETag``s are built from a fingerprint of the listed blogs read from
+the database rather than from the cache, which each process may keep apart:
+their number, highest id, newest date and the sum of their ``Blog.version``.
+Creating or deleting a blog changes the first two and editing it, or
+renaming its tags or author, bumps its version.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+
+def get_cache():
+    return caches[getattr(settings, 'BLOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'BLOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def version_key(pk):
+    return f'blog:{pk}:version'
+
+
+def get_version(pk):
+    return get_key_version(version_key(pk))
+
+
+def get_key_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Starting from the current time rather than 1 keeps versions unique
+        # when the version key itself was evicted.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, time.time_ns())
+    return version
+
+
+async def aget_version(pk):
+    cache = get_cache()
+    version = await cache.aget(version_key(pk))
+    if version is None:
+        await cache.aadd(version_key(pk), time.time_ns(), None)
+        version = await cache.aget(version_key(pk), time.time_ns())
+    return version
+
+
+def get_versions(pks):
+    """``get_version`` of many blogs in one round trip to the cache."""
+    cache = get_cache()
+    keys = {version_key(pk): pk for pk in pks}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: versions.get(key) or time.time_ns() for key in keys}
+
+
+async def aget_versions(pks):
+    cache = get_cache()
+    keys = {version_key(pk): pk for pk in pks}
+    versions = await cache.aget_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            await cache.aadd(key, time.time_ns(), None)
+        versions.update(await cache.aget_many(missing))
+    return {keys[key]: versions.get(key) or time.time_ns() for key in keys}
+
+
+def invalidate(blog_ids):
+    get_cache().set_many({version_key(pk): time.time_ns() for pk in blog_ids}, None)
+
+
+def invalidate_on_commit(blog_ids, using='default'):
+    # Bumping before the commit would let a concurrent reader cache the old
+    # row under the new version.
+    blog_ids = list(blog_ids)
+    transaction.on_commit(lambda: invalidate(blog_ids), using=using)
+
+
+def get_or_set(pk, kind, default, *variant):
+    """
+    Cached value of ``kind`` for blog ``pk``, computed with ``default()`` on a
+    miss. ``variant`` adds parts to the key for values that differ per request.
+    """
+    cache = get_cache()
+    key = ':'.join(['blog', str(pk), str(get_version(pk)), kind, *map(str, variant)])
+    value = cache.get(key)
+    if value is None:
+        value = default()
+        cache.set(key, value, get_timeout())
+    return value
+
+
+async def aget_or_set(pk, kind, default, *variant):
+    """``get_or_set`` for async views, ``default`` is a coroutine function."""
+    cache = get_cache()
+    key = ':'.join(['blog', str(pk), str(await aget_version(pk)), kind, *map(str, variant)])
+    value = await cache.aget(key)
+    if value is None:
+        value = await default()
+        await cache.aset(key, value, get_timeout())
+    return value
+
+
+def etag(pk, *variant):
+    return '"{}"'.format('-'.join(['blog', str(pk), str(get_version(pk)), *map(str, variant)]))
+
+
+FINGERPRINT = {'count': Count('id'), 'last_id': Max('id'), 'latest': Max('published_date'), 'versions': Sum('version')}
+
+
+def list_etag(request, blogs, *variant):
+    """
+    Weak ``ETag`` of the list of ``blogs`` at the request's URL, query string
+    included, and ``variant``. It costs one aggregate query over ``blogs``.
+    """
+    return make_list_etag(request, blogs.order_by().aggregate(**FINGERPRINT), variant)
+
+
+async def alist_etag(request, blogs, *variant):
+    return make_list_etag(request, await blogs.order_by().aaggregate(**FINGERPRINT), variant)
+
+
+def make_list_etag(request, fingerprint, variant):
+    parts = [request.get_full_path(), *map(str, variant), *(str(fingerprint[name]) for name in FINGERPRINT)]
+    digest = hashlib.md5('\n'.join(parts).encode()).hexdigest()
+    return f'W/"blogs-{digest}"'
+
+
+def last_modified(pk):
+    return datetime.fromtimestamp(get_version(pk) / 1e9, tz=timezone.utc)
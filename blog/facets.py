@@ -0,0 +1,147 @@
+"""
+Incremental maintenance of the month archive and the tag/author counts.
+
+Counters are changed with ``UPDATE ... SET count = count + n`` inside the
+transaction of the blog write, and rows that drop to zero are removed so the
+list page only offers months, tags and authors that have posts.
+
+Each author also has their posts counted per month and per tag, and the date
+of their newest post on ``AuthorFacet``, for their own list of blogs.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import AuthorFacet, AuthorMonthFacet, AuthorTagFacet, Blog, MonthArchive, TagFacet
+from .utils import write_transaction
+
+
+def month_of(published_date):
+    return timezone.localtime(published_date).date().replace(day=1)
+
+
+def bump(model, using, delta, **lookup):
+    rows = model.objects.using(using).filter(**lookup)
+    if rows.update(count=F('count') + delta):
+        if delta < 0:
+            rows.filter(count__lte=0).delete()
+        return
+    if delta > 0:
+        try:
+            with transaction.atomic(using=using):
+                model.objects.using(using).create(count=delta, **lookup)
+        except IntegrityError:
+            # Created concurrently, add to that row instead.
+            rows.update(count=F('count') + delta)
+
+
+def refresh_latest(author_ids, using):
+    """Set ``AuthorFacet.latest_published`` from the newest blog of each author."""
+    newest = (
+        Blog.objects.using(using).filter(author_id=OuterRef('author_id'))
+        .order_by('-published_date').values('published_date')[:1]
+    )
+    AuthorFacet.objects.using(using).filter(author_id__in=author_ids).update(latest_published=Subquery(newest))
+
+
+def blog_added(blog, using, delta=1):
+    month = month_of(blog.published_date)
+    bump(MonthArchive, using, delta, month=month)
+    bump(AuthorFacet, using, delta, author_id=blog.author_id)
+    bump(AuthorMonthFacet, using, delta, author_id=blog.author_id, month=month)
+    refresh_latest([blog.author_id], using)
+
+
+def blogs_added(blogs, using):
+    """Count blogs inserted with ``bulk_create``, which sends no signals."""
+    for month, count in Counter(month_of(blog.published_date) for blog in blogs).items():
+        bump(MonthArchive, using, count, month=month)
+    for author_id, count in Counter(blog.author_id for blog in blogs).items():
+        bump(AuthorFacet, using, count, author_id=author_id)
+    for (author_id, month), count in Counter((blog.author_id, month_of(blog.published_date)) for blog in blogs).items():
+        bump(AuthorMonthFacet, using, count, author_id=author_id, month=month)
+    refresh_latest({blog.author_id for blog in blogs}, using)
+
+
+def blog_removed(blog, tag_ids, using):
+    blog_added(blog, using, delta=-1)
+    tags_changed([(blog.pk, tag_id) for tag_id in tag_ids], -1, using, {blog.pk: blog.author_id})
+
+
+def author_changed(blog, old_author_id, using):
+    """Move the counts of ``blog``, with its tags, from ``old_author_id`` to its author."""
+    month = month_of(blog.published_date)
+    tag_ids = list(Blog.tags.through.objects.using(using).filter(blog_id=blog.pk).values_list('tag_id', flat=True))
+    for author_id, delta in ((old_author_id, -1), (blog.author_id, 1)):
+        bump(AuthorFacet, using, delta, author_id=author_id)
+        bump(AuthorMonthFacet, using, delta, author_id=author_id, month=month)
+        for tag_id in tag_ids:
+            bump(AuthorTagFacet, using, delta, author_id=author_id, tag_id=tag_id)
+    refresh_latest([old_author_id, blog.author_id], using)
+
+
+def tags_changed(links, delta, using, author_ids=None):
+    """
+    Apply ``delta`` for each ``(blog_id, tag_id)`` link added or removed.
+    ``author_ids`` maps blog ids to their authors where the caller knows
+    them, the others are looked up.
+    """
+    for tag_id, count in Counter(tag_id for _, tag_id in links).items():
+        bump(TagFacet, using, delta * count, tag_id=tag_id)
+
+    author_ids = dict(author_ids or {})
+    missing = {blog_id for blog_id, _ in links} - author_ids.keys()
+    if missing:
+        author_ids.update(Blog.objects.using(using).filter(pk__in=missing).values_list('id', 'author_id'))
+    by_author = Counter((author_ids[blog_id], tag_id) for blog_id, tag_id in links if blog_id in author_ids)
+    for (author_id, tag_id), count in by_author.items():
+        bump(AuthorTagFacet, using, delta * count, author_id=author_id, tag_id=tag_id)
+
+
+def rebuild(using='default'):
+    """Recompute every counter from the blog tables."""
+    with write_transaction(using):
+        return _rebuild(using)
+
+
+def _rebuild(using):
+    blogs = Blog.objects.using(using)
+    months = Counter()
+    for row in blogs.annotate(month=TruncMonth('published_date')).values('month').annotate(count=Count('id')):
+        months[row['month'].date()] += row['count']
+
+    MonthArchive.objects.using(using).all().delete()
+    MonthArchive.objects.using(using).bulk_create(
+        [MonthArchive(month=month, count=count) for month, count in months.items()]
+    )
+
+    AuthorFacet.objects.using(using).all().delete()
+    AuthorFacet.objects.using(using).bulk_create([
+        AuthorFacet(author_id=row['author_id'], count=row['count'], latest_published=row['latest_published'])
+        for row in blogs.values('author_id').annotate(count=Count('id'), latest_published=Max('published_date')).order_by()
+    ])
+
+    author_months = Counter()
+    for row in blogs.annotate(month=TruncMonth('published_date')).values('author_id', 'month').annotate(count=Count('id')):
+        author_months[row['author_id'], row['month'].date()] += row['count']
+    AuthorMonthFacet.objects.using(using).all().delete()
+    AuthorMonthFacet.objects.using(using).bulk_create([
+        AuthorMonthFacet(author_id=author_id, month=month, count=count)
+        for (author_id, month), count in author_months.items()
+    ])
+
+    TagFacet.objects.using(using).all().delete()
+    TagFacet.objects.using(using).bulk_create([
+        TagFacet(tag_id=row['tag_id'], count=row['count'])
+        for row in Blog.tags.through.objects.using(using).values('tag_id').annotate(count=Count('id')).order_by()
+    ])
+
+    AuthorTagFacet.objects.using(using).all().delete()
+    AuthorTagFacet.objects.using(using).bulk_create([
+        AuthorTagFacet(author_id=row['blog__author_id'], tag_id=row['tag_id'], count=row['count'])
+        for row in Blog.tags.through.objects.using(using).values('blog__author_id', 'tag_id').annotate(count=Count('id')).order_by()
+    ])
+    return len(months)
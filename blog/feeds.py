@@ -0,0 +1,259 @@
+"""
+RSS and Atom feeds of the newest blogs, of every author and every tag, and a
+sitemap of all blogs, written ahead of time as files under
+``BLOG_FEEDS_ROOT``.
+
+Each feed and sitemap file has a key: ``blogs`` for the site feed,
+``author-<id>``, ``tag-<id>``, ``sitemap`` for the sitemap index and
+``sitemap-<page>``. A blog write queues a ``feeds.build`` task for just the
+keys it touched, and the task rewrites those files. Sitemap pages hold a fixed
+range of blog ids, so a new or deleted blog changes one page and the index
+only.
+
+The views serve the files with an ``ETag`` and ``Last-Modified`` from their
+stat, building a file on the spot the first time it is asked for. A file is
+only replaced when its content changes, so its ``ETag`` stays the same across
+rebuilds that change nothing.
+"""
+import io
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import F, Max
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.xmlutils import SimplerXMLGenerator
+
+from . import tasks
+from .models import Blog, Tag
+
+SITE_FEED = 'blogs'
+SITEMAP = 'sitemap'
+
+FEED_FORMATS = {'rss': Rss201rev2Feed, 'atom': Atom1Feed}
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def get_root():
+    return Path(getattr(settings, 'BLOG_FEEDS_ROOT', Path(settings.BASE_DIR) / 'feeds'))
+
+
+def get_site_url():
+    return getattr(settings, 'BLOG_SITE_URL', 'http://localhost:8000').rstrip('/')
+
+
+def get_feed_size():
+    return getattr(settings, 'BLOG_FEED_SIZE', 20)
+
+
+def get_sitemap_page_size():
+    return getattr(settings, 'BLOG_SITEMAP_PAGE_SIZE', 10_000)
+
+
+def author_feed(pk):
+    return f'author-{pk}'
+
+
+def tag_feed(pk):
+    return f'tag-{pk}'
+
+
+def sitemap_page(blog_id):
+    return f'{SITEMAP}-{(blog_id - 1) // get_sitemap_page_size() + 1}'
+
+
+def blog_url_maker():
+    """``url(pk)`` of a blog's page, reversing the URL once for all of them."""
+    marker = '9' * 12
+    prefix, suffix = (get_site_url() + reverse('blog-detail', args=[marker])).split(marker)
+    return lambda pk: f'{prefix}{pk}{suffix}'
+
+
+def formats_of(key):
+    return ['xml'] if key.startswith(SITEMAP) else list(FEED_FORMATS)
+
+
+def file_path(key, format):
+    return get_root() / f'{key}.{format}'
+
+
+def feeds_of(blog_ids, using='default'):
+    """Keys of the site feed and of the author and tag feeds the blogs are in now."""
+    keys = {SITE_FEED}
+    for author_id, tag_ids in Blog.objects.using(using).filter(pk__in=blog_ids).values_list('author_id', 'tag_ids'):
+        keys.add(author_feed(author_id))
+        keys.update(map(tag_feed, tag_ids))
+    return keys
+
+
+def sitemaps_of(blog_ids):
+    """Keys of the sitemap pages of the blogs and of the index."""
+    return {SITEMAP, *(sitemap_page(pk) for pk in blog_ids)}
+
+
+def build_on_commit(keys, using='default'):
+    tasks.enqueue_on_commit('feeds.build', sorted(keys), using=using)
+
+
+@tasks.task('feeds.build', batch_size=100)
+def build_files(keys, using='default'):
+    for key in keys:
+        build(key, using)
+
+
+def build(key, using='default'):
+    """
+    Write the files of ``key``, or remove them if what they were for is gone.
+    Returns whether the files exist.
+    """
+    contents = render(key, using)
+    for format in formats_of(key):
+        path = file_path(key, format)
+        if contents is None:
+            path.unlink(missing_ok=True)
+        else:
+            write(path, contents[format])
+    return contents is not None
+
+
+def write(path, content):
+    try:
+        if path.read_bytes() == content:
+            return
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    # Readers see either the old file or the new one, never half of it.
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    temporary.write_bytes(content)
+    os.replace(temporary, path)
+
+
+def get_file(key, format, using='default'):
+    """The file of ``key`` in ``format``, built now if it is missing, or None."""
+    if format not in formats_of(key):
+        return None
+    path = file_path(key, format)
+    if path.exists() or build(key, using):
+        return path
+    return None
+
+
+def render(key, using='default'):
+    """``{format: content}`` of ``key``, None if it has nothing to show."""
+    kind, _, pk = key.partition('-')
+    if kind == SITEMAP:
+        content = render_sitemap(int(pk), using) if pk else render_sitemap_index(using)
+        return None if content is None else {'xml': content}
+
+    blogs = Blog.objects.using(using).with_related().defer('context').order_by('-published_date', '-id')
+    list_url = get_site_url() + reverse('blog-list')
+    if kind == SITE_FEED:
+        title, link, description = "Blogs", list_url, "The newest blogs."
+    elif kind == 'author':
+        author = User.objects.using(using).filter(pk=pk).first()
+        if author is None:
+            return None
+        name = author.get_full_name() or author.username
+        blogs = blogs.filter(author_id=pk)
+        title, link, description = f"Blogs by {name}", f'{list_url}?author={pk}', f"The newest blogs by {name}."
+    elif kind == 'tag':
+        tag = Tag.objects.using(using).filter(pk=pk).first()
+        if tag is None:
+            return None
+        blogs = blogs.tagged(ids=[pk])
+        title, link, description = f"Blogs tagged {tag.name}", f'{list_url}?tag={pk}', f"The newest blogs tagged {tag.name}."
+    else:
+        return None
+
+    blogs = list(blogs[:get_feed_size()])
+    return {
+        format: render_feed(feed_class, key, format, title, link, description, blogs)
+        for format, feed_class in FEED_FORMATS.items()
+    }
+
+
+def render_feed(feed_class, key, format, title, link, description, blogs):
+    feed = feed_class(
+        title=title,
+        link=link,
+        description=description,
+        language=settings.LANGUAGE_CODE,
+        feed_url=get_site_url() + reverse('feed', kwargs={'key': key, 'format': format}),
+    )
+    blog_url = blog_url_maker()
+    for blog in blogs:
+        url = blog_url(blog.pk)
+        feed.add_item(
+            title=blog.title,
+            link=url,
+            description=blog.excerpt,
+            unique_id=url,
+            author_name=blog.author.get_full_name() or blog.author.username,
+            pubdate=blog.published_date,
+            categories=blog.tag_names,
+        )
+    return feed.writeString('utf-8').encode()
+
+
+def render_urlset(root, entry, entries):
+    """XML of the ``root`` element holding an ``entry`` element per ``(loc, lastmod)``."""
+    stream = io.StringIO()
+    xml = SimplerXMLGenerator(stream, 'utf-8')
+    xml.startDocument()
+    xml.startElement(root, {'xmlns': SITEMAP_NS})
+    for loc, lastmod in entries:
+        xml.startElement(entry, {})
+        xml.addQuickElement('loc', loc)
+        xml.addQuickElement('lastmod', lastmod.isoformat(timespec='seconds'))
+        xml.endElement(entry)
+    xml.endElement(root)
+    xml.endDocument()
+    return stream.getvalue().encode()
+
+
+def render_sitemap(page, using='default'):
+    size = get_sitemap_page_size()
+    blogs = (
+        Blog.objects.using(using)
+        .filter(id__gt=(page - 1) * size, id__lte=page * size)
+        .order_by('id')
+        .values_list('id', 'published_date')
+    )
+    blog_url = blog_url_maker()
+    entries = [
+        (blog_url(pk), published_date)
+        for pk, published_date in blogs.iterator(chunk_size=2000)
+    ]
+    return render_urlset('urlset', 'url', entries) if entries else None
+
+
+def render_sitemap_index(using='default'):
+    pages = (
+        Blog.objects.using(using)
+        .annotate(page=(F('id') - 1) / get_sitemap_page_size() + 1)
+        .values('page')
+        .annotate(lastmod=Max('published_date'))
+        .order_by('page')
+        .values_list('page', 'lastmod')
+    )
+    return render_urlset('sitemapindex', 'sitemap', [
+        (get_site_url() + reverse('sitemap', kwargs={'key': f'{SITEMAP}-{page}', 'format': 'xml'}), lastmod)
+        for page, lastmod in pages
+    ])
+
+
+def all_keys(using='default'):
+    """Keys of every feed and sitemap file there should be."""
+    blogs = Blog.objects.using(using)
+    return [
+        SITE_FEED,
+        *(author_feed(pk) for pk in blogs.values_list('author_id', flat=True).distinct().order_by('author_id')),
+        *(tag_feed(pk) for pk in Blog.tags.through.objects.using(using)
+          .values_list('tag_id', flat=True).distinct().order_by('tag_id')),
+        SITEMAP,
+        *sorted(sitemaps_of(blogs.values_list('id', flat=True).iterator(chunk_size=2000)) - {SITEMAP},
+                key=lambda key: int(key.partition('-')[2])),
+    ]
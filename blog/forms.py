@@ -4,6 +4,9 @@ from django.contrib.auth.models import User
 from .models import Blog
 
 class BlogForm(forms.ModelForm):
+    # The version of the blog the edit started from, see blog.utils.update_blog
+    version = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+
     class Meta:
         model = Blog
         fields = ['title', 'context', 'tags']
@@ -12,6 +15,11 @@ class BlogForm(forms.ModelForm):
             'context': forms.Textarea(attrs={'class': 'form-control', 'placeholder': 'Write your blog content here...', 'rows': 6}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['version'].initial = self.instance.version
+
 
 class UserRegistrationForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput)
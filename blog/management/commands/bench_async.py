@@ -0,0 +1,154 @@
+import asyncio
+import json
+import random
+import io
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+
+from blog import bulk
+from blog.models import Blog
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput and latency of the sync views through Django's WSGI handler with their async "
+        "variants through its ASGI handler, driven in process by the same number of concurrent clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per view and handler.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Requests in flight at once.")
+        parser.add_argument('--host', default='localhost', help="Host header, must be in ALLOWED_HOSTS.")
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='BLOGS',
+            help="Import this many generated blogs first. They are committed to the database.",
+        )
+        parser.add_argument('--author', help="Username to seed blogs as.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['author'])
+        blog_ids = list(Blog.objects.values_list('id', flat=True)[:1000])
+        if not blog_ids:
+            raise CommandError("There are no blogs to benchmark, use --seed to create some.")
+
+        self.host = options['host']
+        targets = {
+            'api list': ('/api/blogs/', '/api/async/blogs/'),
+            'api detail': ('/api/blogs/{pk}/', '/api/async/blogs/{pk}/'),
+            'html list': ('/', '/async/'),
+        }
+        results = {}
+        for name, (sync_path, async_path) in targets.items():
+            paths = [random.choice(blog_ids) for _ in range(options['requests'])]
+            results[name] = {
+                'wsgi': self.run_wsgi([sync_path.format(pk=pk) for pk in paths], options['concurrency']),
+                'asgi': self.run_asgi([async_path.format(pk=pk) for pk in paths], options['concurrency']),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'view':<12} {'handler':<8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>7}")
+        for name, handlers in results.items():
+            for handler, stats in handlers.items():
+                self.stdout.write(
+                    f"{name:<12} {handler:<8} {stats['throughput']:>10.1f} {stats['p50_ms']:>10.2f} "
+                    f"{stats['p99_ms']:>10.2f} {stats['errors']:>7}"
+                )
+
+    def seed(self, count, username):
+        author = User.objects.get(username=username) if username else User.objects.order_by('id').first()
+        if author is None:
+            raise CommandError("Create a user to seed blogs as first.")
+        tags = [f'tag{i}' for i in range(20)]
+        records = (
+            (i, {'title': f'Benchmark blog {i}', 'context': 'Lorem ipsum ' * 50, 'tags': random.sample(tags, 3)})
+            for i in range(count)
+        )
+        importer = bulk.Importer(author=author).run(records)
+        self.stdout.write(f"Seeded {importer.created} blogs.")
+
+    def summarize(self, latencies, errors, elapsed):
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': quantiles[49] * 1000,
+            'p99_ms': quantiles[98] * 1000,
+        }
+
+    def run_wsgi(self, paths, concurrency):
+        handler = WSGIHandler()
+
+        def request(url):
+            path, _, query = url.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': self.host, 'SERVER_PORT': '80', 'HTTP_HOST': self.host,
+                'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+                'wsgi.errors': sys.stderr,
+            }
+            status = []
+            started = time.perf_counter()
+            body = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+            for _ in body:
+                pass
+            body.close()
+            return time.perf_counter() - started, int(status[0].split()[0]) >= 400
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(request, paths))
+        elapsed = time.perf_counter() - started
+        return self.summarize([latency for latency, _ in results], sum(error for _, error in results), elapsed)
+
+    def run_asgi(self, paths, concurrency):
+        async def request(handler, url):
+            path, _, query = url.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', self.host.encode())],
+                'server': (self.host, 80), 'client': ('127.0.0.1', 0),
+            }
+            messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # Never disconnect, the handler cancels this wait once it has responded.
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            started = time.perf_counter()
+            await handler(scope, receive, send)
+            return time.perf_counter() - started, status[0] >= 400
+
+        async def run():
+            handler = ASGIHandler()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def limited(url):
+                async with semaphore:
+                    return await request(handler, url)
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(limited(url) for url in paths))
+            return results, time.perf_counter() - started
+
+        results, elapsed = asyncio.run(run())
+        return self.summarize([latency for latency, _ in results], sum(error for _, error in results), elapsed)
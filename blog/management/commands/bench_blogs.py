@@ -0,0 +1,253 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from blog import bulk
+from blog.models import AuthorFacet, Blog, MonthArchive, TagFacet
+
+# Title prefix of the blogs the write scenarios create, update and delete.
+MARKER = 'bench-blogs'
+COMPARED = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'queries')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every blog endpoint in process through the test client: the API list with each filter, "
+        "detail, create, update, delete and bulk import, and the HTML list, detail and form views. Reports "
+        "throughput, latency percentiles, queries per request and peak memory, optionally against a baseline. "
+        "Write scenarios clean up the blogs they create."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario.")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests before each scenario.")
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help="Run only these scenarios.")
+        parser.add_argument('--list', action='store_true', help="List the scenarios and exit.")
+        parser.add_argument('--author', help="Username to write as, the most prolific author by default.")
+        parser.add_argument('--host', default='localhost', help="Host header, must be in ALLOWED_HOSTS.")
+        parser.add_argument('--output', help="Save the results as JSON to this file, for use as a baseline.")
+        parser.add_argument('--baseline', help="Compare with results saved earlier with --output.")
+        parser.add_argument(
+            '--threshold', type=float, metavar='PERCENT',
+            help="With --baseline, fail if a scenario's p50 latency grew by more than this or its queries grew.",
+        )
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+        parser.add_argument('--random-seed', type=int, default=0, help="Seed for the blogs and filters picked.")
+
+    def handle(self, *args, **options):
+        scenarios = self.scenarios()
+        if options['list']:
+            self.stdout.write('\n'.join(scenarios))
+            return
+        unknown = set(options['only'] or ()) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}. Use --list to see them.")
+
+        self.prepare(options)
+        total = options['warmup'] + options['requests'] + 1
+        results = {}
+        try:
+            for name, scenario in scenarios.items():
+                if options['only'] and name not in options['only']:
+                    continue
+                results[name] = self.measure(scenario(total), options['requests'], options['warmup'])
+        finally:
+            Blog.objects.filter(author=self.author, title__startswith=MARKER).delete()
+
+        report = {'blogs': self.blog_count, 'requests': options['requests'], 'scenarios': results}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_results(results)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                self.compare(json.load(baseline)['scenarios'], results, options['threshold'])
+
+    def prepare(self, options):
+        self.rng = random.Random(options['random_seed'])
+        if options['author']:
+            self.author = User.objects.filter(username=options['author']).first()
+        else:
+            top = AuthorFacet.objects.select_related('author').order_by('-count').first()
+            self.author = top.author if top else None
+        if self.author is None:
+            raise CommandError("There is no author to benchmark with, run seed_blogs first or pass --author.")
+
+        self.blog_count = Blog.objects.count()
+        self.blog_ids = list(Blog.objects.values_list('id', flat=True)[:1000])
+        self.tags = list(TagFacet.objects.select_related('tag').order_by('-count')[:20])
+        self.months = list(MonthArchive.objects.order_by('-month').values_list('month', flat=True)[:12])
+        if not (self.blog_ids and self.tags and self.months):
+            raise CommandError("There are no tagged blogs to benchmark, run seed_blogs first.")
+
+        self.anonymous = Client(HTTP_HOST=options['host'], raise_request_exception=False)
+        self.user = Client(HTTP_HOST=options['host'], raise_request_exception=False)
+        self.user.force_login(self.author)
+        token = RefreshToken.for_user(self.author).access_token
+        self.api = Client(
+            HTTP_HOST=options['host'], HTTP_AUTHORIZATION=f'Bearer {token}', raise_request_exception=False,
+        )
+        self.next_page = json.loads(self.anonymous.get(reverse('api-blogs')).content)['next']
+
+    def scenarios(self):
+        """Scenario name to a function taking the number of requests and returning a request function."""
+        return {
+            'api list': lambda total: lambda i: self.anonymous.get(reverse('api-blogs')),
+            'api list next page': lambda total: lambda i: self.anonymous.get(self.next_page),
+            'api list tag': lambda total: lambda i: self.anonymous.get(
+                reverse('api-blogs'), {'tag': self.rng.choice(self.tags).tag.name},
+            ),
+            'api list user': lambda total: lambda i: self.anonymous.get(
+                reverse('api-blogs'), {'user': self.author.username},
+            ),
+            'api list dates': lambda total: lambda i: self.anonymous.get(reverse('api-blogs'), {
+                'start_date': (timezone.now() - timedelta(days=30)).date(), 'end_date': timezone.now().date(),
+            }),
+            'api list search': lambda total: lambda i: self.anonymous.get(
+                reverse('api-blogs'), {'q': self.rng.choice(['lorem', 'dolor', 'magna', 'tempor'])},
+            ),
+            'api list stream': lambda total: lambda i: self.anonymous.get(reverse('api-blogs'), {'stream': 'ndjson'}),
+            'api detail': lambda total: lambda i: self.anonymous.get(self.detail_url('api-blog-detail')),
+            'html list': lambda total: lambda i: self.anonymous.get(reverse('blog-list')),
+            'html list tag': lambda total: lambda i: self.anonymous.get(
+                reverse('blog-list'), {'tag': self.rng.choice(self.tags).tag_id},
+            ),
+            'html list month': lambda total: lambda i: self.anonymous.get(
+                reverse('blog-list'), {'month': self.rng.choice(self.months).strftime('%Y-%m')},
+            ),
+            'html list deep page': lambda total: lambda i: self.anonymous.get(reverse('blog-list'), {'page': 50}),
+            'html detail': lambda total: lambda i: self.anonymous.get(self.detail_url('blog-detail')),
+            'html my blogs': lambda total: lambda i: self.user.get(reverse('user-blog-list')),
+            'html create form': lambda total: lambda i: self.user.get(reverse('blog-create')),
+            'api create': lambda total: lambda i: self.api.post(
+                reverse('api-blogs'), self.blog_data(i), content_type='application/json',
+            ),
+            'api bulk': lambda total: lambda i: self.api.post(
+                reverse('api-blogs-bulk'),
+                ''.join(json.dumps(self.blog_data(i, tags_as_names=True)) + '\n' for _ in range(10)),
+                content_type='application/x-ndjson',
+            ),
+            'html create': lambda total: lambda i: self.user.post(reverse('blog-create'), self.blog_data(i)),
+            'api update': self.writes(lambda pk, i: self.api.put(
+                reverse('api-blog-detail', args=[pk]), self.blog_data(i), content_type='application/json',
+            )),
+            'html edit': self.writes(
+                lambda pk, i: self.user.post(reverse('blog-edit', args=[pk]), self.blog_data(i)),
+            ),
+            'api delete': self.writes(lambda pk, i: self.api.delete(reverse('api-blog-detail', args=[pk]))),
+            'html delete': self.writes(lambda pk, i: self.user.post(reverse('blog-delete', args=[pk]))),
+        }
+
+    def detail_url(self, name):
+        return reverse(name, args=[self.rng.choice(self.blog_ids)])
+
+    def blog_data(self, i, tags_as_names=False):
+        tags = self.rng.sample(self.tags, min(3, len(self.tags)))
+        return {
+            'title': f'{MARKER} {i}',
+            'context': 'Benchmark blog content. ' * 20,
+            'tags': [facet.tag.name if tags_as_names else facet.tag_id for facet in tags],
+        }
+
+    def writes(self, request):
+        """A scenario making ``request(pk, i)`` on a fresh blog of the author per request."""
+        def scenario(total):
+            importer = bulk.Importer(author=self.author).run(
+                (i, self.blog_data(i, tags_as_names=True)) for i in range(total)
+            )
+            ids = list(
+                Blog.objects.filter(author=self.author, title__startswith=MARKER)
+                .order_by('-id').values_list('id', flat=True)[:importer.created]
+            )
+            return lambda i: request(ids[i], i)
+        return scenario
+
+    def measure(self, request, count, warmup):
+        for i in range(warmup):
+            self.consume(request(i))
+
+        connection = connections['default']
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(warmup, warmup + count):
+            with CaptureQueriesContext(connection) as captured:
+                request_started = time.perf_counter()
+                response = self.consume(request(i))
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(len(captured))
+            errors += response.status_code >= 400
+        elapsed = time.perf_counter() - started
+
+        # Measured on one more request, tracing allocations would skew the timings above.
+        tracemalloc.start()
+        try:
+            self.consume(request(warmup + count))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'requests': count,
+            'errors': errors,
+            'throughput': count / elapsed,
+            'p50_ms': quantiles[49] * 1000,
+            'p95_ms': quantiles[94] * 1000,
+            'p99_ms': quantiles[98] * 1000,
+            'queries': statistics.mean(queries),
+            'max_queries': max(queries),
+            'peak_memory_kb': peak / 1024,
+        }
+
+    def consume(self, response):
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'scenario':<22} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'queries':>8} {'peak KB':>9} {'errors':>7}"
+        )
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<22} {stats['throughput']:>9.1f} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                f"{stats['p99_ms']:>9.2f} {stats['queries']:>8.1f} {stats['peak_memory_kb']:>9.0f} "
+                f"{stats['errors']:>7}"
+            )
+
+    def compare(self, baseline, results, threshold):
+        self.stdout.write(f"\nChange from baseline:\n{'scenario':<22}" + ''.join(f" {key:>11}" for key in COMPARED))
+        regressions = []
+        for name, stats in results.items():
+            if name not in baseline:
+                continue
+            changes = [
+                (stats[key] - baseline[name][key]) / baseline[name][key] * 100 if baseline[name][key] else 0.0
+                for key in COMPARED
+            ]
+            self.stdout.write(f"{name:<22}" + ''.join(f" {change:>+10.1f}%" for change in changes))
+            if threshold is not None and (
+                changes[COMPARED.index('p50_ms')] > threshold or stats['queries'] > baseline[name]['queries']
+            ):
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"Regressions over {threshold}%: {', '.join(regressions)}")
@@ -0,0 +1,120 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from blog.models import Blog
+from blog.utils import filter_by_date
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed blogs inside a transaction and compare the query plans and timings of the blog list "
+        "queries without the composite indexes and with them. Everything is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000, help="Number of blogs to seed.")
+        parser.add_argument('--authors', type=int, default=1000, help="Number of authors to seed.")
+        parser.add_argument('--batch-size', type=int, default=10_000, help="Rows per bulk insert.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query, the best one is reported.")
+        parser.add_argument('--database', default='default', help="Database alias to benchmark on.")
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.repeat = options['repeat']
+        try:
+            with transaction.atomic(using=self.using):
+                author = self.seed(options['rows'], options['authors'], options['batch_size'])
+                self.run(author)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, rows, authors, batch_size):
+        self.stdout.write(f"Seeding {authors} authors and {rows} blogs...")
+        started = time.perf_counter()
+        users = User.objects.using(self.using).bulk_create(
+            [User(username=f'bench-{i}-{random.getrandbits(32)}') for i in range(authors)], batch_size=batch_size,
+        )
+        # Raw inserts: bulk_create would overwrite published_date through auto_now_add.
+        connection = connections[self.using]
+        now = timezone.now()
+        span = 5 * 365 * 24 * 3600
+        sql = (
+            f"INSERT INTO {Blog._meta.db_table} (title, context, excerpt, tag_ids, tag_names, author_id, published_date) "
+            f"VALUES (%s, %s, %s, %s, %s, %s, %s)"
+        )
+        with connection.cursor() as cursor:
+            for offset in range(0, rows, batch_size):
+                cursor.executemany(sql, [
+                    (f'Blog {i}', '', '', '[]', '[]', random.choice(users).pk,
+                     connection.ops.adapt_datetimefield_value(now - timedelta(seconds=random.randrange(span))))
+                    for i in range(offset, min(offset + batch_size, rows))
+                ])
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s\n")
+        return users[0]
+
+    def queries(self, author, indexed):
+        """The list queries as they were written before the rewrite, or after it."""
+        start, end = date.today() - timedelta(days=60), date.today() - timedelta(days=30)
+        blogs = Blog.objects.using(self.using)
+        mine = blogs.filter(author=author)
+        if indexed:
+            return {
+                'api list page': blogs.order_by('-published_date', '-id')[:20],
+                'api date range': filter_by_date(blogs, start, end).order_by('-published_date', '-id')[:20],
+                'user date range': filter_by_date(mine, start, end).order_by('-published_date', '-id')[:20],
+                'html month list': blogs.annotate(published_month=TruncMonth('published_date'))
+                                        .order_by('-published_date', '-id')[:20],
+            }
+        return {
+            'api list page': blogs.order_by('-published_date', '-id')[:20],
+            'api date range': blogs.filter(published_date__date__gte=start, published_date__date__lte=end)
+                                   .order_by('-published_date', '-id')[:20],
+            'user date range': mine.filter(published_date__date__gte=start, published_date__date__lte=end)
+                                   .order_by('-published_date', '-id')[:20],
+            'html month list': blogs.annotate(published_month=TruncMonth('published_date'))
+                                    .order_by('-published_month', '-published_date')[:20],
+        }
+
+    def measure(self, queryset):
+        best = None
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            list(queryset.values_list('id', flat=True))
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def report(self, title, queries):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries.items():
+            self.stdout.write(f"{name}: {self.measure(queryset) * 1000:.2f} ms")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"    {line}")
+        self.stdout.write('')
+
+    def run(self, author):
+        # Plain index DDL rather than the schema editor, which SQLite refuses inside a transaction.
+        connection = connections[self.using]
+        table = connection.ops.quote_name(Blog._meta.db_table)
+        with connection.cursor() as cursor:
+            for index in Blog._meta.indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+        self.report("Before: no composite indexes, published_date__date filters", self.queries(author, indexed=False))
+
+        with connection.cursor() as cursor:
+            for index in Blog._meta.indexes:
+                columns = ', '.join(connection.ops.quote_name(Blog._meta.get_field(field).column) for field in index.fields)
+                cursor.execute(f"CREATE INDEX {connection.ops.quote_name(index.name)} ON {table} ({columns})")
+        self.report("After: composite indexes, half-open datetime ranges", self.queries(author, indexed=True))
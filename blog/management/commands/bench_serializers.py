@@ -0,0 +1,57 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from blog.models import Blog
+from blog.renderers import BlogJSONRenderer, orjson
+from blog.serializers import BlogSerializer, blog_rows, serialize_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows per second of BlogSerializer rendered by DRF's JSONRenderer with the values() row "
+        "serializer rendered by BlogJSONRenderer, queries included, on the newest blogs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Blogs serialized per run.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs of each serializer, the best one counts.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        blogs = Blog.objects.with_related().order_by('-published_date', '-id')[:options['rows']]
+        count = blogs.count()
+        if not count:
+            raise CommandError("There are no blogs to serialize, run seed_blogs first.")
+
+        def model_serializer():
+            return JSONRenderer().render(BlogSerializer(blogs, many=True).data)
+
+        def row_serializer():
+            return BlogJSONRenderer().render(serialize_rows(blog_rows(blogs)))
+
+        if json.loads(model_serializer()) != json.loads(row_serializer()):
+            raise CommandError("The serializers disagree.")
+
+        results = {}
+        for name, serialize in [('BlogSerializer', model_serializer), ('serialize_rows', row_serializer)]:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                serialize()
+                timings.append(time.perf_counter() - started)
+            results[name] = {'rows': count, 'best_ms': min(timings) * 1000, 'rows_per_second': count / min(timings)}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"JSON encoder of serialize_rows: {'orjson' if orjson is not None else 'json'}")
+        self.stdout.write(f"{'serializer':<16} {'rows':>7} {'best ms':>9} {'rows/s':>10}")
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:<16} {stats['rows']:>7} {stats['best_ms']:>9.2f} {stats['rows_per_second']:>10.0f}"
+            )
+        speedup = results['BlogSerializer']['best_ms'] / results['serialize_rows']['best_ms']
+        self.stdout.write(f"serialize_rows is {speedup:.1f}x as fast.")
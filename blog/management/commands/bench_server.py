@@ -0,0 +1,99 @@
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import server
+from blog.models import Blog
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the server in each mode (runserver, serve without and with warm-up) with one worker, and report "
+        "the time until it accepts connections, the latency of the first request to each path and the median "
+        "of the requests after it."
+    )
+    modes = {
+        'runserver': ['runserver', '--noreload', '--nothreading', '--skip-checks'],
+        'serve cold': ['serve', '--workers', '1', '--no-warmup'],
+        'serve warm': ['serve', '--workers', '1'],
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help="Requests to each path after the first one.")
+        parser.add_argument('--timeout', type=float, default=30, help="Seconds to wait for a server to start.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        paths = list(server.get_warmup_urls())
+        pk = Blog.objects.order_by('-id').values_list('id', flat=True).first()
+        if pk is None:
+            raise CommandError("There are no blogs to request, run seed_blogs first.")
+        paths += [f'/blogs/{pk}/', f'/api/blogs/{pk}/']
+
+        results = {name: self.run(args, paths, options) for name, args in self.modes.items()}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'mode':<12} {'path':<20} {'startup ms':>11} {'first ms':>10} {'median ms':>10}")
+        for name, result in results.items():
+            for path, stats in result['paths'].items():
+                self.stdout.write(
+                    f"{name:<12} {path:<20} {result['startup_ms']:>11.0f} {stats['first_ms']:>10.1f} "
+                    f"{stats['median_ms']:>10.1f}"
+                )
+
+    def run(self, args, paths, options):
+        port = free_port()
+        address = f'127.0.0.1:{port}'
+        args = args + (['--bind', address] if args[0] == 'serve' else [address])
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, sys.argv[0], *args], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            self.wait_for(port, process, options['timeout'])
+            result = {'startup_ms': (time.perf_counter() - started) * 1000, 'paths': {}}
+            for path in paths:
+                first = self.get(port, path)
+                rest = [self.get(port, path) for _ in range(options['repeat'])]
+                result['paths'][path] = {'first_ms': first * 1000, 'median_ms': statistics.median(rest) * 1000}
+            return result
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait_for(self, port, process, timeout):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"The server exited with {process.returncode} before accepting connections.")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.005)
+        raise CommandError(f"The server did not accept connections within {timeout}s.")
+
+    def get(self, port, path):
+        request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', headers={'Host': 'localhost'})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+        except urllib.error.HTTPError as exc:
+            raise CommandError(f"{path} answered {exc.code}.")
+        return time.perf_counter() - started
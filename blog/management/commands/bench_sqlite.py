@@ -0,0 +1,161 @@
+import json
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections, transaction
+
+from blog.models import Blog
+from blog.utils import write_transaction
+
+# Scratch table the writers update, so the benchmark leaves the blogs alone.
+TABLE = 'bench_sqlite'
+ROWS = 100
+
+# Django's SQLite settings with none of the tuning: a rollback journal, no
+# pragmas, deferred transactions and a new connection per request.
+STOCK = {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent reader and writer throughput on the SQLite database, with Django's stock SQLite "
+        "settings and with the ones configured in DATABASES. Readers page through the blog list, writers "
+        "read and update rows of a scratch table in a transaction, and each operation ends like a request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help="Reader threads.")
+        parser.add_argument('--writers', type=int, default=4, help="Writer threads.")
+        parser.add_argument('--seconds', type=float, default=5, help="Duration of each run.")
+        parser.add_argument(
+            '--runs', nargs='+', choices=['stock', 'configured'], default=['stock', 'configured'],
+            help="Which settings to run with.",
+        )
+        parser.add_argument('--database', default='default', help="SQLite database alias to benchmark.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        if connections[self.using].vendor != 'sqlite':
+            raise CommandError(f"{self.using} is not an SQLite database.")
+        self.blog_count = min(Blog.objects.using(self.using).count(), 1000)
+        if not self.blog_count:
+            raise CommandError("There are no blogs to read, run seed_blogs first.")
+
+        configured = connections.settings[self.using]
+        original = {key: configured[key] for key in STOCK}
+        journal_mode = self.pragma('journal_mode')
+        self.create_table()
+        results = {}
+        try:
+            for run in options['runs']:
+                # Stock writers take the write lock at their first write, configured ones up front.
+                self.write_transaction = write_transaction if run == 'configured' else transaction.atomic
+                if run == 'stock':
+                    configured.update(STOCK)
+                    # The journal mode is stored in the database file, unlike the other pragmas.
+                    self.pragma('journal_mode', 'DELETE')
+                else:
+                    configured.update(original)
+                    self.pragma('journal_mode', journal_mode)
+                connections[self.using].close()
+                results[run] = self.measure(options['readers'], options['writers'], options['seconds'])
+        finally:
+            configured.update(original)
+            self.pragma('journal_mode', journal_mode)
+            self.drop_table()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f"{'settings':<11} {'reads/s':>9} {'writes/s':>9} {'read p50':>9} {'read p99':>9} "
+            f"{'write p50':>10} {'write p99':>10} {'locked':>7}"
+        )
+        for run, stats in results.items():
+            self.stdout.write(
+                f"{run:<11} {stats['reads_per_second']:>9.1f} {stats['writes_per_second']:>9.1f} "
+                f"{stats['read_p50_ms']:>9.2f} {stats['read_p99_ms']:>9.2f} {stats['write_p50_ms']:>10.2f} "
+                f"{stats['write_p99_ms']:>10.2f} {stats['locked']:>7}"
+            )
+
+    def pragma(self, name, value=None):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}' if value is None else f'PRAGMA {name}={value}')
+            row = cursor.fetchone()
+        connection.close()
+        return row[0] if row else None
+
+    def create_table(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {TABLE} (id integer PRIMARY KEY, counter integer, payload text)')
+            cursor.execute(f'DELETE FROM {TABLE}')
+            cursor.executemany(f'INSERT INTO {TABLE} (id, counter, payload) VALUES (%s, 0, %s)',
+                               [(i, '') for i in range(ROWS)])
+
+    def drop_table(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+        connections[self.using].close()
+
+    def read(self, rng):
+        offset = rng.randrange(self.blog_count)
+        list(Blog.objects.using(self.using).order_by('-published_date', '-id').values('id', 'title')[offset:offset + 20])
+
+    def write(self, rng):
+        pk = rng.randrange(ROWS)
+        with self.write_transaction(using=self.using):
+            with connections[self.using].cursor() as cursor:
+                cursor.execute(f'SELECT counter FROM {TABLE} WHERE id = %s', [pk])
+                counter = cursor.fetchone()[0]
+                cursor.execute(f'UPDATE {TABLE} SET counter = %s, payload = %s WHERE id = %s',
+                               [counter + 1, 'x' * rng.randrange(100, 2000), pk])
+
+    def measure(self, readers, writers, seconds):
+        results = {'read': [], 'write': []}
+        lock = threading.Lock()
+        start = threading.Barrier(readers + writers)
+
+        def worker(kind, seed):
+            operation, rng = getattr(self, kind), random.Random(seed)
+            latencies, locked = [], 0
+            start.wait()
+            deadline = time.perf_counter() + seconds
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        operation(rng)
+                    except OperationalError:
+                        locked += 1
+                    else:
+                        latencies.append(time.perf_counter() - started)
+                    # What the request_finished signal does after every request.
+                    close_old_connections()
+            finally:
+                connections.close_all()
+            with lock:
+                results[kind].append((latencies, locked))
+
+        threads = [
+            threading.Thread(target=worker, args=(kind, seed))
+            for seed, kind in enumerate(['read'] * readers + ['write'] * writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = {'locked': 0}
+        for kind, runs in results.items():
+            latencies = [latency for run_latencies, _ in runs for latency in run_latencies]
+            stats['locked'] += sum(locked for _, locked in runs)
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else (latencies or [0]) * 99
+            stats[f'{kind}s_per_second'] = len(latencies) / seconds
+            stats[f'{kind}_p50_ms'] = quantiles[49] * 1000
+            stats[f'{kind}_p99_ms'] = quantiles[98] * 1000
+        return stats
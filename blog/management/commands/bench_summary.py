@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blog.models import Blog
+from blog.renderers import BlogJSONRenderer
+from blog.serializers import blog_rows, serialize_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the full and summary list views on the newest blogs: bytes per row of the API response, and "
+        "time, peak resident memory and peak Python heap of loading the rows, for the API and for the model "
+        "instances of the HTML list. Each case runs in a forked process so that their peaks are measured apart. "
+        "Resident memory includes the database pages SQLite maps in, which both views read."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help="Blogs loaded per case.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        blogs = Blog.objects.order_by('-published_date', '-id')
+        count = min(blogs.count(), options['rows'])
+        if not count:
+            raise CommandError("There are no blogs to load, run seed_blogs first.")
+        blogs = blogs[:count]
+
+        def api(view):
+            def run():
+                return len(BlogJSONRenderer().render(serialize_rows(blog_rows(blogs, view=view), view)))
+            return run
+
+        def html(*deferred):
+            def run():
+                len(list(blogs.with_related().defer(*deferred)))
+            return run
+
+        cases = {
+            'api full': api('full'),
+            'api summary': api('summary'),
+            'html full': html(),
+            'html summary': html('context', 'excerpt'),
+        }
+        results = {name: self.measure(run, count) for name, run in cases.items()}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'case':<14} {'rows':>6} {'bytes/row':>10} {'ms':>9} {'peak RSS MiB':>13} {'heap MiB':>9}")
+        for name, stats in results.items():
+            bytes_per_row = f"{stats['bytes_per_row']:.0f}" if stats['bytes_per_row'] is not None else '-'
+            self.stdout.write(
+                f"{name:<14} {stats['rows']:>6} {bytes_per_row:>10} {stats['ms']:>9.1f} "
+                f"{stats['peak_rss_mib']:>13.1f} {stats['heap_mib']:>9.1f}"
+            )
+
+    def measure(self, run, count):
+        """
+        Run ``run`` in a forked process, returning its time, output size and
+        memory peaks. It runs a second time to trace the Python heap, which
+        would slow down the first.
+        """
+        # The child opens its own connection, and must not close the parent's.
+        connections.close_all()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            code = 1
+            try:
+                started = time.perf_counter()
+                size = run()
+                elapsed = time.perf_counter() - started
+                tracemalloc.start()
+                run()
+                heap = tracemalloc.get_traced_memory()[1]
+                os.write(write, json.dumps([size, elapsed, heap]).encode())
+                code = 0
+            finally:
+                os._exit(code)
+
+        os.close(write)
+        with os.fdopen(read) as pipe:
+            output = pipe.read()
+        _, status, usage = os.wait4(pid, 0)
+        if os.waitstatus_to_exitcode(status):
+            raise CommandError("A benchmark process failed.")
+        size, elapsed, heap = json.loads(output)
+        # ru_maxrss is in KiB on Linux and in bytes on macOS.
+        peak = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+        return {
+            'rows': count,
+            'bytes_per_row': size / count if size is not None else None,
+            'ms': elapsed * 1000,
+            'peak_rss_mib': peak / 2 ** 20,
+            'heap_mib': heap / 2 ** 20,
+        }
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog import feeds
+
+
+class Command(BaseCommand):
+    help = "Write every feed and sitemap file, and remove the ones nothing links to anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to build the feeds from.")
+
+    def handle(self, *args, **options):
+        keys = feeds.all_keys(using=options['database'])
+        for key in keys:
+            feeds.build(key, using=options['database'])
+
+        expected = {feeds.file_path(key, format) for key in keys for format in feeds.formats_of(key)}
+        root = feeds.get_root()
+        stale = [path for path in root.iterdir() if path.is_file() and path not in expected] if root.exists() else []
+        for path in stale:
+            path.unlink()
+        self.stdout.write(self.style.SUCCESS(f"Built {len(keys)} feeds and sitemaps, removed {len(stale)} stale files."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from blog import bulk
+from blog.models import Blog
+
+
+class Command(BaseCommand):
+    help = "Export every blog as NDJSON or CSV, streaming rows in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or - for standard output.")
+        parser.add_argument('--format', choices=bulk.FORMATS, help="Output format, guessed from the file name by default.")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Blogs fetched from the database at a time.")
+        parser.add_argument('--database', default='default', help="Database alias to export from.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or bulk.format_for(path)
+        blogs = Blog.objects.using(options['database']).all()
+        if path == '-':
+            for chunk in bulk.export_blogs(blogs, format, chunk_size=options['chunk_size']):
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(path, 'w', newline='', encoding='utf-8') as target:
+            for chunk in bulk.export_blogs(blogs, format, chunk_size=options['chunk_size']):
+                target.write(chunk)
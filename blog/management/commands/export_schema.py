@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from blog import server
+
+
+class Command(BaseCommand):
+    help = "Write the OpenAPI document the schema view serves, as JSON or YAML."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or - for standard output.")
+        parser.add_argument('--format', choices=['json', 'yaml'], help="Output format, guessed from the file name by default.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('yaml' if Path(path).suffix in ('.yaml', '.yml') else 'json')
+
+        url = reverse('schema-json', kwargs={'format': f'.{format}'})
+        request = RequestFactory().get(url, HTTP_HOST=server.get_warmup_host())
+        match = resolve(url)
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.status_code != 200:
+            raise CommandError(f"The schema view answered {response.status_code}.")
+
+        if path == '-':
+            self.stdout.write(response.content.decode(), ending='')
+            return
+        Path(path).write_bytes(response.content)
+        self.stdout.write(self.style.SUCCESS(f"Wrote the schema to {path}."))
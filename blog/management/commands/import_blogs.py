@@ -0,0 +1,47 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import bulk
+
+
+class Command(BaseCommand):
+    help = "Import blogs from an NDJSON or CSV file in batched transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for standard input.")
+        parser.add_argument('--format', choices=bulk.FORMATS, help="Input format, guessed from the file name by default.")
+        parser.add_argument('--author', help="Username to import every blog as, instead of each record's author.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Blogs written per transaction.")
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help="Do not update the search index and list counts, rebuild them afterwards instead.",
+        )
+        parser.add_argument('--database', default='default', help="Database alias to import into.")
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            try:
+                author = User.objects.using(options['database']).get(username=options['author'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown author {options['author']!r}.")
+
+        path = options['path']
+        format = options['format'] or bulk.format_for(path)
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            importer = bulk.import_blogs(
+                source, format, author=author, batch_size=options['batch_size'],
+                update_derived=not options['skip_derived'], using=options['database'],
+            )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        for error in importer.errors:
+            self.stderr.write(f"Line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {importer.created} blogs."))
+        if options['skip_derived']:
+            self.stdout.write("Run rebuild_search_index and rebuild_facets to update the search index and list counts.")
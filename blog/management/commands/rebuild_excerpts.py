@@ -0,0 +1,28 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from blog.models import Blog, make_excerpt
+
+
+class Command(BaseCommand):
+    help = "Rewrite the excerpts of blogs that differ from the start of their content, for example after an upgrade."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild the excerpts on.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Blogs read and written at a time.")
+
+    def handle(self, *args, **options):
+        using, batch_size = options['database'], options['batch_size']
+        blogs = Blog.objects.using(using).only('id', 'context', 'excerpt').order_by('id').iterator(chunk_size=batch_size)
+        stale = 0
+        while batch := list(islice(blogs, batch_size)):
+            changed = []
+            for blog in batch:
+                excerpt = make_excerpt(blog.context)
+                if blog.excerpt != excerpt:
+                    blog.excerpt = excerpt
+                    changed.append(blog)
+            Blog.objects.using(using).bulk_update(changed, ['excerpt'])
+            stale += len(changed)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the excerpts of {stale} blogs."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog import facets
+
+
+class Command(BaseCommand):
+    help = "Recompute the month archive, the tag and author counts, and each author's own counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild the counts on.")
+
+    def handle(self, *args, **options):
+        months = facets.rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counts for {months} months."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import tag_lists
+
+
+class Command(BaseCommand):
+    help = "Rewrite the tag ids and names copied on blogs that differ from their tag links."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Database alias to rebuild the tag lists on.")
+        parser.add_argument('--batch-size', type=int, default=tag_lists.BATCH_SIZE, help="Blogs compared per query.")
+        parser.add_argument('--check', action='store_true', help="Only report out of date blogs, failing if there are any.")
+
+    def handle(self, *args, **options):
+        using, batch_size = options['database'], options['batch_size']
+        if options['check']:
+            stale = list(tag_lists.check(using, batch_size))
+            if stale:
+                raise CommandError(f"{len(stale)} blogs have out of date tag lists, e.g. {stale[:10]}.")
+            self.stdout.write(self.style.SUCCESS("All tag lists are up to date."))
+            return
+        stale = tag_lists.rebuild(using, batch_size)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt tag lists of {stale} blogs."))
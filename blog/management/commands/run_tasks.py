@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog import tasks
+
+
+def init_process():
+    # Only needed with the spawn start method, forked processes come set up.
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks in a pool of processes, each given a batch of tasks of one kind. "
+        "Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help="Worker processes.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Most tasks handed to a process at once.")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when no task is due.")
+        parser.add_argument('--once', action='store_true', help="Exit once no task is due.")
+        parser.add_argument('--database', default='default', help="Database alias of the task queue.")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        succeeded = failed = 0
+        with ProcessPoolExecutor(options['processes'], initializer=init_process) as pool:
+            while True:
+                claimed = tasks.claim(options['processes'] * options['batch_size'], using=using)
+                # Child processes must open their own connections, not share the parent's.
+                connections.close_all()
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                futures = [
+                    pool.submit(tasks.run_batch, name, ids, using)
+                    for name, ids in tasks.batches(claimed, options['batch_size'])
+                ]
+                for future in futures:
+                    done, errors = future.result()
+                    succeeded += done
+                    failed += errors
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"Ran {len(claimed)} tasks.")
+
+        self.stdout.write(self.style.SUCCESS(f"{succeeded} tasks succeeded, {failed} failed."))
@@ -0,0 +1,88 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog import bulk
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+    'magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    'consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint '
+    'occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim id est laborum'
+).split()
+
+
+def zipf_weights(count, exponent=1.1):
+    """Cumulative weights where the n-th item is picked about 1/n^exponent as often as the first."""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate users, tags and blogs for development and benchmarks. A few authors write most of the "
+        "blogs, a few tags are on most of them, and publication dates cluster towards the present."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help="Number of authors to create.")
+        parser.add_argument('--tags', type=int, default=200, help="Number of distinct tags to use.")
+        parser.add_argument('--blogs', type=int, default=10_000, help="Number of blogs to create.")
+        parser.add_argument('--tags-per-blog', type=int, default=3, help="Average number of tags on a blog.")
+        parser.add_argument('--days', type=int, default=3 * 365, help="How far back publication dates go.")
+        parser.add_argument('--password', help="Password of the created users, they cannot log in without one.")
+        parser.add_argument('--prefix', default='seed-', help="Prefix of the created usernames and tag names.")
+        parser.add_argument('--random-seed', type=int, help="Seed for reproducible data.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Blogs written per transaction.")
+        parser.add_argument('--database', default='default', help="Database alias to seed.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['random_seed'])
+        prefix = options['prefix']
+        password = make_password(options['password'])
+
+        usernames = [f'{prefix}user{i}' for i in range(options['users'])]
+        User.objects.using(options['database']).bulk_create(
+            [
+                User(username=username, first_name=rng.choice(WORDS).title(), last_name=rng.choice(WORDS).title(),
+                     password=password)
+                for username in usernames
+            ],
+            batch_size=options['batch_size'], ignore_conflicts=True,
+        )
+        tag_names = [f'{prefix}{rng.choice(WORDS)}{i}' for i in range(options['tags'])]
+
+        author_weights = zipf_weights(len(usernames))
+        tag_weights = zipf_weights(len(tag_names))
+        now = timezone.now()
+
+        def records():
+            for number in range(options['blogs']):
+                tag_count = min(len(tag_names), rng.randint(0, 2 * options['tags_per_blog']))
+                tags = set()
+                while len(tags) < tag_count:
+                    tags.add(rng.choices(tag_names, cum_weights=tag_weights)[0])
+                # Squaring the uniform draw puts more blogs in recent months, like a growing site.
+                age = timedelta(days=options['days'] * rng.random() ** 2, seconds=rng.randrange(86400))
+                paragraphs = [
+                    ' '.join(rng.choices(WORDS, k=rng.randint(20, 120))).capitalize() + '.'
+                    for _ in range(int(rng.lognormvariate(1, 0.6)) + 1)
+                ]
+                yield number, {
+                    'title': ' '.join(rng.choices(WORDS, k=rng.randint(3, 8))).capitalize(),
+                    'context': '\n\n'.join(paragraphs),
+                    'tags': sorted(tags),
+                    'author': rng.choices(usernames, cum_weights=author_weights)[0],
+                    'published_date': (now - age).isoformat(),
+                }
+
+        importer = bulk.Importer(batch_size=options['batch_size'], using=options['database']).run(records())
+        for error in importer.errors:
+            self.stderr.write(f"Blog {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {importer.created} blogs by {len(usernames)} authors with {len(tag_names)} tags."
+        ))
@@ -0,0 +1,71 @@
+import os
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import get_internal_wsgi_application
+
+from blog import cache, server
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the project with pre-forked worker processes, forked once the project is imported and warmed. "
+        "SIGHUP replaces the workers, SIGTERM or SIGINT stops once they have finished their requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default='127.0.0.1:8000', help="Address to listen on, as host:port.")
+        parser.add_argument(
+            '--workers', type=int,
+            help="Worker processes, by default one per CPU, or one if the blog cache is kept in each process.",
+        )
+        parser.add_argument(
+            '--max-requests', type=int, default=0,
+            help="Requests a worker serves before it is replaced, 0 for no limit.",
+        )
+        parser.add_argument(
+            '--max-requests-jitter', type=int, default=0,
+            help="Up to this many more requests per worker, so workers are not all replaced at once.",
+        )
+        parser.add_argument(
+            '--max-memory', type=int, default=0, metavar='MIB',
+            help="Resident memory in MiB above which a worker is replaced after its request, 0 for no limit.",
+        )
+        parser.add_argument(
+            '--graceful-timeout', type=float, default=30,
+            help="Seconds stopping workers get to finish their requests before they are killed.",
+        )
+        parser.add_argument('--no-warmup', action='store_true', help="Fork the workers without warming the project.")
+
+    def handle(self, *args, **options):
+        host, _, port = options['bind'].rpartition(':')
+        if not host or not port.isdigit():
+            raise CommandError(f"--bind must be host:port, not {options['bind']!r}.")
+        # Each worker would invalidate only its own copy of a local memory cache,
+        # and serve the blogs other workers changed from its stale one.
+        local_cache = isinstance(cache.get_cache(), LocMemCache)
+        if options['workers'] is None:
+            options['workers'] = 1 if local_cache else os.cpu_count()
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options['workers'] > 1 and local_cache:
+            raise CommandError(
+                "More than one worker needs a blog cache shared by the workers, such as Redis or Memcached, "
+                "not LocMemCache. Configure one in CACHES, or serve with --workers 1."
+            )
+
+        application = get_internal_wsgi_application()
+        if not options['no_warmup']:
+            timings = server.warm(application)
+            steps = ', '.join(f"{step} {seconds * 1000:.0f} ms" for step, seconds in timings.items())
+            self.stdout.write(f"Warmed up in {sum(timings.values()) * 1000:.0f} ms ({steps}).")
+
+        arbiter = server.Arbiter(
+            application, host.strip('[]'), int(port), options['workers'],
+            max_requests=options['max_requests'], max_requests_jitter=options['max_requests_jitter'],
+            max_memory=options['max_memory'] * 1024 * 1024, graceful_timeout=options['graceful_timeout'],
+        )
+        host, port = arbiter.listen()
+        self.stdout.write(self.style.SUCCESS(f"Serving on http://{host}:{port}/ with {options['workers']} workers."))
+        self.stdout.flush()
+        arbiter.run()
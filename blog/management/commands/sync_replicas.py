@@ -0,0 +1,38 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from blog import routers
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database over the SQLite replicas in BLOG_DATABASE_REPLICAS, "
+        "to stand in for replication when developing and benchmarking locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*', metavar='ALIAS', help="Replicas to refresh, all by default.")
+        parser.add_argument('--database', default='default', help="Database alias to copy from.")
+
+    def handle(self, *args, **options):
+        aliases = options['replicas'] or list(routers.get_replicas())
+        if not aliases:
+            raise CommandError("There are no replicas, set BLOG_DATABASE_REPLICAS.")
+        for alias in [options['database'], *aliases]:
+            if alias not in connections.settings or connections[alias].vendor != 'sqlite':
+                raise CommandError(f"{alias} is not an SQLite database.")
+
+        primary = connections[options['database']]
+        primary.ensure_connection()
+        for alias in aliases:
+            connections[alias].close()
+            # The backup API copies a consistent snapshot even while the primary is written to.
+            replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write(self.style.SUCCESS(f"Copied {options['database']} to {alias}."))
+        routers.health.reset()
@@ -0,0 +1,165 @@
+"""
+In-process request metrics, exposed in the Prometheus text format.
+
+``MetricsMiddleware`` opens a ``RequestStats`` for every request in a context
+variable. The database execute wrapper, the serializer timers of the views
+and the template render callback add to it, and at the end of the request it
+is folded into per-view histograms. Each worker process keeps its own
+numbers, Prometheus adds them up across processes.
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('blog.performance')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+current = ContextVar('blog_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.timers = Counter()
+
+    @property
+    def db_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    @property
+    def duplicate_queries(self):
+        """Queries repeating the SQL of an earlier one, the usual sign of an N+1."""
+        return len(self.queries) - len({sql for sql, _ in self.queries})
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    histograms = {
+        'blog_request_duration_seconds': ('Wall time of the request.', SECONDS_BUCKETS),
+        'blog_request_queries': ('Database queries per request.', COUNT_BUCKETS),
+        'blog_request_db_seconds': ('Time spent executing database queries per request.', SECONDS_BUCKETS),
+        'blog_request_serializer_seconds': ('Time spent in serializers per request.', SECONDS_BUCKETS),
+        'blog_request_template_seconds': ('Time spent rendering templates per request.', SECONDS_BUCKETS),
+    }
+    counters = {
+        'blog_requests_total': 'Requests by view and status code.',
+        'blog_request_duplicate_queries_total': 'Queries repeating the SQL of an earlier query in the same request.',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.values = {name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+                       for name, (_, buckets) in self.histograms.items()}
+        self.values.update({name: Counter() for name in self.counters})
+
+    def record(self, view, status, stats, duration):
+        with self.lock:
+            self.values['blog_request_duration_seconds'][(view,)].observe(duration)
+            self.values['blog_request_queries'][(view,)].observe(len(stats.queries))
+            self.values['blog_request_db_seconds'][(view,)].observe(stats.db_time)
+            self.values['blog_request_serializer_seconds'][(view,)].observe(stats.timers['serializer'])
+            self.values['blog_request_template_seconds'][(view,)].observe(stats.timers['template'])
+            self.values['blog_requests_total'][(view, str(status))] += 1
+            self.values['blog_request_duplicate_queries_total'][(view,)] += stats.duplicate_queries
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, (description, _) in self.histograms.items():
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (view,), histogram in sorted(self.values[name].items()):
+                    label = f'view="{escape(view)}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+            for name, description in self.counters.items():
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} counter']
+                for key, value in sorted(self.values[name].items()):
+                    labels = [f'view="{escape(key[0])}"'] + ([f'status="{key[1]}"'] if len(key) > 1 else [])
+                    lines.append(f'{name}{{{",".join(labels)}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def start():
+    return current.set(RequestStats())
+
+
+def finish(token, view, status):
+    stats = current.get()
+    current.reset(token)
+    duration = time.perf_counter() - stats.started
+    registry.record(view, status, stats, duration)
+
+    threshold = getattr(settings, 'BLOG_SLOW_REQUEST_SECONDS', 1.0)
+    if threshold is not None and duration >= threshold:
+        logger.warning(
+            "Slow request to %s: %.3fs, %d queries (%d duplicate) in %.3fs, serializer %.3fs, template %.3fs\n%s",
+            view, duration, len(stats.queries), stats.duplicate_queries, stats.db_time,
+            stats.timers['serializer'], stats.timers['template'],
+            '\n'.join(f'  {duration * 1000:.1f} ms  {sql}' for sql, duration in stats.queries),
+        )
+    return stats
+
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the block to the ``name`` timer of the current request."""
+    stats = current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.timers[name] += time.perf_counter() - started
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries.append((sql, time.perf_counter() - started))
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    # connection_created fires again on reconnects of the same wrapper object.
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
@@ -0,0 +1,224 @@
+import time
+import zlib
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+from rest_framework.permissions import SAFE_METHODS
+
+from . import metrics, routers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content types worth compressing, the rest is usually compressed already.
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'application/xml')
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, queries and serializer and template time of every
+    request under the URL name of its view, see ``blog.metrics``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.finish(token, view_name(request), status)
+
+    async def __acall__(self, request):
+        token = metrics.start()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.finish(token, view_name(request), status)
+
+    def process_template_response(self, request, response):
+        # Template responses are rendered right after the last of these hooks,
+        # this middleware's runs last as it is first in MIDDLEWARE.
+        started = time.perf_counter()
+        stats = metrics.current.get()
+
+        # DRF responses go through here too, their rendering is serialization.
+        kind = 'serializer' if hasattr(response, 'accepted_renderer') else 'template'
+
+        def rendered(response):
+            if stats is not None:
+                stats.timers[kind] += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Pin requests that may write, and those of clients that wrote recently, to
+    the primary database, see ``blog.routers``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.start(pinned=self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.finish(token)
+        return self.stick(response, wrote)
+
+    async def __acall__(self, request):
+        token = routers.start(pinned=self.is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = routers.finish(token)
+        return self.stick(response, wrote)
+
+    def is_pinned(self, request):
+        # An edit must start from the current row, not a replica's possibly older copy.
+        return request.method not in SAFE_METHODS or routers.get_sticky_cookie() in request.COOKIES
+
+    def stick(self, response, wrote):
+        if wrote and routers.get_replicas():
+            response.set_cookie(
+                routers.get_sticky_cookie(), '1', max_age=routers.get_sticky_seconds(), httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses of at least ``BLOG_COMPRESSION_MIN_SIZE`` bytes, and
+    every streamed one, with brotli when the client accepts it and the
+    optional ``brotli`` package is installed, gzip otherwise.
+
+    Like Django's ``GZipMiddleware``, which it replaces, it makes strong ETags
+    weak and mitigates BREACH by adding random bytes to gzipped pages.
+    """
+    max_random_bytes = 100
+    brotli_quality = 5
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or not is_compressible(response):
+            return response
+        if not response.streaming and len(response.content) < getattr(settings, 'BLOG_COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = accepted_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.acompress_sequence(response.streaming_content, encoding)
+            else:
+                response.streaming_content = self.compress_sequence(response.streaming_content, encoding)
+            # The compressed length is unknown until the whole body is sent.
+            del response.headers['Content-Length']
+        else:
+            compressed = self.compress(response.content, encoding)
+            # Short or already compressed content can grow.
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def compress(self, content, encoding):
+        if encoding == 'br':
+            return brotli.compress(content, quality=self.brotli_quality)
+        return compress_string(content, max_random_bytes=self.max_random_bytes)
+
+    def compress_sequence(self, sequence, encoding):
+        compress, finish = self.stream_compressor(encoding)
+        for chunk in sequence:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+
+    async def acompress_sequence(self, sequence, encoding):
+        compress, finish = self.stream_compressor(encoding)
+        async for chunk in sequence:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+
+    def stream_compressor(self, encoding):
+        """
+        Functions compressing the next chunk of a stream and ending it. Every
+        chunk is flushed so that streamed rows reach the client as they come.
+        """
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return lambda chunk: compressor.process(chunk) + compressor.flush(), compressor.finish
+        # wbits 31 writes a gzip header and trailer around the deflate stream.
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith(('+json', '+xml'))
+
+
+def accepted_encoding(accept_encoding):
+    """The best encoding in an Accept-Encoding header: ``'br'``, ``'gzip'`` or ``None``."""
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, *params = [piece.strip() for piece in part.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+    for encoding in encodings:
+        if qualities.get(encoding, qualities.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
@@ -1,5 +1,17 @@
-from django.db import models
+import json
+
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.text import Truncator
+
+# Characters of the body kept in Blog.excerpt, for summary lists
+EXCERPT_LENGTH = 200
+
+
+def make_excerpt(text):
+    """The start of ``text`` with its whitespace collapsed, at most ``EXCERPT_LENGTH`` characters."""
+    return Truncator(' '.join(text.split())).chars(EXCERPT_LENGTH)
 
 
 class Tag(models.Model):
@@ -9,12 +21,221 @@ class Tag(models.Model):
         return "{}".format(self.name)
 
 
+class TagListField(models.JSONField):
+    """
+    A JSON array of the ids or names of a blog's tags, copied from
+    ``Blog.tags`` by ``blog.tag_lists``. Filter it without joining the tags
+    with ``has_any`` and ``has_all``.
+    """
+
+
+class TagListLookup(models.Lookup):
+    prepare_rhs = False
+
+    def get_prep_lookup(self):
+        return list(dict.fromkeys(self.rhs))
+
+    def json_each(self, compiler, connection):
+        """SQL selecting the array elements that are in the lookup values, for SQLite."""
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        placeholders = ', '.join(['%s'] * len(self.rhs))
+        return f'FROM json_each({lhs}) WHERE value IN ({placeholders})', [*lhs_params, *self.rhs]
+
+    def containment(self, compiler, connection, operator):
+        """``array @> [value]`` for each value joined by ``operator``, for PostgreSQL's GIN index."""
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        sql = f' {operator} '.join([f'{lhs} @> %s::jsonb'] * len(self.rhs))
+        params = []
+        for value in self.rhs:
+            params += [*lhs_params, json.dumps([value])]
+        return f'({sql})', params
+
+
+@TagListField.register_lookup
+class HasAny(TagListLookup):
+    lookup_name = 'has_any'
+
+    def as_sql(self, compiler, connection):
+        if not self.rhs:
+            return '1 = 0', []
+        sql, params = self.json_each(compiler, connection)
+        return f'EXISTS (SELECT 1 {sql})', params
+
+    def as_postgresql(self, compiler, connection):
+        if not self.rhs:
+            return '1 = 0', []
+        return self.containment(compiler, connection, 'OR')
+
+
+@TagListField.register_lookup
+class HasAll(TagListLookup):
+    lookup_name = 'has_all'
+
+    def as_sql(self, compiler, connection):
+        if not self.rhs:
+            return '1 = 1', []
+        sql, params = self.json_each(compiler, connection)
+        return f'(SELECT COUNT(DISTINCT value) {sql}) = %s', [*params, len(self.rhs)]
+
+    def as_postgresql(self, compiler, connection):
+        if not self.rhs:
+            return '1 = 1', []
+        return self.containment(compiler, connection, 'AND')
+
+
+class BlogQuerySet(models.QuerySet):
+    def with_related(self):
+        # Load authors in the same query. Tag names are on the blog row.
+        return self.select_related('author')
+
+    def tagged(self, ids=None, names=None, match='any'):
+        """
+        Blogs with any, or with ``match='all'`` all, of the tags with ``ids``
+        and ``names``, filtered on the blog rows without joining the tags.
+        """
+        lookup = 'has_all' if match == 'all' else 'has_any'
+        queryset = self
+        if ids is not None:
+            queryset = queryset.filter(**{f'tag_ids__{lookup}': [int(pk) for pk in ids]})
+        if names is not None:
+            queryset = queryset.filter(**{f'tag_names__{lookup}': list(names)})
+        return queryset
+
+
+# Fields whose changes are edits of the blog, which bump its version
+VERSIONED_FIELDS = {'title', 'context', 'author', 'published_date'}
+
+
 class Blog(models.Model):
     title = models.CharField(max_length=128)
     context = models.TextField()
+    # The start of the body, written with it, so that lists need not load the body
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, default='', editable=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     tags = models.ManyToManyField(Tag, related_name='tags')
     published_date = models.DateTimeField(auto_now_add=True)
+    # Bumped by every edit, for optimistic concurrency control (see blog.utils.update_blog)
+    version = models.PositiveIntegerField(default=1, db_default=1)
+    # Copies of the tags, ids in number order and names in name order, kept by blog.tag_lists
+    tag_ids = TagListField(default=list, editable=False)
+    tag_names = TagListField(default=list, editable=False)
+
+    objects = BlogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination and date ranges over all blogs
+            models.Index(fields=['published_date', 'id'], name='blog_published_id_idx'),
+            # An author's blogs by date
+            models.Index(fields=['author', 'published_date'], name='blog_author_published_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.title} by {self.author.last_name} {self.author.first_name}"
+
+    def save(self, *args, **kwargs):
+        if 'context' not in self.get_deferred_fields():
+            self.excerpt = make_excerpt(self.context)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'context' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        # Edits bump the version like blog.utils.update_blog does, so that edits
+        # based on an older version fail instead of overwriting this one.
+        update_fields = kwargs.get('update_fields')
+        edited = not self._state.adding and (update_fields is None or bool(VERSIONED_FIELDS.intersection(update_fields)))
+        if edited:
+            self.version = models.F('version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        # The post_save handlers update the counters in blog.facets, commit them with the row.
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if edited:
+                self.refresh_from_db(using=using, fields=['version'])
+
+
+# Denormalized counts for the archive navigation and the list filters,
+# maintained by blog.facets on every blog write.
+class MonthArchive(models.Model):
+    month = models.DateField(unique=True)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.month:%B %Y} ({self.count})"
+
+
+class TagFacet(models.Model):
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, related_name='facet')
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.tag} ({self.count})"
+
+
+class AuthorFacet(models.Model):
+    author = models.OneToOneField(User, on_delete=models.CASCADE, related_name='blog_facet')
+    count = models.PositiveIntegerField(default=0)
+    latest_published = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.author} ({self.count})"
+
+
+# An author's posts per month and per tag, for their own blog list
+class AuthorMonthFacet(models.Model):
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blog_month_facets')
+    month = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'month'], name='blog_author_month_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.author}, {self.month:%B %Y} ({self.count})"
+
+
+class AuthorTagFacet(models.Model):
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='blog_tag_facets')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='author_facets')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'tag'], name='blog_author_tag_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.author}, {self.tag} ({self.count})"
+
+
+class Task(models.Model):
+    """
+    Background work queued by ``blog.tasks``, run by the ``run_tasks`` worker.
+    ``key`` says what to work on, the id of a blog for example.
+    """
+    name = models.CharField(max_length=64)
+    key = models.CharField(max_length=255)
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    # Set while a worker runs the task, it is claimable again once this passes
+    locked_until = models.DateTimeField(null=True, blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            # A task waiting to run covers any repeat of it, see blog.tasks.enqueue
+            models.UniqueConstraint(
+                fields=['name', 'key'], condition=models.Q(locked_until__isnull=True, failed_at__isnull=True),
+                name='blog_task_pending_unique',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['run_after', 'id'], name='blog_task_run_after_idx'),
+        ]
 
     def __str__(self) -> str:
-        return f"{self.title} by {self.author.last_name} {self.author.first_name}"
\ No newline at end of file
+        return f"{self.name} {self.key}"
@@ -0,0 +1,251 @@
+import base64
+import json
+import math
+from binascii import Error as BinasciiError
+from datetime import datetime, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .renderers import dumps
+from .serializers import blog_rows, serialize_rows
+
+
+class BlogCursorPagination(BasePagination):
+    """
+    Keyset pagination over ``ordering``, by default ``(published_date, id)``
+    newest first.
+
+    The cursor is an opaque token holding the ordering values of the last row
+    of the previous page, so every page is a single indexed range scan no
+    matter how deep the client pages. The last ordering field must be unique.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-published_date', '-id')
+    datetime_fields = ('published_date',)
+    integer_fields = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'BLOG_API_PAGE_SIZE', 20)
+        max_page_size = getattr(settings, 'BLOG_API_MAX_PAGE_SIZE', 100)
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        if page_size <= 0:
+            return default
+        return min(page_size, max_page_size)
+
+    def page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.position_filter(position))
+
+        # Fetch one extra row to know whether there is a next page.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.set_page([blog async for blog in self.page_queryset(queryset, request)])
+
+    def position_filter(self, position):
+        """Rows strictly after ``position`` in ``ordering``."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_next_cursor(self):
+        return self.encode_cursor(self.page[-1]) if self.has_next else None
+
+    def get_next_link(self):
+        return self.cursor_link(self.request, self.get_next_cursor())
+
+    def cursor_link(self, request, cursor):
+        """The request's URL with ``cursor``, or None without one."""
+        if cursor is None:
+            return None
+        return replace_query_param(request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, blog):
+        # ``blog`` is a model instance or a values() row.
+        if isinstance(blog, dict):
+            position = [blog[field.lstrip('-')] for field in self.ordering]
+        else:
+            position = [getattr(blog, field.lstrip('-')) for field in self.ordering]
+        # isoformat() keeps the microseconds that DjangoJSONEncoder would drop.
+        position = [value.isoformat() if isinstance(value, datetime) else value for value in position]
+        raw = json.dumps(position, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        for index, field in enumerate(self.ordering):
+            position[index] = self.decode_value(field.lstrip('-'), position[index])
+        return position
+
+    def decode_value(self, name, value):
+        """The ordering value of field ``name`` from a cursor, raising NotFound if it has the wrong type."""
+        if name in self.datetime_fields:
+            try:
+                value = parse_datetime(value) if isinstance(value, str) else None
+            except ValueError:
+                # Well formed but out of range, like a 13th month
+                value = None
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            return timezone.make_aware(value, dt_timezone.utc) if timezone.is_naive(value) else value
+        valid_types = int if name in self.integer_fields else (int, float)
+        if not isinstance(value, valid_types) or isinstance(value, bool):
+            raise NotFound(self.invalid_cursor_message)
+        # NaN and infinity parse as JSON, and databases store 64-bit integers
+        if not math.isfinite(value) or abs(value) >= 2 ** 63:
+            raise NotFound(self.invalid_cursor_message)
+        return value
+
+
+class CountedPaginator(Paginator):
+    """Paginator that takes the total from a precomputed count instead of ``COUNT(*)``."""
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, count=None, **kwargs):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        return super().count
+
+
+def wants_stream(request):
+    """Return ``'json'``, ``'ndjson'`` or ``None`` for the ``?stream=`` parameter."""
+    value = request.query_params.get('stream', '').lower()
+    if value in ('1', 'true', 'json'):
+        return 'json'
+    if value == 'ndjson':
+        return 'ndjson'
+    return None
+
+
+def serialized_blogs(rows, chunk_size, view='full'):
+    """Serialize ``blog_rows()`` rows of ``view`` ``chunk_size`` at a time."""
+    while chunk := list(islice(rows, chunk_size)):
+        yield from serialize_rows(chunk, view)
+
+
+async def aserialized_blogs(rows, chunk_size, view='full'):
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            for blog in serialize_rows(chunk, view):
+                yield blog
+            chunk = []
+    for blog in serialize_rows(chunk, view):
+        yield blog
+
+
+def stream_content(blogs, mode):
+    if mode == 'ndjson':
+        for blog in blogs:
+            yield dumps(blog) + b'\n'
+        return
+
+    yield b'['
+    separator = b''
+    for blog in blogs:
+        yield separator + dumps(blog)
+        separator = b','
+    yield b']'
+
+
+async def astream_content(blogs, mode):
+    if mode == 'ndjson':
+        async for blog in blogs:
+            yield dumps(blog) + b'\n'
+        return
+
+    yield b'['
+    separator = b''
+    async for blog in blogs:
+        yield separator + dumps(blog)
+        separator = b','
+    yield b']'
+
+
+def stream_blogs(queryset, mode='json', ordering=BlogCursorPagination.ordering, asynchronous=False, view='full'):
+    """
+    Stream every blog of ``queryset`` as a chunked JSON array or as NDJSON.
+
+    Rows are pulled with ``iterator()``, or ``aiterator()`` for async views
+    under ASGI, and serialized a chunk at a time, so only one chunk is held in
+    memory however large the result is.
+    """
+    chunk_size = getattr(settings, 'BLOG_API_STREAM_CHUNK_SIZE', 500)
+    rows = blog_rows(queryset, *(field.lstrip('-') for field in ordering), view=view).order_by(*ordering)
+    if asynchronous:
+        blogs = aserialized_blogs(rows.aiterator(chunk_size=chunk_size), chunk_size, view)
+        content = astream_content(blogs, mode)
+    else:
+        blogs = serialized_blogs(rows.iterator(chunk_size=chunk_size), chunk_size, view)
+        content = stream_content(blogs, mode)
+
+    content_type = 'application/x-ndjson' if mode == 'ndjson' else 'application/json'
+    return StreamingHttpResponse(content, content_type=content_type)
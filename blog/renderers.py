@@ -0,0 +1,41 @@
+"""
+JSON rendering with ``orjson`` when it is installed.
+
+The output is the same as DRF's ``JSONRenderer`` with its default settings,
+compact and not ASCII-escaped, because values orjson would format on its own,
+like dates, go through DRF's encoder.
+"""
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+encoder = JSONEncoder()
+
+
+def dumps(data):
+    """``data`` as UTF-8 encoded JSON bytes."""
+    if orjson is None:
+        content = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+    else:
+        content = orjson.dumps(
+            data, default=encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+        )
+    # Like JSONRenderer, escape the line separators that are invalid in JavaScript strings.
+    if b'\xe2\x80' in content:
+        content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return content
+
+
+class BlogJSONRenderer(JSONRenderer):
+    """``JSONRenderer`` that encodes with ``dumps``, unless indented output is asked for."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
@@ -0,0 +1,139 @@
+"""
+Read replica routing.
+
+Reads of blogs and users go to the replicas in ``BLOG_DATABASE_REPLICAS``,
+an alias to weight mapping, and everything else to the primary ``default``
+database. A request reads from one replica, picked at random by weight among
+those that answered their last health check.
+
+Replicas lag behind the primary, so a client that just wrote reads from the
+primary for ``BLOG_REPLICA_STICKY_SECONDS``: ``ReplicaMiddleware`` sets a
+cookie on responses to requests that wrote, and pins requests carrying it.
+Requests also read from the primary after their own writes and inside
+transactions. Code running outside a request, like management commands, the
+task worker and signal handlers, reads from the primary: it may write what
+it read.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.connection import ConnectionDoesNotExist
+
+# Apps whose reads may be served by a replica.
+REPLICATED_APPS = {'blog', 'auth'}
+
+
+@dataclass
+class RoutingState:
+    pinned: bool = False
+    wrote: bool = False
+    replica: str = None
+
+
+current = ContextVar('blog_routing', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'BLOG_DATABASE_REPLICAS', {})
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'BLOG_REPLICA_STICKY_SECONDS', 10)
+
+
+def get_sticky_cookie():
+    return getattr(settings, 'BLOG_REPLICA_STICKY_COOKIE', 'blog_primary')
+
+
+def start(pinned=False):
+    """Route the current request's reads, to the primary if ``pinned``."""
+    return current.set(RoutingState(pinned=pinned))
+
+
+def finish(token):
+    """Stop routing the current request, return whether it wrote."""
+    state = current.get()
+    current.reset(token)
+    return state is not None and state.wrote
+
+
+class ReplicaHealth:
+    """Per process health of the replicas, checked at most every ``BLOG_REPLICA_CHECK_SECONDS``."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def is_healthy(self, alias):
+        interval = getattr(settings, 'BLOG_REPLICA_CHECK_SECONDS', 30)
+        checked_at, healthy = self.checked.get(alias, (None, False))
+        if checked_at is None or time.monotonic() - checked_at > interval:
+            with self.lock:
+                checked_at, healthy = self.checked.get(alias, (None, False))
+                if checked_at is None or time.monotonic() - checked_at > interval:
+                    healthy = self.check(alias)
+                    self.checked[alias] = (time.monotonic(), healthy)
+        return healthy
+
+    def check(self, alias):
+        # Read the blog table, an empty database would answer a bare SELECT 1.
+        table = apps.get_model('blog', 'Blog')._meta.db_table
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'SELECT 1 FROM {table} LIMIT 1')
+            return True
+        except (ConnectionDoesNotExist, DatabaseError):
+            return False
+
+    def reset(self):
+        self.checked.clear()
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """A healthy replica picked by weight, or the primary if there is none."""
+    replicas = {alias: weight for alias, weight in get_replicas().items() if weight > 0 and health.is_healthy(alias)}
+    if not replicas:
+        return DEFAULT_DB_ALIAS
+    return random.choices(list(replicas), weights=list(replicas.values()))[0]
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if model._meta.app_label not in REPLICATED_APPS or not get_replicas():
+            return DEFAULT_DB_ALIAS
+        state = current.get()
+        if state is None or state.pinned or state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = choose_replica()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current.get()
+        if state is not None and model._meta.app_label in REPLICATED_APPS:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, never migrated on their own.
+        if db in get_replicas():
+            return False
+        return None
@@ -0,0 +1,89 @@
+"""
+The OpenAPI document, generated once per process and served from memory.
+
+drf-yasg's schema views introspect every view and ``swagger_auto_schema``
+on each request. ``get_schema_view`` returns one that keeps each format of the
+document, and its compressed forms, after generating it the first time.
+Responses carry an ``ETag``, so clients polling the document get a 304.
+
+The document only changes with the code, so it is kept until the process
+exits. For a public view it is the same for every user. Otherwise it lists
+just the endpoints the requesting user may use, and is kept per user. Links
+in it start with ``BLOG_SITE_URL`` rather than the host of the request that
+generated it. ``manage.py export_schema`` writes it to files.
+"""
+import gzip
+import hashlib
+
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from drf_yasg import views
+from drf_yasg.renderers import _SpecRenderer
+
+from . import singleflight
+from .feeds import get_site_url
+from .middleware import accepted_encoding, brotli
+
+
+class Document:
+    def __init__(self, content, media_type):
+        self.content = content
+        self.media_type = media_type
+        self.etag = f'W/"{hashlib.sha256(content).hexdigest()[:32]}"'
+        # {encoding: compressed content}, filled as clients ask for them
+        self.encoded = {}
+
+    def encode(self, encoding):
+        if encoding not in self.encoded:
+            if encoding == 'br':
+                self.encoded[encoding] = brotli.compress(self.content)
+            else:
+                self.encoded[encoding] = gzip.compress(self.content, mtime=0)
+        return self.encoded[encoding]
+
+
+def render(schema, renderer):
+    """The document ``schema`` as ``renderer`` encodes it."""
+    return Document(renderer.render(schema, renderer.media_type), renderer.media_type)
+
+
+def get_schema_view(info, **kwargs):
+    """drf-yasg's ``get_schema_view`` with the document kept in memory, see the module docstring."""
+    kwargs.setdefault('url', get_site_url())
+    base = views.get_schema_view(info, **kwargs)
+
+    class CachedSchemaView(base):
+        # {(version, user id or None): schema}, and {(version, user id or None, format): Document}
+        schemas = {}
+        documents = {}
+        builds = singleflight.Group()
+
+        def get(self, request, version='', format=None):
+            renderer = request.accepted_renderer
+            # The UI pages load the document from their own URL and cost little.
+            if not isinstance(renderer, _SpecRenderer):
+                return super().get(request, version, format)
+
+            key = (request.version or version or '', None if self.public else request.user.pk)
+            document = self.documents.get((*key, renderer.format))
+            if document is None:
+                schema = self.schemas.get(key)
+                if schema is None:
+                    schema = self.schemas[key] = self.builds.do(key, lambda: super(CachedSchemaView, self).get(
+                        request, version, format).data)
+                document = self.documents[(*key, renderer.format)] = render(schema, renderer)
+
+            response = get_conditional_response(request, etag=document.etag)
+            if response is None:
+                encoding = accepted_encoding(request.headers.get('Accept-Encoding', ''))
+                content = document.encode(encoding) if encoding else document.content
+                response = HttpResponse(content, content_type=f'{document.media_type}; charset=utf-8')
+                if encoding:
+                    response.headers['Content-Encoding'] = encoding
+            response.headers['ETag'] = document.etag
+            patch_vary_headers(response, ('Accept-Encoding',) if self.public else ('Accept-Encoding', 'Authorization'))
+            # Cached anywhere when public, and always revalidated with the ETag.
+            patch_cache_control(response, no_cache=True, **({'public': True} if self.public else {'private': True}))
+            return response
+
+    return CachedSchemaView
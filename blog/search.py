@@ -0,0 +1,270 @@
+"""
+Full-text search over blog titles, bodies, tag names and author names.
+
+The index lives in its own table next to ``blog_blog`` and is kept in sync by
+the signal handlers in ``blog.signals``. On SQLite it is an FTS5 virtual table,
+on PostgreSQL a ``tsvector`` column with a GIN index. Other databases fall
+back to ``icontains`` lookups without an index.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from . import tasks
+from .models import Blog
+
+TABLE = 'blog_search'
+
+# Searchable columns, in the order they are stored in the index.
+FIELDS = ('title', 'context', 'tags', 'author')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query or '')
+
+
+def document(blog):
+    """Text of each searchable column for ``blog``."""
+    author = blog.author
+    return {
+        'title': blog.title,
+        'context': blog.context,
+        'tags': ' '.join(blog.tag_names),
+        'author': ' '.join(filter(None, [author.username, author.first_name, author.last_name])),
+    }
+
+
+class SearchBackend:
+    """
+    Base class for the search index of one database connection. On databases
+    without full-text support there is no index, and ``filter`` falls back to
+    unindexed ``icontains`` lookups.
+    """
+    lookups = {
+        'title': ['title'],
+        'context': ['context'],
+        'tags': ['tags__name'],
+        'author': ['author__username', 'author__first_name', 'author__last_name'],
+    }
+
+    def __init__(self, using):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def create_index(self):
+        pass
+
+    def drop_index(self):
+        pass
+
+    def index_blogs(self, blogs):
+        pass
+
+    def remove_blogs(self, blog_ids):
+        pass
+
+    def filter(self, queryset, query, fields=None):
+        """Restrict ``queryset`` to blogs matching every token of ``query``."""
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        for token in tokens:
+            condition = Q()
+            for field in fields or FIELDS:
+                for lookup in self.lookups[field]:
+                    condition |= Q(**{f'{lookup}__icontains': token})
+            queryset = queryset.filter(id__in=Blog.objects.filter(condition).values('id'))
+        return queryset
+
+    def rank(self, queryset, query):
+        """Annotate ``queryset`` with a ``rank`` where higher is more relevant."""
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 virtual table keyed by the blog id as ``rowid``."""
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+                f"{', '.join(FIELDS)}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def index_blogs(self, blogs):
+        rows = []
+        for blog in blogs:
+            text = document(blog)
+            rows.append([blog.pk] + [text[field] for field in FIELDS])
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [[row[0]] for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, {', '.join(FIELDS)}) VALUES (%s, %s, %s, %s, %s)", rows
+            )
+
+    def remove_blogs(self, blog_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {TABLE} WHERE rowid = %s", [[pk] for pk in blog_ids])
+
+    def match_expression(self, query, fields=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        expression = ' '.join(f'"{token}"*' for token in tokens)
+        if fields:
+            expression = f"{{{' '.join(fields)}}} : ({expression})"
+        return expression
+
+    def filter(self, queryset, query, fields=None):
+        expression = self.match_expression(query, fields)
+        if expression is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s", [expression]))
+
+    def rank(self, queryset, query):
+        # bm25() is lower for better matches, negate it so higher is better.
+        # Evaluated per blog, a MATCH restricted to the blog's rowid still
+        # reads every matching document, so rank all matches once in a
+        # materialized CTE and look the blog up in it.
+        materialized = 'MATERIALIZED' if self.connection.Database.sqlite_version_info >= (3, 35) else ''
+        return queryset.annotate(rank=RawSQL(
+            f"WITH ranks AS {materialized} (SELECT rowid AS id, -bm25({TABLE}) AS rank FROM {TABLE} "
+            f"WHERE {TABLE} MATCH %s) SELECT rank FROM ranks WHERE ranks.id = blog_blog.id",
+            [self.match_expression(query)],
+            output_field=FloatField(),
+        ))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """``tsvector`` column with a GIN index, one row per blog."""
+    config = 'simple'
+    weights = {'title': 'A', 'tags': 'B', 'author': 'C', 'context': 'D'}
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+                f"blog_id bigint PRIMARY KEY REFERENCES blog_blog (id) ON DELETE CASCADE, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING GIN (document)")
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def index_blogs(self, blogs):
+        vector = ' || '.join(
+            f"setweight(to_tsvector('{self.config}', %s), '{self.weights[field]}')" for field in FIELDS
+        )
+        rows = []
+        for blog in blogs:
+            text = document(blog)
+            rows.append([blog.pk] + [text[field] for field in FIELDS])
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (blog_id, document) VALUES (%s, {vector}) "
+                f"ON CONFLICT (blog_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+    def remove_blogs(self, blog_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE} WHERE blog_id = ANY(%s)", [list(blog_ids)])
+
+    def tsquery(self, query, fields=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        weights = ''.join(self.weights[field] for field in fields or ())
+        return ' & '.join(f"{token}:*{weights}" for token in tokens)
+
+    def filter(self, queryset, query, fields=None):
+        tsquery = self.tsquery(query, fields)
+        if tsquery is None:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT blog_id FROM {TABLE} WHERE document @@ to_tsquery('{self.config}', %s)", [tsquery]
+        ))
+
+    def rank(self, queryset, query):
+        return queryset.annotate(rank=RawSQL(
+            f"SELECT ts_rank(document, to_tsquery('{self.config}', %s)) FROM {TABLE} WHERE blog_id = blog_blog.id",
+            [self.tsquery(query)],
+            output_field=FloatField(),
+        ))
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    vendor = connections[using].vendor
+    return BACKENDS.get(vendor, SearchBackend)(using)
+
+
+def search_blogs(queryset, query):
+    """Blogs in ``queryset`` matching ``query``, annotated with ``rank``."""
+    backend = get_backend(queryset.db)
+    return backend.rank(backend.filter(queryset, query), query)
+
+
+def filter_blogs(queryset, query, fields):
+    """Blogs in ``queryset`` whose ``fields`` match every token of ``query``."""
+    return get_backend(queryset.db).filter(queryset, query, fields)
+
+
+def index_blogs(blog_ids, using='default'):
+    blogs = Blog.objects.using(using).filter(id__in=blog_ids).with_related()
+    get_backend(using).index_blogs(blogs)
+
+
+def remove_blogs(blog_ids, using='default'):
+    get_backend(using).remove_blogs(blog_ids)
+
+
+@tasks.task('search.sync')
+def sync_blogs(keys, using='default'):
+    """Index the blogs of ``keys`` that exist and remove the others from the index."""
+    blog_ids = {int(key) for key in keys}
+    existing = set(Blog.objects.using(using).filter(id__in=blog_ids).values_list('id', flat=True))
+    if existing:
+        index_blogs(existing, using)
+    if blog_ids - existing:
+        remove_blogs(blog_ids - existing, using)
+
+
+def rebuild_index(using='default', batch_size=1000):
+    """Drop and refill the whole index, ``batch_size`` blogs at a time."""
+    backend = get_backend(using)
+    backend.drop_index()
+    backend.create_index()
+
+    indexed = 0
+    batch = []
+    for blog in Blog.objects.using(using).with_related().order_by('id').iterator(chunk_size=batch_size):
+        batch.append(blog)
+        if len(batch) >= batch_size:
+            backend.index_blogs(batch)
+            indexed += len(batch)
+            batch = []
+    backend.index_blogs(batch)
+    return indexed + len(batch)
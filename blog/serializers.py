@@ -1,28 +1,120 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Blog, Tag
 
+# Columns read for BlogSerializer's fields by serialize_rows()
+BLOG_VALUES = ('id', 'title', 'context', 'author_id', 'tag_names', 'published_date', 'version')
+# Summary lists send the stored excerpt instead of the body, which is not even loaded
+SUMMARY_VALUES = ('id', 'title', 'excerpt', 'author_id', 'tag_names', 'published_date', 'version')
+LIST_VIEWS = {'full': BLOG_VALUES, 'summary': SUMMARY_VALUES}
+
 class BlogSerializer(serializers.ModelSerializer):
     class Meta:
         model = Blog
-        fields = ['id', 'title', 'context', 'author', 'tags', 'published_date']
+        fields = ['id', 'title', 'context', 'author', 'tags', 'published_date', 'version']
+        read_only_fields = ['version']
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        representation['tags'] = [tag.name for tag in instance.tags.all()]
+        representation['tags'] = instance.tag_names
         return representation
 
 
+def blog_rows(queryset, *fields, view='full'):
+    """``queryset`` as the ``values()`` rows ``serialize_rows`` takes for ``view``, with ``fields`` added."""
+    values = LIST_VIEWS[view]
+    fields = [field for field in fields if field not in values]
+    return queryset.select_related(None).prefetch_related(None).values(*values, *fields)
+
+
+def datetime_representation():
+    """``DateTimeField().to_representation``, sped up for its default ISO 8601 output."""
+    field = serializers.DateTimeField()
+    timezone = field.default_timezone()
+    if api_settings.DATETIME_FORMAT.lower() != ISO_8601 or timezone is None:
+        return field.to_representation
+
+    def to_representation(value):
+        value = value.astimezone(timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return to_representation
+
+
+def serialize_rows(rows, view='full'):
+    """
+    What ``BlogSerializer(many=True)`` outputs for the blogs of ``blog_rows()``
+    rows, built as plain dicts from the rows alone. Read-only, for list and
+    detail responses. Summary rows have an ``excerpt`` instead of ``context``.
+    """
+    to_datetime = datetime_representation()
+    text = 'excerpt' if view == 'summary' else 'context'
+    return [
+        {
+            'id': row['id'],
+            'title': row['title'],
+            text: row[text],
+            'author': row['author_id'],
+            'tags': row['tag_names'],
+            'published_date': to_datetime(row['published_date']),
+            'version': row['version'],
+        }
+        for row in rows
+    ]
+
+
+class BlogUpdateSerializer(BlogSerializer):
+    # The version the edit is based on, the update fails if the blog has changed since
+    version = serializers.IntegerField(required=False, min_value=1)
+
+
+class BlogPageSerializer(serializers.Serializer):
+    # Only used to document the paginated list response
+    next = serializers.URLField(allow_null=True)
+    results = BlogSerializer(many=True)
+
+
+class AuthorMonthSerializer(serializers.Serializer):
+    month = serializers.DateField(format='%Y-%m')
+    count = serializers.IntegerField()
+
+
+class AuthorTagSerializer(serializers.Serializer):
+    id = serializers.IntegerField(source='tag_id')
+    name = serializers.CharField(source='tag.name')
+    count = serializers.IntegerField()
+
+
+class AuthorStatsSerializer(serializers.Serializer):
+    """An author's post counts, read from the counters kept by ``blog.facets``."""
+    count = serializers.IntegerField()
+    latest_published = serializers.DateTimeField(allow_null=True)
+    months = AuthorMonthSerializer(many=True)
+    tags = AuthorTagSerializer(many=True)
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ['id', 'name']
 
 
+class NameListField(serializers.CharField):
+    """Comma-separated names, as a list."""
+
+    def to_internal_value(self, data):
+        names = [name.strip() for name in super().to_internal_value(data).split(',')]
+        return list(dict.fromkeys(name for name in names if name))
+
+
 class BlogFilterSerializer(serializers.Serializer):
     start_date = serializers.DateField(required=False)
     end_date = serializers.DateField(required=False)
     tag = serializers.CharField(required=False)
+    tags = NameListField(required=False)
+    tags_all = NameListField(required=False)
+    view = serializers.ChoiceField(choices=list(LIST_VIEWS), default='full')
     user = serializers.CharField(required=False)
+    q = serializers.CharField(required=False)
 
     # check if start_date is less than end_date
     def validate(self, data):
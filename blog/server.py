@@ -0,0 +1,283 @@
+"""
+Pre-fork WSGI server behind ``manage.py serve``.
+
+The arbiter imports the project, warms it (URL resolvers, templates, and a
+GET of each ``BLOG_WARMUP_URLS`` path through the full middleware stack,
+which builds the swagger schema among others), then forks workers that share
+its listening socket. Workers start with everything the warm-up compiled and
+serve one request per connection. Put a reverse proxy in front of them to
+buffer slow clients.
+
+A worker exits after its request limit or once its resident memory passes the
+ceiling, finishing the request in hand, and the arbiter forks a new one.
+``SIGHUP`` replaces every worker this way, ``SIGTERM`` and ``SIGINT`` stop
+the server once the workers are done with their requests, and workers still
+busy after the graceful timeout are killed.
+"""
+import errno
+import io
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.servers.basehttp import WSGIRequestHandler, WSGIServer
+from django.db import connections
+from django.urls import get_resolver
+
+from . import metrics, throttling
+
+logger = logging.getLogger('blog.server')
+
+WARMUP_URLS = ['/', '/api/blogs/', '/swagger.json']
+
+
+def get_warmup_urls():
+    return getattr(settings, 'BLOG_WARMUP_URLS', WARMUP_URLS)
+
+
+def get_warmup_host():
+    """A host the project accepts, for the Host header of warm-up requests."""
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+def get_rss():
+    """Resident memory of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+
+        # Peak rather than current memory where /proc is missing, in KiB on Linux and bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def warm(application, urls=None, host=None):
+    """
+    Load what workers would otherwise load on their first requests, returning
+    ``{step: seconds}``. Requests that fail are logged, they only warm less.
+    """
+    timings = {}
+
+    started = time.perf_counter()
+    resolver = get_resolver()
+    resolver.reverse_dict, resolver.namespace_dict, resolver.app_dict
+    timings['urls'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    apps.get_app_config('blog').warm_templates()
+    timings['templates'] = time.perf_counter() - started
+
+    host = host or get_warmup_host()
+    for url in get_warmup_urls() if urls is None else urls:
+        started = time.perf_counter()
+        status = request(application, url, host)
+        timings[url] = time.perf_counter() - started
+        if status >= 400:
+            logger.warning("Warm-up request to %s answered %s.", url, status)
+
+    # Nothing of the warm-up belongs to the workers' own counts, and they must
+    # open their own database connections.
+    metrics.registry.reset()
+    throttling.stores.clear()
+    connections.close_all()
+    return timings
+
+
+def request(application, url, host):
+    """GET ``url`` from the WSGI application in process, returning the status code."""
+    path, _, query = url.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host, 'REMOTE_ADDR': '127.0.0.1',
+        'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': False, 'wsgi.multiprocess': True,
+        'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+    status = []
+    body = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        for _ in body:
+            pass
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+    return int(status[0].split()[0])
+
+
+class WorkerServer(WSGIServer):
+    """``WSGIServer`` on an inherited listening socket, counting the requests it handled."""
+    # handle_request() returns this often without a request, to notice signals.
+    timeout = 1
+
+    def __init__(self, listener, server_name, application):
+        super().__init__(
+            listener.getsockname()[:2], WSGIRequestHandler,
+            ipv6=listener.family == socket.AF_INET6, bind_and_activate=False,
+        )
+        self.socket.close()
+        self.socket = listener
+        self.server_name, self.server_port = server_name, listener.getsockname()[1]
+        self.setup_environ()
+        self.set_app(application)
+        self.requests = 0
+
+    def process_request(self, request, client_address):
+        self.requests += 1
+        super().process_request(request, client_address)
+
+
+class Arbiter:
+    SIGNALS = (signal.SIGCHLD, signal.SIGHUP, signal.SIGTERM, signal.SIGINT)
+
+    def __init__(self, application, host, port, workers, max_requests=0, max_requests_jitter=0,
+                 max_memory=0, graceful_timeout=30):
+        self.application = application
+        self.address = (host, port)
+        self.worker_count = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_memory = max_memory
+        self.graceful_timeout = graceful_timeout
+        # {pid: time it was asked to stop, or None}
+        self.workers = {}
+        self.stopping_at = None
+
+    def listen(self):
+        host, port = self.address
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.listener = socket.create_server((host, port), family=family, backlog=2048)
+        # Every worker is woken for a connection, those that lose the race to
+        # accept it must not block.
+        self.listener.setblocking(False)
+        self.server_name = socket.getfqdn(host)
+        self.address = self.listener.getsockname()[:2]
+        return self.address
+
+    def run(self):
+        """Serve until stopped. ``listen()`` must have been called."""
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_read, False)
+        os.set_blocking(wakeup_write, False)
+        self.wakeup = (wakeup_read, wakeup_write)
+        # Handlers do nothing themselves, the signal numbers are read from the pipe.
+        signal.set_wakeup_fd(wakeup_write)
+        for signum in self.SIGNALS:
+            signal.signal(signum, lambda *args: None)
+
+        logger.info("Listening on %s:%s with %s workers.", *self.address, self.worker_count)
+        try:
+            self.spawn_workers()
+            while self.workers or self.stopping_at is None:
+                select.select([wakeup_read], [], [], 1.0)
+                for signum in self.read_signals():
+                    self.handle_signal(signum)
+                self.reap_workers()
+                self.kill_late_workers()
+                if self.stopping_at is None:
+                    self.spawn_workers()
+        finally:
+            signal.set_wakeup_fd(-1)
+            os.close(wakeup_read)
+            os.close(wakeup_write)
+            self.listener.close()
+        logger.info("Stopped.")
+
+    def read_signals(self):
+        try:
+            return os.read(self.wakeup[0], 64)
+        except BlockingIOError:
+            return b''
+
+    def handle_signal(self, signum):
+        if signum == signal.SIGHUP:
+            logger.info("Replacing workers.")
+            for pid in list(self.workers):
+                self.stop_worker(pid)
+            self.spawn_workers()
+        elif signum in (signal.SIGTERM, signal.SIGINT) and self.stopping_at is None:
+            logger.info("Stopping, waiting up to %ss for workers.", self.graceful_timeout)
+            self.stopping_at = time.monotonic()
+            for pid in list(self.workers):
+                self.stop_worker(pid)
+
+    def stop_worker(self, pid):
+        if self.workers.get(pid) is None:
+            self.workers[pid] = time.monotonic()
+            self.kill(pid, signal.SIGTERM)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def kill_late_workers(self):
+        now = time.monotonic()
+        for pid, stopped_at in list(self.workers.items()):
+            if stopped_at is not None and now - stopped_at > self.graceful_timeout:
+                logger.warning("Worker %s did not stop in time, killing it.", pid)
+                self.kill(pid, signal.SIGKILL)
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            self.workers.pop(pid, None)
+            code = os.waitstatus_to_exitcode(status)
+            if code:
+                logger.warning("Worker %s exited with %s.", pid, code)
+
+    def spawn_workers(self):
+        while sum(stopped_at is None for stopped_at in self.workers.values()) < self.worker_count:
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    code = self.work()
+                except BaseException:
+                    logger.exception("Worker %s failed.", os.getpid())
+                finally:
+                    os._exit(code)
+            self.workers[pid] = None
+
+    def work(self):
+        """Serve requests in a forked worker until it is stopped or due for recycling."""
+        signal.set_wakeup_fd(-1)
+        os.close(self.wakeup[0])
+        os.close(self.wakeup[1])
+        stopping = []
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: stopping.append(True))
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+        limit = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else None
+        server = WorkerServer(self.listener, self.server_name, self.application)
+        while not stopping:
+            try:
+                server.handle_request()
+            except OSError as exc:
+                if exc.errno != errno.EINTR:
+                    raise
+            if limit is not None and server.requests >= limit:
+                logger.info("Worker %s served %s requests, recycling it.", os.getpid(), server.requests)
+                break
+            if self.max_memory and get_rss() > self.max_memory:
+                logger.info("Worker %s uses %s bytes, recycling it.", os.getpid(), get_rss())
+                break
+        connections.close_all()
+        return 0
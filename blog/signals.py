@@ -0,0 +1,151 @@
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+
+from . import cache, facets, feeds, search, tag_lists, tasks
+from .models import Blog, Tag
+
+# Changing any of these on a user changes the author text of their blogs.
+AUTHOR_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def blogs_changed(blog_ids, using, feed_keys=()):
+    """
+    Bring everything derived from these blogs up to date. ``feed_keys`` adds
+    feeds the blogs just left, which they can no longer be found in.
+    """
+    if not blog_ids:
+        return
+    tasks.enqueue_on_commit('search.sync', blog_ids, using=using)
+    cache.invalidate_on_commit(blog_ids, using=using)
+    feeds.build_on_commit(feeds.feeds_of(blog_ids, using) | set(feed_keys), using=using)
+
+
+def bump_versions(blog_ids, using):
+    """
+    Bump the versions of blogs whose tags or author text changed without a save
+    of their rows, for the ETags built from them (see ``blog.cache``).
+    """
+    if blog_ids:
+        Blog.objects.using(using).filter(pk__in=blog_ids).update(version=F('version') + 1)
+
+
+def blog_saving(sender, instance, using, update_fields, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'author' not in update_fields):
+        return
+    instance._old_author_id = (
+        Blog.objects.using(using).filter(pk=instance.pk).values_list('author_id', flat=True).first()
+    )
+
+
+def blog_saved(sender, instance, created, using, **kwargs):
+    feed_keys = []
+    if created:
+        facets.blog_added(instance, using)
+        feed_keys = feeds.sitemaps_of([instance.pk])
+    else:
+        old_author_id = instance.__dict__.pop('_old_author_id', None)
+        if old_author_id is not None and old_author_id != instance.author_id:
+            facets.author_changed(instance, old_author_id, using)
+            feed_keys = [feeds.author_feed(old_author_id)]
+    blogs_changed([instance.pk], using, feed_keys)
+
+
+def blog_deleting(sender, instance, using, **kwargs):
+    # The tag links are deleted with the blog without an m2m_changed signal.
+    instance._deleted_tag_ids = list(instance.tags.using(using).values_list('id', flat=True))
+
+
+def blog_deleted(sender, instance, using, **kwargs):
+    tag_ids = instance.__dict__.pop('_deleted_tag_ids', [])
+    facets.blog_removed(instance, tag_ids, using)
+    tasks.enqueue_on_commit('search.sync', [instance.pk], using=using)
+    cache.invalidate_on_commit([instance.pk], using=using)
+    feeds.build_on_commit(
+        {feeds.SITE_FEED, feeds.author_feed(instance.author_id), *map(feeds.tag_feed, tag_ids),
+         *feeds.sitemaps_of([instance.pk])},
+        using=using,
+    )
+
+
+def blog_tags_changed(sender, instance, action, reverse, pk_set, using, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # Only the links that exist now are really removed, find them before they go.
+        links = sender.objects.using(using).filter(**{'tag_id' if reverse else 'blog_id': instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{'blog_id__in' if reverse else 'tag_id__in': pk_set})
+        instance._removed_tag_links = list(links.values_list('blog_id', 'tag_id'))
+        return
+
+    if action == 'post_add':
+        # pk_set only holds the links that were missing and got inserted.
+        links = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]
+        facets.tags_changed(links, 1, using, None if reverse else {instance.pk: instance.author_id})
+    elif action in ('post_remove', 'post_clear'):
+        links = instance.__dict__.pop('_removed_tag_links', [])
+        facets.tags_changed(links, -1, using, None if reverse else {instance.pk: instance.author_id})
+    else:
+        return
+    blog_ids = sorted({blog_id for blog_id, _ in links})
+    tag_lists.sync(blog_ids, using, instances=[] if reverse else [instance])
+    if reverse:
+        # Edits of a blog's own tags bump its version in update_blog() or save().
+        bump_versions(blog_ids, using)
+    blogs_changed(blog_ids, using, {feeds.tag_feed(tag_id) for _, tag_id in links})
+
+
+def author_saving(sender, instance, using, update_fields, **kwargs):
+    if instance._state.adding or (update_fields is not None and not AUTHOR_FIELDS.intersection(update_fields)):
+        return
+    instance._old_author_names = (
+        User.objects.using(using).filter(pk=instance.pk).values(*AUTHOR_FIELDS).first()
+    )
+
+
+def author_saved(sender, instance, created, using, **kwargs):
+    # Saves of the password, last_login and the like leave the blogs alone.
+    old_names = instance.__dict__.pop('_old_author_names', None)
+    if created or old_names is None or all(getattr(instance, name) == value for name, value in old_names.items()):
+        return
+    blog_ids = list(Blog.objects.using(using).filter(author=instance).values_list('id', flat=True))
+    bump_versions(blog_ids, using)
+    blogs_changed(blog_ids, using)
+
+
+def tag_saved(sender, instance, created, using, **kwargs):
+    if created:
+        return
+    blog_ids = list(instance.tags.using(using).values_list('id', flat=True))
+    tag_lists.sync(blog_ids, using)
+    bump_versions(blog_ids, using)
+    blogs_changed(blog_ids, using)
+
+
+def tag_deleted(sender, instance, using, **kwargs):
+    # Through rows are removed without m2m_changed, update the blogs after the delete.
+    instance._deleted_blog_ids = list(instance.tags.using(using).values_list('id', flat=True))
+
+
+def tag_removed(sender, instance, using, **kwargs):
+    blog_ids = getattr(instance, '_deleted_blog_ids', [])
+    tag_lists.sync(blog_ids, using)
+    bump_versions(blog_ids, using)
+    blogs_changed(blog_ids, using, [feeds.tag_feed(instance.pk)])
+
+
+def create_search_index(sender, using, **kwargs):
+    search.get_backend(using).create_index()
+    tag_lists.create_indexes(using)
+
+
+def connect():
+    pre_save.connect(blog_saving, sender=Blog, dispatch_uid='blog_blog_saving')
+    post_save.connect(blog_saved, sender=Blog, dispatch_uid='blog_blog_saved')
+    pre_delete.connect(blog_deleting, sender=Blog, dispatch_uid='blog_blog_deleting')
+    post_delete.connect(blog_deleted, sender=Blog, dispatch_uid='blog_blog_deleted')
+    m2m_changed.connect(blog_tags_changed, sender=Blog.tags.through, dispatch_uid='blog_tags_changed')
+    pre_save.connect(author_saving, sender=User, dispatch_uid='blog_author_saving')
+    post_save.connect(author_saved, sender=User, dispatch_uid='blog_author_saved')
+    post_save.connect(tag_saved, sender=Tag, dispatch_uid='blog_tag_saved')
+    pre_delete.connect(tag_deleted, sender=Tag, dispatch_uid='blog_tag_deleted')
+    post_delete.connect(tag_removed, sender=Tag, dispatch_uid='blog_tag_removed')
@@ -0,0 +1,77 @@
+"""
+Request coalescing: concurrent calls with the same key share one execution.
+
+The first caller of ``group.do(key, func)`` runs ``func`` and every caller
+that arrives with the same key while it runs waits for, and gets, the same
+result or exception. Nothing is kept once the call finishes, so unlike a cache
+a later call always runs again and never sees stale data.
+"""
+import asyncio
+import threading
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = func()
+            except BaseException as exc:
+                call.error = exc
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class AsyncGroup:
+    """``Group`` for coroutines, ``func`` is a coroutine function."""
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, func):
+        # Futures belong to one event loop, keep the calls of each loop apart.
+        key = (id(asyncio.get_running_loop()), key)
+        future = self.calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self.calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Retrieved here so a call nobody waited for is not reported.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
@@ -0,0 +1,97 @@
+"""
+Copies of each blog's tags on the blog row, in ``Blog.tag_ids`` and
+``Blog.tag_names``.
+
+They let lists render tag names and filter by tag without joining the
+``blog_blog_tags`` table, which also returns a row per matching tag. The
+signal handlers in ``blog.signals`` rewrite the lists of the blogs whose tag
+links change or whose tags are renamed or deleted. ``check`` and ``rebuild``
+compare the copies with the links and repair them.
+
+On PostgreSQL both columns get a GIN index for ``has_any`` and ``has_all``.
+Other databases scan the arrays of the rows they read, which is cheap for
+paging through the newest blogs of a tag that is in use.
+"""
+from itertools import islice
+
+from django.db import connections
+
+from .models import Blog
+
+BATCH_SIZE = 500
+
+INDEXES = {
+    'blog_tag_ids_gin': 'tag_ids',
+    'blog_tag_names_gin': 'tag_names',
+}
+
+
+def create_indexes(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for name, column in INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON blog_blog USING gin ({column} jsonb_path_ops)')
+
+
+def batches(items, size=BATCH_SIZE):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def tag_lists(blog_ids, using='default'):
+    """``{blog id: (tag ids, tag names)}`` of the blogs, read from their tag links."""
+    lists = {pk: ([], []) for pk in blog_ids}
+    links = (
+        Blog.tags.through.objects.using(using).filter(blog_id__in=lists)
+        .order_by('tag__name').values_list('blog_id', 'tag_id', 'tag__name')
+    )
+    for blog_id, tag_id, name in links:
+        ids, names = lists[blog_id]
+        ids.append(tag_id)
+        names.append(name)
+    return {pk: (sorted(ids), names) for pk, (ids, names) in lists.items()}
+
+
+def sync(blog_ids, using='default', instances=()):
+    """Rewrite the tag lists of the blogs, and of ``instances`` of them in memory."""
+    instances = {blog.pk: blog for blog in instances}
+    for batch in batches(sorted(set(blog_ids))):
+        blogs = []
+        for pk, (ids, names) in tag_lists(batch, using).items():
+            blog = instances.get(pk) or Blog(pk=pk)
+            blog.tag_ids, blog.tag_names = ids, names
+            blogs.append(blog)
+        Blog.objects.using(using).bulk_update(blogs, ['tag_ids', 'tag_names'])
+
+
+def stale_batches(using='default', batch_size=BATCH_SIZE):
+    """
+    Yield the ids of blogs whose tag lists differ from their tag links, a
+    batch at a time. Each batch of blogs is read in full, with a query that
+    starts after the last id of the one before, so no cursor is left open
+    while the caller rewrites the lists.
+    """
+    blogs = Blog.objects.using(using).order_by('id').values_list('id', 'tag_ids', 'tag_names')
+    last_id = 0
+    while batch := list(blogs.filter(id__gt=last_id)[:batch_size]):
+        last_id = batch[-1][0]
+        expected = tag_lists([pk for pk, _, _ in batch], using)
+        yield [pk for pk, ids, names in batch if (ids, names) != expected[pk]]
+
+
+def check(using='default', batch_size=BATCH_SIZE):
+    """Yield the ids of blogs whose tag lists differ from their tag links."""
+    for stale in stale_batches(using, batch_size):
+        yield from stale
+
+
+def rebuild(using='default', batch_size=BATCH_SIZE):
+    """Rewrite the tag lists that are out of date, returning how many were."""
+    count = 0
+    for stale in stale_batches(using, batch_size):
+        sync(stale, using)
+        count += len(stale)
+    return count
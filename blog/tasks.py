@@ -0,0 +1,145 @@
+"""
+A task queue in the database for work that can follow a write, like search
+indexing.
+
+Handlers are registered with ``@task(name)`` and take a list of keys, so the
+``run_tasks`` worker hands each of them many tasks at once. A task waiting to
+run is not queued again, repeated changes to a blog before the worker gets to
+it cost a single run. Failed tasks are retried with exponential backoff, up to
+``BLOG_TASK_MAX_ATTEMPTS`` times.
+
+With ``BLOG_TASKS_EAGER`` tasks run in process instead, when the transaction
+that queued them commits.
+"""
+import logging
+import traceback
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+from .utils import write_transaction
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Handler:
+    func: Callable[..., Any]
+    batch_size: int
+
+
+registry = {}
+
+
+def task(name, batch_size=500):
+    """Register the decorated ``func(keys, using)`` to run the tasks called ``name``."""
+    def register(func):
+        registry[name] = Handler(func, batch_size)
+        return func
+    return register
+
+
+def is_eager():
+    return getattr(settings, 'BLOG_TASKS_EAGER', False)
+
+
+def enqueue(name, keys, using='default', delay=None):
+    """
+    Queue task ``name`` for each of ``keys``, within the current transaction.
+    Keys already waiting to run are left as they are.
+    """
+    run_after = timezone.now() + (delay or timedelta())
+    Task.objects.using(using).bulk_create(
+        [Task(name=name, key=str(key), run_after=run_after) for key in dict.fromkeys(keys)], ignore_conflicts=True,
+    )
+
+
+def enqueue_on_commit(name, keys, using='default'):
+    """Queue task ``name`` for each of ``keys`` once the current transaction commits."""
+    keys = [str(key) for key in keys]
+    if not keys:
+        return
+    if is_eager():
+        transaction.on_commit(lambda: run(name, keys, using), using=using)
+    else:
+        transaction.on_commit(lambda: enqueue(name, keys, using), using=using)
+
+
+def run(name, keys, using='default'):
+    registry[name].func(list(dict.fromkeys(keys)), using)
+
+
+def claim(limit, using='default'):
+    """
+    Lock up to ``limit`` tasks that are due for this worker, for
+    ``BLOG_TASK_LEASE_SECONDS``. Tasks whose worker died are due again when
+    their lease runs out.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'BLOG_TASK_LEASE_SECONDS', 300))
+    with write_transaction(using):
+        due = (
+            Task.objects.using(using)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now), failed_at__isnull=True, run_after__lte=now)
+            .order_by('run_after', 'id')
+        )
+        if connections[using].features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        tasks = list(due.values_list('id', 'name')[:limit])
+        Task.objects.using(using).filter(id__in=[pk for pk, _ in tasks]).update(locked_until=now + lease)
+    return tasks
+
+
+def run_batch(name, task_ids, using='default'):
+    """
+    Run claimed tasks of one handler together and return how many succeeded
+    and failed. Succeeded tasks are deleted, failed ones are retried later.
+    """
+    tasks = list(Task.objects.using(using).filter(id__in=task_ids))
+    try:
+        run(name, [task.key for task in tasks], using)
+    except Exception:
+        logger.exception("Task %s failed for %d keys", name, len(tasks))
+        retry(tasks, traceback.format_exc(), using)
+        return 0, len(tasks)
+    Task.objects.using(using).filter(id__in=task_ids).delete()
+    return len(tasks), 0
+
+
+def retry(tasks, error, using='default'):
+    max_attempts = getattr(settings, 'BLOG_TASK_MAX_ATTEMPTS', 5)
+    base_delay = getattr(settings, 'BLOG_TASK_RETRY_DELAY', 10)
+    now = timezone.now()
+    for task in tasks:
+        task.attempts += 1
+        task.last_error = error
+        task.locked_until = None
+        if task.attempts >= max_attempts:
+            task.failed_at = now
+        else:
+            # 10s, 20s, 40s... at most an hour
+            task.run_after = now + timedelta(seconds=min(base_delay * 2 ** (task.attempts - 1), 3600))
+        try:
+            with transaction.atomic(using=using):
+                task.save(using=using, update_fields=['attempts', 'last_error', 'locked_until', 'failed_at', 'run_after'])
+        except IntegrityError:
+            # The same task was queued again meanwhile, that one will do.
+            Task.objects.using(using).filter(pk=task.pk).delete()
+
+
+def batches(tasks, batch_size):
+    """Split claimed ``(id, name)`` pairs into ``(name, ids)`` batches of one handler."""
+    ids_by_name = {}
+    for pk, name in tasks:
+        ids_by_name.setdefault(name, []).append(pk)
+    for name, ids in ids_by_name.items():
+        size = min(batch_size, registry[name].batch_size) if name in registry else batch_size
+        for start in range(0, len(ids), size):
+            yield name, ids[start:start + size]
@@ -1,3 +1,1027 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import json
+import tempfile
+import threading
+import time
+from datetime import datetime
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.servers.basehttp import get_internal_wsgi_application
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from . import bulk, facets, metrics, routers, search, server, singleflight, tag_lists, tasks, throttling
+from .authentication import blacklist
+from .models import EXCERPT_LENGTH, AuthorFacet, AuthorMonthFacet, AuthorTagFacet, Blog, Tag, Task
+from .renderers import BlogJSONRenderer
+from .search import search_blogs
+from .serializers import BlogSerializer, blog_rows, serialize_rows
+from .utils import update_blog, write_transaction
+from .views import BlogAPIView, BlogDetailAPIView
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Base class for asserting that an endpoint issues a fixed number of queries.
+
+    ``assertQueryBudget`` calls the endpoint with a small and a larger data set
+    and fails if the query count exceeds the budget or grows with the number of
+    rows, which is how N+1 regressions show up.
+    """
+    row_counts = (2, 12)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', first_name='Ada', last_name='Lovelace')
+        cls.tags = [Tag.objects.create(name=f'tag{i}') for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def create_blogs(self, count):
+        for i in range(count):
+            author = User.objects.create(username=f'user{Blog.objects.count()}') if i % 2 else self.author
+            blog = Blog.objects.create(title=f'Blog {i}', context='Some text', author=author)
+            blog.tags.set(self.tags)
+            self.last_blog = blog
+
+    def assertQueryBudget(self, budget, request):
+        """Run ``request()`` at each row count and check its query count."""
+        counts = []
+        created = 0
+        for row_count in self.row_counts:
+            self.create_blogs(row_count - created)
+            created = row_count
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 400)
+            counts.append(len(queries))
+
+        self.assertEqual(len(set(counts)), 1, f'Query count grows with the number of rows: {counts}')
+        self.assertLessEqual(counts[0], budget, f'{counts[0]} queries exceeds the budget of {budget}')
+
+
+class BlogAPIQueryBudgetTests(QueryBudgetTestCase):
+    def test_list(self):
+        self.assertQueryBudget(2, lambda: self.client.get(reverse('api-blogs')))
+
+    def test_list_with_filters(self):
+        url = reverse('api-blogs') + '?tag=tag&user=a&start_date=2000-01-01'
+        self.assertQueryBudget(2, lambda: self.client.get(url))
+
+    def test_list_stream(self):
+        self.assertQueryBudget(2, lambda: self.client.get(reverse('api-blogs') + '?stream=1'))
+
+    def test_user_blogs(self):
+        view = BlogAPIView.as_view({'get': 'get_user_blogs'})
+
+        def request():
+            request = APIRequestFactory().get('/api/my-blogs/')
+            force_authenticate(request, user=self.author)
+            return view(request)
+
+        self.assertQueryBudget(2, request)
+
+    def test_detail(self):
+        self.assertQueryBudget(2, lambda: self.client.get(reverse('api-blog-detail', args=[self.last_blog.pk])))
+
+
+class BlogHTMLQueryBudgetTests(QueryBudgetTestCase):
+    def test_blog_list(self):
+        self.assertQueryBudget(6, lambda: self.client.get(reverse('blog-list')))
+
+    def test_user_blog_list(self):
+        self.client.force_login(self.author)
+        self.assertQueryBudget(7, lambda: self.client.get(reverse('user-blog-list')))
+
+    def test_blog_detail(self):
+        self.assertQueryBudget(2, lambda: self.client.get(reverse('blog-detail', args=[self.last_blog.pk])))
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author')
+        cls.blogs = [Blog.objects.create(title=f'Blog {i}', context='Text', author=author) for i in range(7)]
+        # Ties on published_date, which only the id orders
+        published = timezone.now()
+        Blog.objects.filter(pk__in=[blog.pk for blog in cls.blogs[1:6]]).update(published_date=published)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_follows_next_across_ties(self):
+        expected = list(Blog.objects.order_by('-published_date', '-id').values_list('id', flat=True))
+        ids = []
+        url = reverse('api-blogs') + '?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [blog['id'] for blog in page['results']]
+            url = page['next']
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(set(ids)), len(self.blogs))
+
+    def test_malformed_cursor(self):
+        positions = [
+            ['2024-01-01T00:00:00+00:00', 'abc'], ['2024-13-45T00:00:00', 1], ['2024-01-01T00:00:00', True],
+            ['2024-01-01T00:00:00', 1.5], ['2024-01-01T00:00:00', 2 ** 64], [None, 1], ['2024-01-01T00:00:00'],
+        ]
+        for position in positions:
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            with self.subTest(position=position):
+                self.assertEqual(self.client.get(reverse('api-blogs'), {'cursor': cursor}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api-blogs'), {'cursor': 'not base64!'}).status_code, 404)
+        search_cursor = base64.urlsafe_b64encode(b'[NaN, 1]').decode()
+        self.assertEqual(self.client.get(reverse('api-blogs'), {'q': 'text', 'cursor': search_cursor}).status_code, 404)
+
+        naive = base64.urlsafe_b64encode(json.dumps(['2999-01-01T00:00:00', 1]).encode()).decode()
+        self.assertEqual(len(self.client.get(reverse('api-blogs'), {'cursor': naive}).json()['results']), len(self.blogs))
+
+
+class BlogDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', first_name='Ada', last_name='Lovelace')
+        cls.tag = Tag.objects.create(name='python')
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog = Blog.objects.create(title='Title', context='Some text', author=self.author)
+        self.url = reverse('api-blog-detail', args=[self.blog.pk])
+
+    def test_cached_read_issues_no_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()['title'], 'Title')
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_on_writes(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog.tags.add(self.tag)
+        self.assertEqual(self.client.get(self.url).json()['tags'], ['python'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'django'
+            self.tag.save()
+        self.assertEqual(self.client.get(self.url).json()['tags'], ['django'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog.title = 'New title'
+            self.blog.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'New title')
+
+    def test_anonymous_page_cached(self):
+        page = reverse('blog-detail', args=[self.blog.pk])
+        self.client.get(page)
+        with self.assertNumQueries(0):
+            response = self.client.get(page)
+        self.assertContains(response, 'Title')
+
+    def test_list_compressed(self):
+        for i in range(20):
+            Blog.objects.create(title=f'Blog {i}', context='Some text ' * 20, author=self.author)
+        response = self.client.get(reverse('api-blogs'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 20)
+
+        response = self.client.get(reverse('api-blogs'), {'stream': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 21)
+
+
+class ListETagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', first_name='Ada', last_name='Lovelace')
+        cls.tag = Tag.objects.create(name='python')
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog = Blog.objects.create(title='Title', context='Some text', author=self.author)
+
+    def test_list_not_modified_until_a_blog_changes(self):
+        url = reverse('api-blogs')
+        etag = self.client.get(url)['ETag']
+        # Only the aggregate the ETag is built from.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog.title = 'New title'
+            self.blog.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_follows_the_database(self):
+        # Writes seen by another process, or by nobody's cache, still change the ETag.
+        urls = [reverse('api-blogs'), reverse('api-blogs-async'), reverse('blog-list'), reverse('blog-list-async')]
+
+        def etags():
+            return [self.client.get(url)['ETag'] for url in urls]
+
+        def rename(instance, field, value):
+            setattr(instance, field, value)
+            instance.save()
+
+        changes = [
+            lambda: Blog.objects.create(title='Other', context='Some text', author=self.author),
+            lambda: self.tag.tags.add(self.blog),
+            lambda: rename(self.tag, 'name', 'django'),
+            lambda: rename(self.author, 'first_name', 'Ada Augusta'),
+            lambda: Blog.objects.filter(pk=self.blog.pk).delete(),
+        ]
+        seen = {tuple(etags())}
+        for change in changes:
+            change()
+            current = etags()
+            self.assertNotIn(tuple(current), seen)
+            self.assertEqual(len(set(current)), len(urls))
+            seen.add(tuple(current))
+
+
+class SerializeRowsTests(TestCase):
+    def test_same_output_as_blog_serializer(self):
+        author = User.objects.create(username='author')
+        tags = [Tag.objects.create(name=name) for name in ('python', 'django', 'async')]
+        for i in range(3):
+            blog = Blog.objects.create(title=f'Blog {i}', context='Text \u2028 with a separator', author=author)
+            blog.tags.set(tags[i:])
+        blogs = Blog.objects.with_related().order_by('id')
+        with self.assertNumQueries(1):
+            rows = serialize_rows(blog_rows(blogs))
+        self.assertEqual(rows, BlogSerializer(blogs, many=True).data)
+        self.assertEqual(BlogJSONRenderer().render(rows), JSONRenderer().render(rows))
+
+
+class TagListTests(TestCase):
+    def setUp(self):
+        author = User.objects.create(username='author')
+        self.python, self.django, self.asyncio = (Tag.objects.create(name=name) for name in ('python', 'django', 'asyncio'))
+        self.blog = Blog.objects.create(title='Blog', context='Text', author=author)
+        self.other = Blog.objects.create(title='Other', context='Text', author=author)
+        self.blog.tags.set([self.python, self.django])
+        self.other.tags.add(self.python)
+
+    def assertTagNames(self, blog, names):
+        blog.refresh_from_db()
+        self.assertEqual(blog.tag_names, names)
+        self.assertEqual(blog.tag_ids, sorted(Tag.objects.filter(name__in=names).values_list('pk', flat=True)))
+
+    def test_synced_with_tag_links(self):
+        self.assertTagNames(self.blog, ['django', 'python'])
+        self.blog.tags.remove(self.python)
+        self.assertTagNames(self.blog, ['django'])
+        self.asyncio.tags.add(self.blog)
+        self.assertTagNames(self.blog, ['asyncio', 'django'])
+
+        self.django.name = 'web'
+        self.django.save()
+        self.assertTagNames(self.blog, ['asyncio', 'web'])
+        self.django.delete()
+        self.assertTagNames(self.blog, ['asyncio'])
+
+    def test_tagged(self):
+        self.assertEqual(set(Blog.objects.tagged(names=['django', 'asyncio'])), {self.blog})
+        self.assertEqual(set(Blog.objects.tagged(ids=[self.python.pk])), {self.blog, self.other})
+        self.assertEqual(set(Blog.objects.tagged(names=['python', 'django'], match='all')), {self.blog})
+        self.assertEqual(set(Blog.objects.tagged(names=['python', 'asyncio'], match='all')), set())
+        self.assertEqual(set(Blog.objects.tagged(names=[])), set())
+
+        response = self.client.get(reverse('api-blogs'), {'tags': 'django,asyncio'})
+        self.assertEqual([blog['id'] for blog in response.json()['results']], [self.blog.pk])
+        response = self.client.get(reverse('api-blogs'), {'tags_all': 'python'})
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_rebuild_command(self):
+        Blog.objects.filter(pk=self.other.pk).update(tag_ids=[], tag_names=[])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_tag_lists', '--check', stdout=StringIO())
+        call_command('rebuild_tag_lists', stdout=StringIO())
+        call_command('rebuild_tag_lists', '--check', stdout=StringIO())
+        self.assertTagNames(self.other, ['python'])
+
+    def test_rebuild_in_batches(self):
+        Blog.objects.update(tag_ids=[], tag_names=[])
+        self.assertEqual(tag_lists.rebuild(batch_size=1), 2)
+        self.assertEqual(list(tag_lists.check(batch_size=1)), [])
+        self.assertTagNames(self.blog, ['django', 'python'])
+
+
+class SummaryViewTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.blog = Blog.objects.create(title='Blog', context='  A long\nbody  ' * 50, author=self.author)
+
+    def test_api_summary(self):
+        full = self.client.get(reverse('api-blogs')).json()['results'][0]
+        with CaptureQueriesContext(connection) as queries:
+            summary = self.client.get(reverse('api-blogs'), {'view': 'summary'}).json()['results'][0]
+        self.assertNotIn('"blog_blog"."context"', ' '.join(query['sql'] for query in queries))
+        self.assertEqual(summary.pop('excerpt'), self.blog.excerpt)
+        self.assertTrue(self.blog.excerpt.startswith('A long body A long body'))
+        del full['context']
+        self.assertEqual(summary, full)
+
+        response = self.client.get(reverse('api-blogs'), {'view': 'summary', 'stream': 'ndjson'})
+        self.assertIn('excerpt', json.loads(b''.join(response.streaming_content).splitlines()[0]))
+        self.assertEqual(self.client.get(reverse('api-blogs'), {'view': 'nope'}).status_code, 400)
+
+    def test_html_list_defers_body(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get(reverse('blog-list')), 'Blog')
+        self.assertNotIn('"blog_blog"."context"', ' '.join(query['sql'] for query in queries))
+
+
+class AuthorStatsTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.other = User.objects.create(username='other')
+        self.python, self.django = (Tag.objects.create(name=name) for name in ('python', 'django'))
+        self.blogs = [Blog.objects.create(title=f'Blog {i}', context='Text', author=self.author) for i in range(3)]
+        self.blogs[0].tags.set([self.python, self.django])
+        self.blogs[1].tags.add(self.python)
+
+    def counters(self):
+        return (
+            sorted(AuthorFacet.objects.values_list('author_id', 'count', 'latest_published')),
+            sorted(AuthorMonthFacet.objects.values_list('author_id', 'month', 'count')),
+            sorted(AuthorTagFacet.objects.values_list('author_id', 'tag_id', 'count')),
+        )
+
+    def assertCountersRebuilt(self):
+        """The counters kept on each write equal those recomputed from the blogs."""
+        kept = self.counters()
+        facets.rebuild()
+        self.assertEqual(kept, self.counters())
+
+    def test_counters_follow_writes(self):
+        facet = AuthorFacet.objects.get(author=self.author)
+        self.assertEqual((facet.count, facet.latest_published), (3, self.blogs[2].published_date))
+        self.assertEqual(AuthorTagFacet.objects.get(author=self.author, tag=self.python).count, 2)
+        self.assertCountersRebuilt()
+
+        self.blogs[2].delete()
+        self.assertEqual(AuthorFacet.objects.get(author=self.author).latest_published, self.blogs[1].published_date)
+        self.blogs[0].author = self.other
+        self.blogs[0].save()
+        self.django.tags.add(self.blogs[1])
+        self.blogs[1].tags.remove(self.python)
+        self.assertEqual(AuthorTagFacet.objects.get(author=self.other, tag=self.python).count, 1)
+        self.assertCountersRebuilt()
+
+        self.blogs[1].delete()
+        self.assertFalse(AuthorFacet.objects.filter(author=self.author).exists())
+        self.assertFalse(AuthorTagFacet.objects.filter(author=self.author).exists())
+        self.assertCountersRebuilt()
+
+    @override_settings(BLOG_LIST_PAGE_SIZE=2)
+    def test_user_blog_list_pages(self):
+        self.client.force_login(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('user-blog-list'))
+        # The paginator does not count the rows, the ETag's aggregate does.
+        self.assertNotIn('"__count"', ' '.join(query['sql'] for query in queries))
+        self.assertEqual([blog.pk for blog in response.context['blogs']], [self.blogs[2].pk, self.blogs[1].pk])
+        self.assertEqual(response.context['paginator'].num_pages, 2)
+        self.assertContains(response, 'python (2)')
+
+        response = self.client.get(reverse('user-blog-list'), {'page': 2})
+        self.assertEqual([blog.pk for blog in response.context['blogs']], [self.blogs[0].pk])
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        stats = client.get(reverse('api-user-stats')).json()
+        self.assertEqual(stats['count'], 3)
+        self.assertEqual(stats['months'], [{'month': f'{timezone.localdate():%Y-%m}', 'count': 3}])
+        self.assertEqual(stats['tags'][0], {'id': self.python.pk, 'name': 'python', 'count': 2})
+        results = client.get(reverse('api-user-blogs'), {'page_size': 2}).json()['results']
+        self.assertEqual([blog['id'] for blog in results], [self.blogs[2].pk, self.blogs[1].pk])
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def post(self, lines, content_type='application/x-ndjson'):
+        return self.client.post(reverse('api-blogs-bulk'), '\n'.join(lines), content_type=content_type)
+
+    def test_import(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post([
+                json.dumps({'title': 'First', 'context': 'Body', 'tags': ['python', 'django']}),
+                json.dumps({'title': 'Second', 'context': 'Body', 'published_date': '2024-01-31T12:00:00Z'}),
+            ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 2, 'errors': []})
+        first, second = Blog.objects.order_by('id')
+        self.assertEqual((first.author, first.tag_names), (self.author, ['django', 'python']))
+        self.assertEqual(second.published_date.isoformat(), '2024-01-31T12:00:00+00:00')
+        # Indexed by the task worker, like blogs saved one at a time.
+        self.assertFalse(search_blogs(Blog.objects.all(), 'first').exists())
+        self.assertEqual(
+            sorted(Task.objects.filter(name='search.sync').values_list('key', flat=True)),
+            sorted([str(first.pk), str(second.pk)]),
+        )
+
+        response = self.post(['title,context,tags', 'Third,Body,python|web'], content_type='text/csv')
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual(Blog.objects.get(title='Third').tag_names, ['python', 'web'])
+
+    def test_export_round_trip(self):
+        self.post([json.dumps({'title': 'First', 'context': 'Body', 'tags': ['python']})])
+        record = json.loads(''.join(bulk.export_blogs(Blog.objects.all())))
+        self.assertEqual((record['title'], record['tags'], record['author']), ('First', ['python'], 'author'))
+        importer = bulk.import_blogs([json.dumps(record)])
+        self.assertEqual((importer.created, importer.errors), (1, []))
+
+    def test_invalid_records(self):
+        lines = [
+            json.dumps({'title': 'Naive', 'context': 'Body', 'published_date': '2024-01-31T12:00:00'}),
+            json.dumps({'title': 'Out of range', 'context': 'Body', 'published_date': '2024-02-31T12:00:00Z'}),
+            json.dumps({'title': 'Number', 'context': 5}),
+            json.dumps({'title': 'No body'}),
+            '{not json',
+        ]
+        response = self.post(lines)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([error['line'] for error in response.json()['errors']], [2, 3, 4, 5])
+        self.assertEqual(Blog.objects.get().published_date, timezone.make_aware(datetime(2024, 1, 31, 12)))
+
+
+@override_settings(BLOG_TASKS_EAGER=True)
+class SearchFilterTests(TestCase):
+    def setUp(self):
+        author = User.objects.create(username='ada', first_name='Ada', last_name='Lovelace')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blog = Blog.objects.create(title='Engines', context='Some text', author=author)
+            self.blog.tags.add(Tag.objects.create(name='python'))
+
+    def matches(self, **filters):
+        return [blog['id'] for blog in self.client.get(reverse('api-blogs'), filters).json()['results']]
+
+    def test_filters_match_word_prefixes(self):
+        for filters in ({'user': 'love'}, {'user': 'ADA'}, {'tag': 'py'}, {'q': 'engine'}):
+            self.assertEqual(self.matches(**filters), [self.blog.pk], filters)
+        # Unlike icontains, the middle of a word does not match.
+        for filters in ({'user': 'lace'}, {'tag': 'thon'}):
+            self.assertEqual(self.matches(**filters), [], filters)
+
+    def test_unindexed_fallback(self):
+        backend = search.SearchBackend('default')
+        self.assertTrue(backend.filter(Blog.objects.all(), 'lace', ['author']).exists())
+        self.assertFalse(backend.filter(Blog.objects.all(), 'lace', ['tags']).exists())
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        tasks.task('test.record')(lambda keys, using: self.calls.append(keys))
+        self.addCleanup(tasks.registry.pop, 'test.record')
+
+    def test_repeated_tasks_run_once_in_a_batch(self):
+        tasks.enqueue('test.record', [1, 2])
+        tasks.enqueue('test.record', [2, 3])
+        claimed = tasks.claim(10)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(tasks.claim(10), [])
+
+        for name, ids in tasks.batches(claimed, 10):
+            self.assertEqual(tasks.run_batch(name, ids), (3, 0))
+        self.assertEqual(self.calls, [['1', '2', '3']])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_retried_later(self):
+        def fail(keys, using):
+            raise ValueError('boom')
+        tasks.registry['test.record'].func = fail
+        tasks.enqueue('test.record', [1])
+        [(pk, name)] = tasks.claim(10)
+        with self.assertLogs('blog.tasks', 'ERROR'):
+            self.assertEqual(tasks.run_batch(name, [pk]), (0, 1))
+
+        task = Task.objects.get()
+        self.assertEqual(task.attempts, 1)
+        self.assertIn('boom', task.last_error)
+        self.assertGreater(task.run_after, timezone.now())
+        self.assertEqual(tasks.claim(10), [])
+
+    def test_search_indexed_after_commit(self):
+        author = User.objects.create(username='author')
+        with self.captureOnCommitCallbacks(execute=True):
+            Blog.objects.create(title='Zebra crossing', context='Some text', author=author)
+        task = Task.objects.get(name='search.sync')
+        self.assertFalse(search_blogs(Blog.objects.all(), 'zebra').exists())
+
+        tasks.run_batch(task.name, [task.pk])
+        self.assertTrue(search_blogs(Blog.objects.all(), 'zebra').exists())
+
+    def test_only_author_renames_reindex(self):
+        author = User.objects.create(username='author', first_name='Ada')
+        blog = Blog.objects.create(title='Blog', context='Some text', author=author)
+        Task.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            author.set_password('secret')
+            author.save()
+            author.last_login = timezone.now()
+            author.save(update_fields=['last_login'])
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(Blog.objects.get(pk=blog.pk).version, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            author.first_name = 'Augusta'
+            author.save()
+        self.assertTrue(Task.objects.filter(name='search.sync', key=str(blog.pk)).exists())
+        self.assertEqual(Blog.objects.get(pk=blog.pk).version, 2)
+
+
+@override_settings(BLOG_TASKS_EAGER=True)
+class FeedTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.enterContext(override_settings(BLOG_FEEDS_ROOT=root.name))
+        self.author = User.objects.create(username='author')
+        self.tag = Tag.objects.create(name='birds')
+
+    def create_blog(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            blog = Blog.objects.create(title=title, context='Some text', author=self.author)
+            blog.tags.add(self.tag)
+        return blog
+
+    def test_feeds_rebuilt_after_write(self):
+        self.create_blog('First post')
+        url = reverse('feed', kwargs={'key': f'tag-{self.tag.pk}', 'format': 'atom'})
+        response = self.client.get(url)
+        self.assertContains(response, 'First post')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.create_blog('Second post')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'Second post')
+        self.assertContains(self.client.get(reverse('feed', kwargs={'key': 'blogs', 'format': 'rss'})), 'Second post')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_sitemap_pages(self):
+        with self.settings(BLOG_SITEMAP_PAGE_SIZE=1):
+            first, second = self.create_blog('First post'), self.create_blog('Second post')
+            index = self.client.get(reverse('sitemap', kwargs={'key': 'sitemap', 'format': 'xml'})).getvalue()
+            page = self.client.get(reverse('sitemap', kwargs={'key': f'sitemap-{second.pk}', 'format': 'xml'})).getvalue()
+        self.assertIn(f'/sitemap-{first.pk}.xml'.encode(), index)
+        self.assertIn(f'/sitemap-{second.pk}.xml'.encode(), index)
+        self.assertIn(reverse('blog-detail', args=[second.pk]).encode(), page)
+        self.assertNotIn(reverse('blog-detail', args=[first.pk]).encode(), page)
+
+
+class AsyncAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.other = User.objects.create(username='other')
+        cls.blogs = [Blog.objects.create(title=f'Blog {i}', context='Text', author=cls.author) for i in range(3)]
+        cls.url = reverse('api-blog-detail-async', args=[cls.blogs[0].pk])
+
+    def setUp(self):
+        cache.clear()
+        throttling.stores.clear()
+
+    def bearer(self, user):
+        return f'Bearer {AccessToken.for_user(user)}'
+
+    async def test_list(self):
+        response = await self.async_client.get(reverse('api-blogs-async'), {'page_size': 2})
+        page = json.loads(response.content)
+        self.assertEqual([blog['id'] for blog in page['results']], [self.blogs[2].pk, self.blogs[1].pk])
+        page = json.loads((await self.async_client.get(page['next'])).content)
+        self.assertEqual([blog['id'] for blog in page['results']], [self.blogs[0].pk])
+        self.assertIsNone(page['next'])
+
+        response = await self.async_client.get(reverse('api-blogs-async'), {'stream': 'ndjson'})
+        lines = b''.join([chunk async for chunk in response.streaming_content]).splitlines()
+        self.assertEqual(len(lines), 3)
+
+    async def test_detail_not_modified(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(json.loads(response.content)['title'], 'Blog 0')
+        response = await self.async_client.get(self.url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse('api-blog-detail-async', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_put_with_if_match(self):
+        etag = (await self.async_client.get(self.url))['ETag']
+        headers = {'Authorization': self.bearer(self.author), 'If-Match': etag}
+        response = await self.async_client.put(self.url, {'title': 'Edited'}, content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual((await Blog.objects.aget(pk=self.blogs[0].pk)).title, 'Edited')
+
+        # The ETag read before the edit is stale now.
+        response = await self.async_client.put(self.url, {'title': 'Again'}, content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 412)
+        headers['If-Match'] = '"something-else"'
+        response = await self.async_client.put(self.url, {'title': 'Again'}, content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 412)
+
+    async def test_delete_permission(self):
+        for headers in ({}, {'Authorization': self.bearer(self.other)}):
+            response = await self.async_client.delete(self.url, headers=headers)
+            self.assertEqual(response.status_code, 403)
+        response = await self.async_client.delete(self.url, headers={'Authorization': self.bearer(self.author)})
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Blog.objects.filter(pk=self.blogs[0].pk).aexists())
+
+
+@override_settings(BLOG_RATE_LIMITS={'api-blogs': {'anon': '2/min', 'user': '3/min'}})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        throttling.stores.clear()
+
+    def test_anonymous_clients_limited_per_ip(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('api-blogs')).status_code, 200)
+        response = self.client.get(reverse('api-blogs'))
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+        self.assertEqual(self.client.get(reverse('api-blogs'), REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.client.get(reverse('api-blogs-async')).status_code, 200)
+
+    def test_forwarded_for_not_trusted_without_proxies(self):
+        for i in range(3):
+            response = self.client.get(reverse('api-blogs'), HTTP_X_FORWARDED_FOR=f'10.0.1.{i}')
+        self.assertEqual(response.status_code, 429)
+
+    def test_forwarded_for_behind_proxy(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            for i in range(3):
+                self.assertEqual(self.client.get(reverse('api-blogs'), HTTP_X_FORWARDED_FOR=f'10.0.1.{i}').status_code, 200)
+            self.client.get(reverse('api-blogs'), HTTP_X_FORWARDED_FOR='10.0.1.9')
+            response = self.client.get(reverse('api-blogs'), HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.1.9')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(reverse('api-blogs'), HTTP_X_FORWARDED_FOR='5.6.7.8, 10.0.1.9')
+            self.assertEqual(response.status_code, 429)
+
+    def test_tokens_refill(self):
+        capacity, rate = throttling.parse_rate('2/min')
+        state, wait = throttling.refill((0, 100), capacity, rate, 115)
+        self.assertEqual(wait, 15)
+        state, wait = throttling.refill(state, capacity, rate, 130)
+        self.assertEqual((state, wait), ((0, 130), 0))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_result(self):
+        group, release, calls, results = singleflight.Group(), threading.Event(), [], []
+
+        def load():
+            calls.append(1)
+            release.wait(5)
+            return 'page'
+
+        threads = [threading.Thread(target=lambda: results.append(group.do('key', load))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(calls), results), (1, ['page'] * 4))
+        self.assertEqual(group.do('key', lambda: 'new page'), 'new page')
+
+    def test_error_raised_to_caller(self):
+        with self.assertRaises(ValueError):
+            singleflight.Group().do('key', lambda: int('x'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_request_recorded_per_view(self):
+        author = User.objects.create(username='author')
+        Blog.objects.create(title='Blog', context='Some text', author=author)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('api-blogs'))
+
+        histogram = metrics.registry.values['blog_request_queries'][('api-blogs',)]
+        self.assertEqual((histogram.count, histogram.sum), (1, len(queries)))
+        self.assertEqual(metrics.registry.values['blog_requests_total'][('api-blogs', '200')], 1)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('blog_request_duration_seconds_count{view="api-blogs"} 1', body)
+        self.assertIn('blog_request_serializer_seconds_bucket{view="api-blogs",le="+Inf"} 1', body)
+
+    def test_restricted(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.2').status_code, 403)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+
+class ServerWarmupTests(SimpleTestCase):
+    def test_warm(self):
+        with self.assertNoLogs('blog.server', 'WARNING'):
+            timings = server.warm(get_internal_wsgi_application(), urls=['/swagger.json'])
+        self.assertEqual(list(timings), ['urls', 'templates', '/swagger.json'])
+        self.assertFalse(metrics.registry.values['blog_requests_total'])
+        self.assertGreater(server.get_rss(), 0)
+
+
+class ServeCommandTests(SimpleTestCase):
+    def test_workers_need_a_shared_cache(self):
+        with self.assertRaisesMessage(CommandError, 'LocMemCache'):
+            call_command('serve', workers=2, no_warmup=True)
+
+
+class SchemaTests(SimpleTestCase):
+    def test_served_from_memory(self):
+        view = resolve('/swagger.json').func.cls
+        response = self.client.get('/swagger.json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        document = json.loads(gzip.decompress(response.content))
+        self.assertIn('/blogs/', document['paths'])
+        self.assertEqual(len(view.schemas), 1)
+
+        self.assertEqual(self.client.get('/swagger.json', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(json.loads(self.client.get('/swagger.json').content), document)
+        self.assertEqual(self.client.get('/swagger.yaml').status_code, 200)
+        self.assertEqual(len(view.schemas), 1)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seed_and_bench(self):
+        call_command('seed_blogs', blogs=30, users=3, tags=5, random_seed=1, stdout=StringIO())
+        self.assertEqual(Blog.objects.count(), 30)
+
+        scenarios = ['api list', 'api list search', 'api detail', 'html list', 'api create', 'api update', 'html delete']
+        out = StringIO()
+        call_command('bench_blogs', requests=2, warmup=0, host='testserver', only=scenarios, json=True, stdout=out)
+        results = json.loads(out.getvalue())['scenarios']
+        self.assertEqual(list(results), scenarios)
+        self.assertEqual([stats['errors'] for stats in results.values()], [0] * len(scenarios))
+        self.assertEqual(Blog.objects.count(), 30)
+
+
+class StatelessJWTTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='alice', password='secret', first_name='Alice')
+        cls.blog = Blog.objects.create(title='Blog', context='Some text', author=User.objects.create(username='bob'))
+
+    def setUp(self):
+        cache.clear()
+        blacklist.reset()
+        self.tokens = self.client.post(reverse('token_obtain_pair'), {'username': 'alice', 'password': 'secret'}).json()
+
+    def test_request_user_from_claims(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(
+                reverse('api-blog-detail', args=[self.blog.pk]), HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}",
+            )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse([query for query in queries if 'FROM "auth_user"' in query['sql']])
+
+    def test_rotated_refresh_token_rejected(self):
+        url = reverse('token_refresh')
+        self.assertEqual(self.client.post(url, {'refresh': self.tokens['refresh']}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'refresh': self.tokens['refresh']}).status_code, 401)
+        # Also once the blacklist has been reloaded from the database
+        blacklist.reset()
+        self.assertEqual(self.client.post(url, {'refresh': self.tokens['refresh']}).status_code, 401)
+
+
+@override_settings(BLOG_DATABASE_REPLICAS={'replica': 1})
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        # Pretend the replica answered its health check.
+        routers.health.checked['replica'] = (float('inf'), True)
+        self.addCleanup(routers.health.reset)
+
+    def test_reads_stick_to_primary_after_write(self):
+        token = routers.start()
+        self.assertEqual(self.router.db_for_read(Blog), 'replica')
+        self.router.db_for_write(Blog)
+        self.assertEqual(self.router.db_for_read(Blog), 'default')
+        self.assertTrue(routers.finish(token))
+
+        token = routers.start(pinned=True)
+        self.assertEqual(self.router.db_for_read(Blog), 'default')
+        self.assertFalse(routers.finish(token))
+
+    def test_reads_outside_requests_go_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Blog), 'default')
+
+    @override_settings(BLOG_DATABASE_REPLICAS={'missing': 1})
+    def test_unhealthy_replica_skipped(self):
+        # There is no 'missing' connection, so its health check fails.
+        token = routers.start()
+        self.assertEqual(self.router.db_for_read(Blog), 'default')
+        routers.finish(token)
+
+
+class ReplicaWriteTests(TransactionTestCase):
+    """
+    Requests and edits with a replica that lags behind the primary. Not a
+    TestCase, the router sends every read to the primary inside a transaction.
+    """
+    @classmethod
+    def setUpClass(cls):
+        # A database of its own rather than a mirror of the primary, which
+        # would see every write at once. It only exists for these tests.
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        connections.settings['replica'] = connections.configure_settings({
+            'default': settings.DATABASES['default'],
+            'replica': {**settings.DATABASES['default'], 'NAME': f'{directory.name}/replica.sqlite3', 'TEST': {}},
+        })['replica']
+        cls.addClassCleanup(cls.remove_replica)
+        call_command('migrate', database='replica', run_syncdb=True, verbosity=0)
+        # Named here, the test runner checks the databases of each class before it exists.
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        cache.clear()
+        routers.health.checked['replica'] = (float('inf'), True)
+        self.addCleanup(routers.health.reset)
+        self.author = User.objects.create(username='author')
+        self.tag = Tag.objects.create(name='python')
+        self.blog = Blog.objects.create(title='t0', context='Text', author=self.author)
+        # The replica holds a copy from before the tag was added.
+        User.objects.using('replica').create(pk=self.author.pk, username='author')
+        Blog.objects.using('replica').bulk_create([Blog(pk=self.blog.pk, title='t0', context='Text', author_id=self.author.pk)])
+        self.blog.tags.add(self.tag)
+
+    @override_settings(BLOG_DATABASE_REPLICAS={'replica': 1})
+    def test_put_writes_to_primary(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.put(reverse('api-blog-detail', args=[self.blog.pk]), {'title': 'EDITED'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # Read from the primary, the replica's copy has no tags yet.
+        self.assertEqual(response.json()['tags'], ['python'])
+        self.assertEqual(Blog.objects.using('default').get(pk=self.blog.pk).title, 'EDITED')
+        self.assertEqual(Blog.objects.using('replica').get(pk=self.blog.pk).title, 't0')
+
+    @override_settings(BLOG_DATABASE_REPLICAS={'replica': 1})
+    async def test_async_list_routed_off_the_event_loop(self):
+        routers.health.reset()
+        on_loop = []
+
+        def check(alias):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return True
+
+        with mock.patch.object(routers.health, 'check', check):
+            response = await self.async_client.get(reverse('api-blogs-async'), {'user': 'author'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(on_loop, [False])
+
+    @override_settings(BLOG_DATABASE_REPLICAS={'replica': 1})
+    def test_update_blog_of_replica_copy(self):
+        blog = Blog.objects.using('replica').get(pk=self.blog.pk)
+        blog.title = 'EDITED'
+        update_blog(blog, ['title'], tags=[])
+        primary = Blog.objects.using('default').get(pk=self.blog.pk)
+        self.assertEqual((primary.title, primary.version, primary.tag_names), ('EDITED', 2, []))
+        self.assertEqual(Blog.objects.using('replica').get(pk=self.blog.pk).title, 't0')
+
+
+class WriteTransactionTests(TransactionTestCase):
+    def test_only_write_transactions_begin_immediate(self):
+        with CaptureQueriesContext(connection) as queries:
+            with write_transaction():
+                Tag.objects.get_or_create(name='python')
+            with transaction.atomic():
+                Tag.objects.count()
+        begins = [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+        self.assertEqual(begins, ['BEGIN IMMEDIATE', 'BEGIN'])
+
+
+class BlogEditTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author')
+        cls.tags = [Tag.objects.create(name=f'tag{i}') for i in range(3)]
+
+    def setUp(self):
+        self.blog = Blog.objects.create(title='Blog', context='Some text', author=self.author)
+        self.blog.tags.set(self.tags[:2])
+        self.client.force_login(self.author)
+
+    def put(self, data, if_match=None):
+        headers = {'If-Match': if_match} if if_match else {}
+        request = APIRequestFactory().put(f'/api/blogs/{self.blog.pk}/', data, format='json', headers=headers)
+        force_authenticate(request, user=self.author)
+        return BlogDetailAPIView.as_view({'put': 'put'})(request, pk=self.blog.pk)
+
+    def test_put_saves_changes(self):
+        response = self.put({'title': 'New title', 'tags': [self.tags[1].pk, self.tags[2].pk]})
+        self.assertEqual(response.status_code, 200)
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.title, self.blog.version), ('New title', 2))
+        self.assertEqual(sorted(self.blog.tags.values_list('name', flat=True)), ['tag1', 'tag2'])
+
+    def test_put_updates_excerpt(self):
+        self.assertEqual(self.blog.excerpt, 'Some text')
+        self.assertEqual(self.put({'context': 'New\n\ntext ' * 100}).status_code, 200)
+        self.blog.refresh_from_db()
+        self.assertTrue(self.blog.excerpt.startswith('New text New text'))
+        self.assertEqual(len(self.blog.excerpt), EXCERPT_LENGTH)
+
+    def test_list_fragments_rerendered_after_edit(self):
+        url = reverse('user-blog-list')
+        self.assertContains(self.client.get(url), 'Blog')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.put({'title': 'Renamed'}).status_code, 200)
+        response = self.client.get(url)
+        self.assertContains(response, 'Renamed')
+        self.assertNotContains(response, '>Blog<')
+
+    def test_put_stale_version_rejected(self):
+        self.assertEqual(self.put({'title': 'First', 'version': 1}).status_code, 200)
+        self.assertEqual(self.put({'title': 'Second', 'version': 1}).status_code, 412)
+        self.assertEqual(self.put({'title': 'Second'}, if_match='"blog-stale"').status_code, 412)
+        self.blog.refresh_from_db()
+        self.assertEqual(self.blog.title, 'First')
+
+    def test_delete_with_stale_if_match(self):
+        etag = self.client.get(reverse('api-blog-detail', args=[self.blog.pk]))['ETag']
+        self.assertEqual(self.put({'title': 'Edited'}).status_code, 200)
+        request = APIRequestFactory().delete(f'/api/blogs/{self.blog.pk}/', headers={'If-Match': etag})
+        force_authenticate(request, user=self.author)
+        response = BlogDetailAPIView.as_view({'delete': 'delete'})(request, pk=self.blog.pk)
+        self.assertEqual(response.status_code, 412)
+        self.assertTrue(Blog.objects.filter(pk=self.blog.pk).exists())
+
+    def test_if_match_checked_against_the_row(self):
+        cache.clear()
+        etag = self.client.get(reverse('api-blog-detail', args=[self.blog.pk]))['ETag']
+        # Another process edits the blog, the cache of this one keeps the old payload.
+        self.blog.title = 'Elsewhere'
+        self.blog.save()
+        self.assertEqual(self.client.get(reverse('api-blog-detail', args=[self.blog.pk]))['ETag'], etag)
+        self.assertEqual(self.put({'title': 'Lost'}, if_match=etag).status_code, 412)
+
+        # A cache that lost the blog's version still accepts an up-to-date ETag.
+        etag = self.put({'title': 'Current'})['ETag']
+        cache.clear()
+        response = self.put({'title': 'Latest'}, if_match=f'W/{etag}')
+        self.assertEqual(response.status_code, 200)
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.title, self.blog.version), ('Latest', 4))
+        self.assertEqual(self.put({'title': 'Stale'}, if_match=etag).status_code, 412)
+
+    def test_html_edit_stale_version_rejected(self):
+        url = reverse('blog-edit', args=[self.blog.pk])
+        data = {'title': 'First', 'context': 'Some text', 'tags': [self.tags[0].pk], 'version': 1}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(self.client.post(url, dict(data, title='Second')).status_code, 200)
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.title, self.blog.version), ('First', 2))
+        self.assertEqual(list(self.blog.tags.values_list('name', flat=True)), ['tag0'])
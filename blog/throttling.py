@@ -0,0 +1,141 @@
+"""
+Token bucket rate limits per URL name, for each user or, for anonymous
+requests, each client IP.
+
+``BLOG_RATE_LIMITS`` maps URL names to the rates of their ``user`` and
+``anon`` clients, in DRF's ``"<requests>/<period>"`` notation. A client may
+burst up to ``<requests>`` at once, and gets one more every ``period /
+requests`` seconds after that. Routes without an entry are not limited.
+
+Buckets live in this process (``BLOG_RATE_LIMIT_STORE = 'local'``) or in the
+blog cache (``'cache'``) to share them between processes. The cache has no
+compare-and-set, so concurrent requests of one client may read the same
+bucket and take one token each for the price of one.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .cache import get_cache
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """``(capacity, tokens per second)`` of ``"<requests>/<period>"``."""
+    requests, period = rate.split('/')
+    capacity = int(requests)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def refill(state, capacity, rate, now):
+    """Take a token from the bucket ``state``, returning the new state and seconds to wait."""
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class LocalBucketStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.prune_at = 1024
+
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.buckets.get(key)
+            state, wait = refill(entry and entry[0], capacity, rate, now)
+            # Remember when the bucket is full again, it can be forgotten then.
+            self.buckets[key] = (state, now + (capacity - state[0]) / rate)
+            if len(self.buckets) >= self.prune_at:
+                self.prune(now)
+        return wait
+
+    async def atake(self, key, capacity, rate):
+        return self.take(key, capacity, rate)
+
+    def prune(self, now):
+        self.buckets = {key: entry for key, entry in self.buckets.items() if entry[1] > now}
+        self.prune_at = max(1024, len(self.buckets) * 2)
+
+
+class CacheBucketStore:
+    def key(self, key):
+        return f'blog:ratelimit:{key}'
+
+    def take(self, key, capacity, rate):
+        cache = get_cache()
+        state, wait = refill(cache.get(self.key(key)), capacity, rate, time.time())
+        cache.set(self.key(key), state, math.ceil((capacity - state[0]) / rate) + 1)
+        return wait
+
+    async def atake(self, key, capacity, rate):
+        cache = get_cache()
+        state, wait = refill(await cache.aget(self.key(key)), capacity, rate, time.time())
+        await cache.aset(self.key(key), state, math.ceil((capacity - state[0]) / rate) + 1)
+        return wait
+
+
+STORES = {'local': LocalBucketStore, 'cache': CacheBucketStore}
+stores = {}
+
+
+def get_store():
+    name = getattr(settings, 'BLOG_RATE_LIMIT_STORE', 'local')
+    if name not in stores:
+        stores[name] = STORES[name]()
+    return stores[name]
+
+
+def get_rate(route, authenticated):
+    rates = getattr(settings, 'BLOG_RATE_LIMITS', {}).get(route, {})
+    rate = rates.get('user' if authenticated else 'anon')
+    return parse_rate(rate) if rate else None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Applies ``BLOG_RATE_LIMITS`` to DRF views, answering 429 with ``Retry-After``."""
+    wait_seconds = None
+
+    def get_bucket(self, request, get_user):
+        """
+        Bucket key and ``(capacity, rate)`` of the request, None if it is not
+        limited. ``get_user()`` is only called for limited routes.
+        """
+        match = request.resolver_match
+        route = match.url_name if match else None
+        if route not in getattr(settings, 'BLOG_RATE_LIMITS', {}):
+            return None
+        user = get_user()
+        authenticated = user is not None and user.is_authenticated
+        rate = get_rate(route, authenticated)
+        if rate is None:
+            return None
+        ident = f'user:{user.pk}' if authenticated else f'ip:{self.get_ident(request)}'
+        return f'{route}:{ident}', rate
+
+    def allow_request(self, request, view):
+        bucket = self.get_bucket(request, lambda: request.user)
+        if bucket is None:
+            return True
+        key, (capacity, rate) = bucket
+        self.wait_seconds = get_store().take(key, capacity, rate)
+        return not self.wait_seconds
+
+    async def aallow_request(self, request, get_user):
+        """``allow_request`` for async views, ``get_user()`` authenticates the request."""
+        bucket = self.get_bucket(request, get_user)
+        if bucket is None:
+            return True
+        key, (capacity, rate) = bucket
+        self.wait_seconds = await get_store().atake(key, capacity, rate)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
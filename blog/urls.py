@@ -1,8 +1,10 @@
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from . import async_views
 from .views import (
                     BlogAPIView, BlogListView, BlogDetailView, BlogCreateView, BlogUpdateView, 
-                    BlogDeleteView, UserBlogListView, register, BlogDetailAPIView
+                    BlogDeleteView, UserBlogListView, register, BlogDetailAPIView, BlogBulkAPIView, metrics_view,
+                    generated_file_view,
                     )   
 
 urlpatterns = [
@@ -11,6 +13,9 @@ urlpatterns = [
 
     # For getting all blogs and creating a new blog
     path('api/blogs/', BlogAPIView.as_view({'get': 'get_all', 'post': 'post'}), name='api-blogs'), 
+    path('api/blogs/mine/', BlogAPIView.as_view({'get': 'get_user_blogs'}), name='api-user-blogs'),
+    path('api/blogs/mine/stats/', BlogAPIView.as_view({'get': 'get_user_stats'}), name='api-user-stats'),
+    path('api/blogs/bulk/', BlogBulkAPIView.as_view({'post': 'post'}), name='api-blogs-bulk'),
     path('api/blogs/<int:pk>/', BlogDetailAPIView.as_view({'get': 'get', 'put': 'put', 'delete': 'delete'}), name='api-blog-detail'),  
     
     path('register/', register, name='register'),
@@ -20,4 +25,14 @@ urlpatterns = [
     path('blogs/create/', BlogCreateView.as_view(), name='blog-create'),
     path('blogs/<int:pk>/edit/', BlogUpdateView.as_view(), name='blog-edit'),
     path('blogs/<int:pk>/delete/', BlogDeleteView.as_view(), name='blog-delete'),
+    path('metrics', metrics_view, name='metrics'),
+
+    # Feeds and sitemap, written ahead of time by blog.feeds
+    re_path(r'^feeds/(?P<key>blogs|(?:author|tag)-[0-9]+)\.(?P<format>rss|atom)$', generated_file_view, name='feed'),
+    re_path(r'^(?P<key>sitemap(?:-[0-9]+)?)\.(?P<format>xml)$', generated_file_view, name='sitemap'),
+
+    # Async variants of the views above, for the ASGI application
+    path('api/async/blogs/', async_views.blog_list_api, name='api-blogs-async'),
+    path('api/async/blogs/<int:pk>/', async_views.blog_detail_api, name='api-blog-detail-async'),
+    path('async/', async_views.blog_list, name='blog-list-async'),
 ]
\ No newline at end of file
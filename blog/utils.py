@@ -1,9 +1,140 @@
+import re
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.signals import post_save
 from django.shortcuts import get_object_or_404
-from rest_framework import status
-from rest_framework.response import Response
+from django.utils import timezone
+from django.utils.http import parse_etags
 
-from .models import Blog
+from .models import Blog, make_excerpt
 
 
 def get_blog_or_404(pk: int):
-        return get_object_or_404(Blog, id=pk)
\ No newline at end of file
+        return get_object_or_404(Blog.objects.with_related(), id=pk)
+
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def filter_by_date(queryset, start_date=None, end_date=None):
+    """
+    Blogs published from the start of ``start_date`` to the end of ``end_date``.
+
+    The dates are turned into a half-open ``[start, end + 1 day)`` datetime
+    range on the raw column, unlike ``published_date__date`` which wraps the
+    column in a function and cannot use an index.
+    """
+    if start_date is not None:
+        queryset = queryset.filter(published_date__gte=start_of_day(start_date))
+    if end_date is not None:
+        queryset = queryset.filter(published_date__lt=start_of_day(end_date + timedelta(days=1)))
+    return queryset
+
+
+@contextmanager
+def write_transaction(using='default'):
+    """
+    ``transaction.atomic`` for blocks that read and then write. On SQLite the
+    transaction takes the write lock at ``BEGIN IMMEDIATE``, so it waits for
+    other writers up to ``busy_timeout`` rather than failing with "database is
+    locked" at its first write. Other transactions stay ``DEFERRED`` and do
+    not queue behind writers for their reads.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    connection.ensure_connection()
+    mode, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # BEGIN IMMEDIATE has run, later transactions get the configured mode.
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+class EditConflict(Exception):
+    """The blog was changed since the version the edit was based on."""
+
+
+def version_etag(pk, version, *variant):
+    """``ETag`` of blog ``pk`` at ``version``, the ``Blog.version`` column, for ``If-Match``."""
+    return '"{}"'.format('-'.join(['blog', str(pk), f'v{version}', *map(str, variant)]))
+
+
+def if_match_version(if_match, pk):
+    """
+    The version of blog ``pk`` named by an ``If-Match`` header of
+    ``version_etag`` tags, None for no header or ``*``. Raises
+    ``EditConflict`` when no tag names a version of this blog.
+    """
+    if not if_match or if_match.strip() == '*':
+        return None
+    # Compressed responses carry the weak form of the ETag, accept it too.
+    for tag in parse_etags(if_match):
+        match = re.fullmatch(rf'(?:W/)?"blog-{pk}-v(\d+)(?:-[^"]*)?"', tag)
+        if match:
+            return int(match[1])
+    raise EditConflict
+
+
+def update_blog(blog, fields, tags=None, version=None):
+    """
+    Save an edit of ``blog`` loaded with ``with_related()``.
+
+    ``fields`` names the fields already set to new values on ``blog``, and
+    ``tags`` is the new tag set, or None to leave the tags alone. Only those
+    fields are written, in one ``UPDATE`` that also bumps ``version``, and only
+    the tag links that were added or removed are written.
+
+    The ``UPDATE`` only matches the row if it is still at ``version``, the
+    version the editor saw, or else the version ``blog`` was loaded at.
+    Otherwise nothing is written and ``EditConflict`` is raised. This replaces
+    a row lock held from read to write.
+    """
+    expected = blog.version if version is None else version
+    # ``blog`` may have been read from a replica, the edit goes to the primary.
+    using = router.db_for_write(Blog, instance=blog)
+    current_tags = set(blog.tag_ids)
+    if tags is not None and blog._state.db != using:
+        # The replica's copy of the tags may lag, compare with the primary's links.
+        current_tags = set(Blog.tags.through.objects.using(using).filter(blog_id=blog.pk).values_list('tag_id', flat=True))
+    new_tags = current_tags if tags is None else {tag.pk for tag in tags}
+    added = sorted(new_tags - current_tags)
+    removed = sorted(current_tags - new_tags)
+
+    if not (fields or added or removed):
+        if blog.version != expected:
+            raise EditConflict
+        return
+
+    if 'context' in fields:
+        blog.excerpt = make_excerpt(blog.context)
+        fields = [*fields, 'excerpt']
+
+    with transaction.atomic(using=using):
+        values = {name: getattr(blog, name) for name in fields}
+        updated = Blog.objects.using(using).filter(pk=blog.pk, version=expected).update(
+            version=F('version') + 1, **values
+        )
+        if not updated:
+            raise EditConflict
+        blog.version = expected + 1
+        blog._state.db = using
+        if removed:
+            blog.tags.remove(*removed)
+        if added:
+            blog.tags.add(*added)
+        if not (added or removed):
+            # update() sends no signals, let the search index and the cache know.
+            post_save.send(
+                sender=Blog, instance=blog, created=False, update_fields=frozenset([*fields, 'version']),
+                raw=False, using=using,
+            )
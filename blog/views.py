@@ -1,3 +1,8 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import attrgetter
+
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
@@ -5,25 +10,287 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Sum
 from django.db.models.functions import TruncMonth
 from django.contrib import messages
-from django.db.models import Q
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from django.urls import reverse_lazy
 from django.shortcuts import render, redirect
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import Blog, Tag
-from .serializers import BlogSerializer, BlogFilterSerializer
+from . import bulk, cache, feeds, metrics, singleflight
+from .models import AuthorFacet, AuthorMonthFacet, AuthorTagFacet, Blog, MonthArchive, Tag, TagFacet
+from .serializers import (
+    AuthorStatsSerializer, BlogSerializer, BlogFilterSerializer, BlogPageSerializer, BlogUpdateSerializer, blog_rows,
+    serialize_rows,
+)
 from .forms import BlogForm, UserRegistrationForm
-from .utils import get_blog_or_404
+from .pagination import BlogCursorPagination, CountedPaginator, stream_blogs, wants_stream
+from .search import filter_blogs, search_blogs
+from .utils import EditConflict, filter_by_date, get_blog_or_404, if_match_version, update_blog, version_etag
+
+
+LIST_PARAMETERS = [
+    openapi.Parameter(
+        'view', openapi.IN_QUERY,
+        description="`summary` sends each blog's `excerpt`, the start of its content, instead of `context`",
+        type=openapi.TYPE_STRING,
+        enum=['full', 'summary'],
+    ),
+    openapi.Parameter(
+        'cursor', openapi.IN_QUERY,
+        description="Opaque cursor returned in the `next` field of the previous page",
+        type=openapi.TYPE_STRING,
+    ),
+    openapi.Parameter(
+        'page_size', openapi.IN_QUERY,
+        description="Number of blogs per page",
+        type=openapi.TYPE_INTEGER,
+    ),
+    openapi.Parameter(
+        'stream', openapi.IN_QUERY,
+        description="Stream every matching blog instead of a page: `1` for a JSON array, `ndjson` for NDJSON",
+        type=openapi.TYPE_STRING,
+        enum=['1', 'ndjson'],
+    ),
+]
+
+TAG_NAME_PARAMETERS = [
+    openapi.Parameter(
+        'tags', openapi.IN_QUERY,
+        description="Comma-separated tag names, keeps blogs with any of them (exact names)",
+        type=openapi.TYPE_STRING,
+    ),
+    openapi.Parameter(
+        'tags_all', openapi.IN_QUERY,
+        description="Comma-separated tag names, keeps blogs with all of them (exact names)",
+        type=openapi.TYPE_STRING,
+    ),
+]
+
+
+# Ranked search results are paged by relevance instead of date
+SEARCH_ORDERING = ('-rank', '-id')
+
+EDIT_CONFLICT_MESSAGE = "The blog was changed since you loaded it, reload it and apply your changes again."
+
+
+def filter_tag_names(blogs, filters):
+    """Apply the exact tag name filters, ``tags`` (any of them) and ``tags_all``."""
+    if 'tags' in filters:
+        blogs = blogs.tagged(names=filters['tags'])
+    if 'tags_all' in filters:
+        blogs = blogs.tagged(names=filters['tags_all'], match='all')
+    return blogs
+
+
+def filter_blog_list(filters):
+    """Blogs matching the validated list ``filters`` and the ordering to page them by."""
+    blogs = Blog.objects.with_related()
+
+    blogs = filter_by_date(blogs, filters.get('start_date'), filters.get('end_date'))
+    if 'tag' in filters:
+        blogs = filter_blogs(blogs, filters['tag'], fields=['tags'])
+    blogs = filter_tag_names(blogs, filters)
+    if 'user' in filters:
+        blogs = filter_blogs(blogs, filters['user'], fields=['author'])
+    if 'q' in filters:
+        return search_blogs(blogs, filters['q']), SEARCH_ORDERING
+    return blogs, BlogCursorPagination.ordering
+
+
+def user_blog_list(user_id, filters):
+    """The blogs of user ``user_id`` matching the validated list ``filters``."""
+    blogs = Blog.objects.filter(author_id=user_id).with_related()
+    blogs = filter_by_date(blogs, filters.get('start_date'), filters.get('end_date'))
+    if 'tag' in filters:
+        blogs = filter_blogs(blogs, filters['tag'], fields=['tags'])
+    return filter_tag_names(blogs, filters)
+
+
+# Concurrent requests for the same page of the same list, see list_response()
+list_calls = singleflight.Group()
+
+
+def coalesce_key(request, filters, paginator, using):
+    """
+    Identifies requests for the same page of the list with ``filters``, which
+    can share one query and serialization, or None if coalescing is off.
+    """
+    if not getattr(settings, 'BLOG_COALESCE_LISTS', True):
+        return None
+    return (
+        using,
+        tuple(sorted((name, str(value)) for name, value in filters.items())),
+        paginator.get_page_size(request),
+        request.GET.get(paginator.cursor_query_param, ''),
+    )
+
+
+def list_response(request, blogs, ordering=BlogCursorPagination.ordering, filters=None, view='full'):
+    """
+    A page of ``blogs`` in the list ``view``, or all of them streamed. Given
+    the validated ``filters`` the page is computed once for identical
+    concurrent requests.
+    """
+    mode = wants_stream(request)
+    if mode:
+        return stream_blogs(blogs, mode, ordering, view=view)
+
+    paginator = BlogCursorPagination(ordering)
+
+    def load_page():
+        rows = blog_rows(blogs, *(field.lstrip('-') for field in ordering), view=view)
+        page = paginator.paginate_queryset(rows, request)
+        with metrics.timer('serializer'):
+            return serialize_rows(page, view), paginator.get_next_cursor()
+
+    key = coalesce_key(request, filters, paginator, blogs.db) if filters is not None else None
+    data, cursor = load_page() if key is None else list_calls.do(key, load_page)
+    return Response({'next': paginator.cursor_link(request, cursor), 'results': data})
+
+
+def edit_blog(blog, data, if_match=None):
+    """
+    Apply the API edit ``data`` to ``blog``, returning the response body and
+    status. ``if_match`` is the request's If-Match header, whose version the
+    edit is based on, like a ``version`` in ``data``.
+    """
+    serializer = BlogUpdateSerializer(blog, data=data, partial=True)
+    if not serializer.is_valid():
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+    changes = dict(serializer.validated_data)
+    changes.pop('author', None)
+    version = changes.pop('version', None)
+    tags = changes.pop('tags', None)
+
+    try:
+        header_version = if_match_version(if_match, blog.pk)
+        if header_version is not None:
+            if version is not None and version != header_version:
+                raise EditConflict
+            version = header_version
+        fields = [name for name, value in changes.items() if getattr(blog, name) != value]
+        for name in fields:
+            setattr(blog, name, changes[name])
+        update_blog(blog, fields, tags, version)
+    except EditConflict:
+        return {"message": EDIT_CONFLICT_MESSAGE}, status.HTTP_412_PRECONDITION_FAILED
+    return BlogSerializer(blog).data, status.HTTP_200_OK
+
+
+def is_stale(blog, if_match):
+    """Whether the If-Match header ``if_match`` names a version of ``blog`` other than its current one."""
+    try:
+        expected = if_match_version(if_match, blog.pk)
+    except EditConflict:
+        return True
+    return expected is not None and expected != blog.version
+
+
+def month_groups(blogs, versions):
+    """
+    ``blogs`` grouped by ``published_month`` for the list templates, with the
+    keys of their cached fragments: each blog's cache ``version`` for its row,
+    and a digest of the rows' versions for the whole month.
+    """
+    groups = []
+    for month, rows in groupby(blogs, key=attrgetter('published_month')):
+        rows = list(rows)
+        for blog in rows:
+            blog.cache_version = versions[blog.pk]
+        key = hashlib.md5(' '.join(f'{blog.pk}:{blog.cache_version}' for blog in rows).encode()).hexdigest()
+        groups.append({'grouper': month, 'list': rows, 'version': key})
+    return groups
+
+
+def author_stats(author_id):
+    """An author's post counts as ``AuthorStatsSerializer`` takes them, from the counters of ``blog.facets``."""
+    facet = AuthorFacet.objects.filter(author_id=author_id).first()
+    return {
+        'count': facet.count if facet else 0,
+        'latest_published': facet.latest_published if facet else None,
+        'months': AuthorMonthFacet.objects.filter(author_id=author_id).order_by('-month'),
+        'tags': AuthorTagFacet.objects.filter(author_id=author_id).select_related('tag').order_by('-count', 'tag__name'),
+    }
+
+
+def api_detail(pk):
+    """The API representation of blog ``pk``, cached."""
+    def serialize():
+        rows = blog_rows(Blog.objects.filter(pk=pk))[:1]
+        if not rows:
+            raise Http404
+        with metrics.timer('serializer'):
+            return serialize_rows(rows)[0]
+
+    return cache.get_or_set(pk, 'api', serialize)
+
+
+def api_detail_etag(request, pk):
+    # The version of the representation sent, which If-Match on an edit refers
+    # to, and the cache version, which also changes when a tag is renamed.
+    return version_etag(pk, api_detail(pk)['version'], cache.get_version(pk), 'api', request.accepted_renderer.format)
+
+
+def html_detail_etag(request, pk):
+    # The page shows edit controls to the author, so it varies per user
+    return cache.etag(pk, 'html', request.user.pk or 0)
+
+
+def detail_last_modified(request, pk):
+    return cache.last_modified(pk)
+
+
+def list_filters(request):
+    """The validated list filters of the request, or None if they are invalid."""
+    serializer = BlogFilterSerializer(data=request.query_params)
+    return serializer.validated_data if serializer.is_valid() else None
+
+
+def api_list_etag(request):
+    filters = list_filters(request)
+    if filters is None:
+        return None
+    blogs, _ = filter_blog_list(filters)
+    return cache.list_etag(request, blogs, 'api', request.accepted_renderer.format)
+
+
+def api_user_list_etag(request):
+    filters = list_filters(request)
+    if filters is None or not request.user.is_authenticated:
+        return None
+    return cache.list_etag(request, user_blog_list(request.user.pk, filters), 'api', request.accepted_renderer.format, request.user.pk)
+
+
+def api_user_stats_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return cache.list_etag(request, Blog.objects.filter(author_id=request.user.pk), 'api', request.accepted_renderer.format, request.user.pk)
+
+
+def html_list_etag(request):
+    # Every blog counts in the archive and filter counts of the page, and the
+    # navigation bar shows the logged in user.
+    return cache.list_etag(request, Blog.objects.all(), 'html', request.user.pk or 0, request.user.get_username())
+
+
+def html_user_list_etag(request):
+    return cache.list_etag(request, Blog.objects.filter(author_id=request.user.pk), 'html', request.user.pk or 0, request.user.get_username())
 
 
 class BlogAPIView(ViewSet):
     @swagger_auto_schema(
-        operation_description="Get all blogs with optional filters (start_date, end_date, tag, user)",
-        responses={200: BlogSerializer(many=True)},
+        operation_description="Get all blogs with optional filters (start_date, end_date, tag, tags, tags_all, user), newest first. "
+                              "With `q`, blogs are full-text searched and ordered by relevance",
+        responses={200: BlogPageSerializer},
         manual_parameters=[
             openapi.Parameter(
                 'start_date', openapi.IN_QUERY, 
@@ -39,41 +306,39 @@ class BlogAPIView(ViewSet):
             ),
             openapi.Parameter(
                 'tag', openapi.IN_QUERY, 
-                description="Filter blogs by tag name (case-insensitive)",
+                description="Filter blogs by words starting tag names (case-insensitive)",
                 type=openapi.TYPE_STRING,
             ),
             openapi.Parameter(
                 'user', openapi.IN_QUERY, 
-                description="Filter blogs by author's username or first name or last name (case-insensitive)",
+                description="Filter blogs by words starting the author's username or first name or last name (case-insensitive)",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                'q', openapi.IN_QUERY,
+                description="Full-text search in title, content, tag names and author names, ranked by relevance",
                 type=openapi.TYPE_STRING,
             ),
+            *TAG_NAME_PARAMETERS,
+            *LIST_PARAMETERS,
         ],
         tags=['Blogs'],
     )
+    @method_decorator(condition(etag_func=api_list_etag))
     def get_all(self, request):
         filter_serializer = BlogFilterSerializer(data=request.query_params)
         filter_serializer.is_valid(raise_exception=True)
         filters = filter_serializer.validated_data
-        blogs = Blog.objects.all()
-
-        if 'start_date' in filters:
-            blogs = blogs.filter(published_date__date__gte=filters['start_date'])
-        if 'end_date' in filters:
-            blogs = blogs.filter(published_date__date__lte=filters['end_date'])
-        if 'tag' in filters:
-            blogs = blogs.filter(tags__name__icontains=filters['tag'])
-        if 'user' in filters:
-            user_param = filters['user']
-            blogs = blogs.filter(Q(author__first_name__icontains=user_param) | Q(author__last_name__icontains=user_param) \
-                                 | Q(author__username__icontains=user_param))
-        serializer = BlogSerializer(blogs, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        blogs, ordering = filter_blog_list(filters)
+        return list_response(request, blogs, ordering, filters, filters['view'])
     
     @swagger_auto_schema(
-        operation_description="Get user's blogs with optional filters (start_date, end_date, tag)",
-        responses={200: BlogSerializer(many=True)},
+        operation_description="Get user's blogs with optional filters (start_date, end_date, tag, tags, tags_all), newest first",
+        responses={200: BlogPageSerializer},
+        manual_parameters=[*TAG_NAME_PARAMETERS, *LIST_PARAMETERS],
         tags=['Blogs'],
     )
+    @method_decorator(condition(etag_func=api_user_list_etag))
     def get_user_blogs(self, request):
         filter_serializer = BlogFilterSerializer(data=request.query_params)
         filter_serializer.is_valid(raise_exception=True)
@@ -81,18 +346,19 @@ class BlogAPIView(ViewSet):
 
         if not request.user.is_authenticated:
             return Response(data={"message": "You must be logged in to view your blogs."}, status=status.HTTP_401_UNAUTHORIZED)
-        
-        blogs = Blog.objects.filter(author=request.user)
 
-        if 'start_date' in filters:
-            blogs = blogs.filter(published_date__date__gte=filters['start_date'])
-        if 'end_date' in filters:
-            blogs = blogs.filter(published_date__date__lte=filters['end_date'])
-        if 'tag' in filters:
-            blogs = blogs.filter(tags__name__icontains=filters['tag'])
+        return list_response(request, user_blog_list(request.user.pk, filters), view=filters['view'])
 
-        serializer = BlogSerializer(blogs, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+    @swagger_auto_schema(
+        operation_description="Get the user's number of blogs, the date of the newest, and their number per month and per tag",
+        responses={200: AuthorStatsSerializer},
+        tags=['Blogs'],
+    )
+    @method_decorator(condition(etag_func=api_user_stats_etag))
+    def get_user_stats(self, request):
+        if not request.user.is_authenticated:
+            return Response(data={"message": "You must be logged in to view your blogs."}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(AuthorStatsSerializer(author_stats(request.user.pk)).data)
 
     @swagger_auto_schema(
         operation_description="Create a new blog",
@@ -107,45 +373,81 @@ class BlogAPIView(ViewSet):
         serializer = BlogSerializer(data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            # The blog, its tags and their counts commit together.
+            with transaction.atomic():
+                serializer.save()
             return Response(data=serializer.data, status=status.HTTP_201_CREATED)
         return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+class BlogBulkAPIView(ViewSet):
+    @swagger_auto_schema(
+        operation_description="Create many blogs at once from an NDJSON body (one blog object per line) or, "
+                              "with `Content-Type: text/csv`, a CSV body with `title`, `context` and `tags` "
+                              "columns, tags separated by `|`. Invalid records are skipped and reported.",
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format='binary'),
+        responses={201: openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'created': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'errors': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            },
+        )},
+        tags=['Blogs'],
+    )
+    def post(self, request):
+        if not request.user.is_authenticated:
+            return Response(data={"message": "You must be logged in to create blogs."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        lines = (line.decode('utf-8') for line in (request.stream or []))
+        importer = bulk.import_blogs(
+            lines, format, author=request.user, batch_size=getattr(settings, 'BLOG_BULK_BATCH_SIZE', 1000),
+        )
+        response_status = status.HTTP_400_BAD_REQUEST if importer.errors and not importer.created else status.HTTP_201_CREATED
+        return Response(data={'created': importer.created, 'errors': importer.errors}, status=response_status)
+
+
 class BlogDetailAPIView(ViewSet):
     @swagger_auto_schema(
         operation_description="Get a specific blog",
         responses={200: BlogSerializer},
         tags=['Blogs'],
     )
+    @method_decorator(condition(etag_func=api_detail_etag, last_modified_func=detail_last_modified))
     def get(self, request, pk):
-        blog = get_blog_or_404(pk)
-        serializer = BlogSerializer(blog)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        return Response(data=api_detail(pk), status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
-        operation_description="Retrieve a specific blog",
-        request_body=BlogSerializer,
-        responses={200: BlogSerializer},
+        operation_description="Update a blog. Send the blog's ETag in `If-Match`, or the `version` it was "
+                              "read at, to have the update fail with 412 if someone changed it since.",
+        request_body=BlogUpdateSerializer,
+        responses={200: BlogSerializer, 412: "The blog was changed since"},
         tags=['Blogs'],
     )
     def put(self, request, pk):
         blog = get_blog_or_404(pk)
         if request.user != blog.author:
             return Response(data={"message": "You do not have permission to edit this blog."}, status=status.HTTP_403_FORBIDDEN)
-        
-        serializer = BlogSerializer(blog, data=request.data, partial=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+
+        data, response_status = edit_blog(blog, request.data, request.headers.get('If-Match'))
+        response = Response(data=data, status=response_status)
+        if response_status == status.HTTP_200_OK:
+            response['ETag'] = version_etag(pk, blog.version, cache.get_version(pk), 'api', request.accepted_renderer.format)
+        return response
 
     @swagger_auto_schema(
-        operation_description="Delete a blog post",
-        responses={204: "No Content"},
+        operation_description="Delete a blog post. Send the blog's ETag in `If-Match` to have the delete fail "
+                              "with 412 if someone changed it since.",
+        responses={204: "No Content", 412: "The blog was changed since"},
         tags=['Blogs'],
     )
     def delete(self, request, pk):
         blog = get_blog_or_404(pk)
         if request.user != blog.author:
             return Response(data={"message": "You do not have permission to delete this blog."}, status=status.HTTP_403_FORBIDDEN)
+        if is_stale(blog, request.headers.get('If-Match')):
+            return Response(data={"message": EDIT_CONFLICT_MESSAGE}, status=status.HTTP_412_PRECONDITION_FAILED)
 
         blog.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -153,52 +455,164 @@ class BlogDetailAPIView(ViewSet):
 
 # Django HTML Views
 # Views for Templates
+@method_decorator(condition(etag_func=html_list_etag), name='get')
 class BlogListView(ListView):
     model = Blog
     template_name = 'blog_list.html'
     context_object_name = 'blogs'
     permission_classes = [AllowAny]
+    paginator_class = CountedPaginator
+
+    def get_paginate_by(self, queryset):
+        return getattr(settings, 'BLOG_LIST_PAGE_SIZE', 20)
+
+    def get_filters(self):
+        """The tag, author and month filters of the request, ignoring invalid values."""
+        filters = {}
+        for name in ('tag', 'author'):
+            value = self.request.GET.get(name, '')
+            if value.isdigit():
+                filters[name] = int(value)
+        try:
+            filters['month'] = datetime.strptime(self.request.GET.get('month', ''), '%Y-%m').date()
+        except ValueError:
+            pass
+        return filters
 
     def get_queryset(self):
-        queryset = Blog.objects.all().annotate(published_month=TruncMonth('published_date')).order_by('-published_month', '-published_date')
+        self.filters = self.get_filters()
+        # Newest first is also month order, which lets the (published_date, id) index serve the page.
+        # The list shows no body, leave it in the database.
+        queryset = Blog.objects.with_related().defer('context', 'excerpt').annotate(published_month=TruncMonth('published_date')).order_by('-published_date', '-id')
 
         # Filter by tag
-        tag_id = self.request.GET.get('tag')
-        if tag_id:
-            queryset = queryset.filter(tags__id=tag_id)
+        if 'tag' in self.filters:
+            queryset = queryset.tagged(ids=[self.filters['tag']])
 
         # Filter by author
-        author_id = self.request.GET.get('author')
-        if author_id:
-            queryset = queryset.filter(author__id=author_id)
+        if 'author' in self.filters:
+            queryset = queryset.filter(author__id=self.filters['author'])
+
+        # Filter by month
+        if 'month' in self.filters:
+            month = self.filters['month']
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            queryset = filter_by_date(queryset, month, next_month - timedelta(days=1))
 
         return queryset
 
+    def get_count_queryset(self):
+        """
+        Precomputed counts adding up to the number of matching blogs, or None
+        when several filters are combined and they have to be counted.
+        """
+        if len(self.filters) > 1:
+            return None
+        if 'tag' in self.filters:
+            return TagFacet.objects.filter(tag_id=self.filters['tag'])
+        if 'author' in self.filters:
+            return AuthorFacet.objects.filter(author_id=self.filters['author'])
+        if 'month' in self.filters:
+            return MonthArchive.objects.filter(month=self.filters['month'])
+        return MonthArchive.objects.all()
+
+    def get_count(self):
+        counts = self.get_count_queryset()
+        if counts is None:
+            return None
+        return counts.aggregate(total=Sum('count'))['total'] or 0
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            count=self.get_count(), **kwargs,
+        )
+
+    def get_facets(self):
+        # Only tags and authors that have posts, with their post counts
+        return {
+            'tag_facets': TagFacet.objects.select_related('tag').order_by('tag__name'),
+            'author_facets': AuthorFacet.objects.select_related('author').order_by('author__last_name', 'author__first_name'),
+            'months': MonthArchive.objects.order_by('-month'),
+        }
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['tags'] = Tag.objects.all()  # List of all tags
-        context['authors'] = User.objects.all()
-        
+        context.update(self.get_facets())
+        blogs = context['blogs']
+        context['blog_groups'] = month_groups(blogs, cache.get_versions([blog.pk for blog in blogs]))
+        context['fragment_timeout'] = cache.get_timeout()
         return context
     
 
+@method_decorator(condition(etag_func=html_user_list_etag), name='get')
 class UserBlogListView(ListView):
     model = Blog
     template_name = 'user_blog_list.html'
     context_object_name = 'blogs'
     permission_classes = [IsAuthenticated]
+    paginator_class = CountedPaginator
+
+    def get_paginate_by(self, queryset):
+        return getattr(settings, 'BLOG_LIST_PAGE_SIZE', 20)
+
+    def get_month(self):
+        try:
+            return datetime.strptime(self.request.GET.get('month', ''), '%Y-%m').date()
+        except ValueError:
+            return None
 
     def get_queryset(self):
-        queryset = Blog.objects.filter(author=self.request.user).annotate(published_month=TruncMonth('published_date')).order_by('-published_month', '-published_date')
+        self.month = self.get_month()
+        self.stats = author_stats(self.request.user.pk)
+        # Newest first, a page at a time from the (author, published_date) index.
+        queryset = Blog.objects.filter(author_id=self.request.user.pk).with_related().defer('context', 'excerpt').annotate(published_month=TruncMonth('published_date')).order_by('-published_date', '-id')
+        if self.month:
+            next_month = (self.month + timedelta(days=32)).replace(day=1)
+            queryset = filter_by_date(queryset, self.month, next_month - timedelta(days=1))
         return queryset
-    
 
+    def get_count(self):
+        if self.month:
+            return next((facet.count for facet in self.stats['months'] if facet.month == self.month), 0)
+        return self.stats['count']
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+            count=self.get_count(), **kwargs,
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['stats'] = self.stats
+        blogs = context['blogs']
+        context['blog_groups'] = month_groups(blogs, cache.get_versions([blog.pk for blog in blogs]))
+        context['fragment_timeout'] = cache.get_timeout()
+        return context
+
+
+@method_decorator(condition(etag_func=html_detail_etag, last_modified_func=detail_last_modified), name='get')
 class BlogDetailView(DetailView):
     model = Blog
     template_name = 'blog_detail.html'
     context_object_name = 'blog'
     permission_classes = [AllowAny]
 
+    def get_queryset(self):
+        return Blog.objects.with_related()
+
+    def get(self, request, *args, **kwargs):
+        # Only anonymous pages are cached, signed-in users get forms with their CSRF token
+        if request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        def render_page():
+            return super(BlogDetailView, self).get(request, *args, **kwargs).render().content
+
+        return HttpResponse(cache.get_or_set(kwargs['pk'], 'html', render_page))
+
+
 class BlogCreateView(CreateView):
     model = Blog
     form_class = BlogForm
@@ -213,8 +627,9 @@ class BlogCreateView(CreateView):
 
     def form_valid(self, form):
         form.instance.author = self.request.user
-        response = super().form_valid(form)
-        self.object.tags.set(self.request.POST.getlist('tags'))
+        with transaction.atomic():
+            response = super().form_valid(form)
+            self.object.tags.set(self.request.POST.getlist('tags'))
         return response
 
 
@@ -225,11 +640,20 @@ class BlogUpdateView(UpdateView):
     success_url = reverse_lazy('blog-list')
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Blog.objects.with_related()
+
+    def get_object(self, queryset=None):
+        # dispatch() already loaded the blog for the permission check
+        if getattr(self, 'object', None) is None:
+            self.object = super().get_object(queryset)
+        return self.object
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         blog = self.object  # Get the current blog instance
         context['tags'] = Tag.objects.all()  # All available tags
-        context['selected_tags'] = blog.tags.values_list('id', flat=True)  # Currently selected tags
+        context['selected_tags'] = blog.tag_ids  # Currently selected tags
         return context
 
     def dispatch(self, request, *args, **kwargs):
@@ -239,9 +663,15 @@ class BlogUpdateView(UpdateView):
         return super().dispatch(request, *args, **kwargs)
 
     def form_valid(self, form):
-        response = super().form_valid(form)
-        self.object.tags.set(self.request.POST.getlist('tags'))
-        return response
+        # The form has already set the new values on the blog, write only what changed
+        fields = [name for name in form.changed_data if name not in ('tags', 'version')]
+        tags = form.cleaned_data['tags'] if 'tags' in form.changed_data else None
+        try:
+            update_blog(self.object, fields, tags, form.cleaned_data.get('version'))
+        except EditConflict:
+            form.add_error(None, EDIT_CONFLICT_MESSAGE)
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
 
 class BlogDeleteView(DeleteView):
@@ -275,4 +705,44 @@ def register(request):
         else:
             messages.error(request, 'Please correct the errors below.')
     
-    return render(request, 'registration/register.html', {'form': form})
\ No newline at end of file
+    return render(request, 'registration/register.html', {'form': form})
+
+
+def metrics_view(request):
+    """
+    Request metrics of this process in the Prometheus text format, for
+    scrapers at the ``BLOG_METRICS_ALLOWED_IPS`` and for staff users.
+    """
+    allowed_ips = getattr(settings, 'BLOG_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+GENERATED_CONTENT_TYPES = {
+    'rss': 'application/rss+xml; charset=utf-8',
+    'atom': 'application/atom+xml; charset=utf-8',
+    'xml': 'application/xml; charset=utf-8',
+}
+
+
+def generated_file(key, format):
+    path = feeds.get_file(key, format)
+    if path is None:
+        raise Http404("No such feed.")
+    return path
+
+
+def generated_file_etag(request, key, format):
+    stat = generated_file(key, format).stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def generated_file_last_modified(request, key, format):
+    return datetime.fromtimestamp(generated_file(key, format).stat().st_mtime, tz=timezone.utc)
+
+
+@condition(etag_func=generated_file_etag, last_modified_func=generated_file_last_modified)
+def generated_file_view(request, key, format):
+    """A feed or sitemap file of blog.feeds, see there."""
+    return FileResponse(generated_file(key, format).open('rb'), content_type=GENERATED_CONTENT_TYPES[format])
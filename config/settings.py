@@ -49,7 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.middleware.MetricsMiddleware',
+    'blog.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'blog.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -76,13 +80,76 @@ TEMPLATES = [
     },
 ]
 
+# Responses smaller than this are not worth compressing.
+BLOG_COMPRESSION_MIN_SIZE = 1024
+
+# Background tasks, see blog.tasks. Run `manage.py run_tasks` alongside the
+# server, or set BLOG_TASKS_EAGER to run them in process after each commit.
+BLOG_TASKS_EAGER = False
+BLOG_TASK_MAX_ATTEMPTS = 5
+BLOG_TASK_RETRY_DELAY = 10
+BLOG_TASK_LEASE_SECONDS = 300
+
+# Clients that may read GET /metrics besides staff users, by the address the
+# server sees, so a proxy in front of it must not forward public requests to it.
+BLOG_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Compile the blog templates at startup instead of on first use.
+BLOG_WARM_TEMPLATES = True
+# Paths `manage.py serve` requests in process before forking its workers.
+BLOG_WARMUP_URLS = ['/', '/api/blogs/', '/swagger.json']
+
 WSGI_APPLICATION = 'config.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Builds request.user from the token claims instead of loading the User row
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        # JSONRenderer, with orjson when it is installed
+        'blog.renderers.BlogJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        # Token buckets of BLOG_RATE_LIMITS
+        'blog.throttling.TokenBucketThrottle',
+    ],
+    # Anonymous clients are throttled per IP. X-Forwarded-For is only trusted
+    # from this many proxies in front of the server, set it to 1 behind nginx.
+    'NUM_PROXIES': 0,
+}
+
+# Requests per period by URL name, per user or, for anonymous requests, per
+# IP. A client can burst the whole amount, then gets the rest evenly spread.
+BLOG_RATE_LIMITS = {
+    'api-blogs': {'anon': '60/min', 'user': '600/min'},
+    'api-blogs-async': {'anon': '60/min', 'user': '600/min'},
 }
+# Keep token buckets in this process ('local') or share them through the
+# blog cache ('cache'), which needs a cache shared by all processes.
+BLOG_RATE_LIMIT_STORE = 'local'
+# Identical concurrent requests for a page of /api/blogs/ share one query.
+BLOG_COALESCE_LISTS = True
+
+# Cursor pagination and streaming for the blog list API
+BLOG_API_PAGE_SIZE = 20
+BLOG_API_MAX_PAGE_SIZE = 100
+BLOG_API_STREAM_CHUNK_SIZE = 500
+
+# Blogs written per transaction by POST /api/blogs/bulk/
+BLOG_BULK_BATCH_SIZE = 1000
+
+# Blogs per page of the HTML list
+BLOG_LIST_PAGE_SIZE = 20
+
+# Feeds and the sitemap are written to files here, see blog.feeds. Links in
+# them start with BLOG_SITE_URL, as they are built outside any request.
+BLOG_FEEDS_ROOT = BASE_DIR / 'feeds'
+BLOG_SITE_URL = 'http://localhost:8000'
+BLOG_FEED_SIZE = 20
+# Blog ids per sitemap page, the protocol allows at most 50,000 URLs a page.
+BLOG_SITEMAP_PAGE_SIZE = 10_000
 
 
 SIMPLE_JWT = {
@@ -90,8 +157,14 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_USER_CLASS': 'blog.authentication.BlogTokenUser',
+    'TOKEN_OBTAIN_SERIALIZER': 'blog.authentication.BlogTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'blog.authentication.BlogTokenRefreshSerializer',
 }
 
+# How often each process reloads the blacklisted refresh tokens from the database
+BLOG_JWT_BLACKLIST_SYNC_SECONDS = 60
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -108,13 +181,75 @@ SWAGGER_SETTINGS = {
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers carry on while a write
+# commits, and NORMAL only syncs at checkpoints in WAL mode, which is still
+# safe against corruption. Writers wait busy_timeout milliseconds for the lock.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,  # KiB
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections, and their page cache, across requests.
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Transactions stay DEFERRED, the ones that read and then write take
+            # the write lock up front with blog.utils.write_transaction().
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
     }
 }
 
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+
+# Read replicas of the blog and auth tables, alias to weight. Add the aliases
+# to DATABASES with 'TEST': {'MIRROR': 'default'}. SQLite copies of the
+# primary refreshed by `manage.py sync_replicas` can stand in for them locally.
+BLOG_DATABASE_REPLICAS = {}
+# How long a client reads from the primary after writing, to see its writes.
+BLOG_REPLICA_STICKY_SECONDS = 10
+# How often each process checks that a replica answers.
+BLOG_REPLICA_CHECK_SECONDS = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Room for a version and a list row fragment per blog, the default of 300 keeps evicting them.
+        'OPTIONS': {'MAX_ENTRIES': 100_000},
+    }
+}
+
+# Serialized blogs and rendered blog pages, invalidated whenever a blog changes
+BLOG_CACHE_ALIAS = 'default'
+BLOG_CACHE_TIMEOUT = 60 * 60
+
+# Requests slower than this are logged to blog.performance with their SQL, None disables it
+BLOG_SLOW_REQUEST_SECONDS = 1.0
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'blog.performance': {'handlers': ['console'], 'level': 'WARNING'},
+        'blog.server': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -2,9 +2,10 @@ from django.contrib import admin
 from django.urls import path, re_path, include
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from blog.schema import get_schema_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="Your Project API",
@@ -25,7 +26,7 @@ urlpatterns = [
     path('', include('django.contrib.auth.urls')),
 
     # Swagger
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(), name='schema-json'),
+    path('swagger/', schema_view.with_ui('swagger'), name='schema-swagger-ui'),
+    path('redoc/', schema_view.with_ui('redoc'), name='schema-redoc'),
 ]
\ No newline at end of file